@@ -1,4 +1,5 @@
 import os
+import re
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -12,6 +13,14 @@ class Config:
     
     # 向量数据库配置
     CHROMA_PERSIST_DIRECTORY = "./data/chroma_db"
+    # 逻辑知识库名 → 实际集合名的别名文件（蓝绿重建时原子切换）
+    COLLECTION_ALIAS_PATH = os.getenv("COLLECTION_ALIAS_PATH", "./data/chroma_db/collection_aliases.json")
+    # 蓝绿重建后除当前集合外保留的旧版本数（用于回滚）
+    COLLECTION_KEEP_GENERATIONS = int(os.getenv("COLLECTION_KEEP_GENERATIONS", "1"))
+    # 集合写入版本目录（各进程据此发现其他进程的写入，重建进程内的BM25/短语/元数据索引）
+    COLLECTION_VERSION_DIRECTORY = os.getenv("COLLECTION_VERSION_DIRECTORY", "./data/chroma_db/collection_versions")
+    # 向量快照目录（RETRIEVAL_BACKEND=memmap时各worker进程以内存映射方式共享）
+    VECTOR_SNAPSHOT_DIRECTORY = os.getenv("VECTOR_SNAPSHOT_DIRECTORY", "./data/vector_snapshots")
     # 注意：实际使用的是BigModel的embedding-2模型，下面的配置为遗留配置
     EMBEDDING_MODEL = "paraphrase-MiniLM-L6-v2"  # 已弃用，保留作为备选
     
@@ -20,6 +29,52 @@ class Config:
     bigmodel_base_url = os.getenv("BIGMODEL_BASE_URL", "https://open.bigmodel.cn/api/paas/v4")
     bigmodel_embedding_model = os.getenv("BIGMODEL_MODEL", "embedding-2")
     
+    # Embedding后端: bigmodel（智谱API）或 local（本地哈希n-gram向量，离线压测/基准测试用）
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "bigmodel").lower()
+    
+    # 本地哈希向量配置
+    LOCAL_EMBEDDING_CONFIG = {
+        "dimension": int(os.getenv("LOCAL_EMBEDDING_DIMENSION", "1024")),  # 与embedding-2保持一致
+        "ngram_range": (1, 3)  # 字符n-gram长度范围
+    }
+    
+    # Embedding批量请求配置
+    EMBEDDING_CONFIG = {
+        "batch_size": int(os.getenv("EMBEDDING_BATCH_SIZE", "32")),  # 单次请求最多文本数（接口输入数组长度上限）
+        "max_batch_tokens": int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "8000")),  # 单次请求token上限，按token数打包批次
+        "max_input_tokens": int(os.getenv("EMBEDDING_MAX_INPUT_TOKENS", "3072")),  # 单条文本token上限，超出截断
+        "max_concurrency": int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4")),  # 异步请求最大并发数
+        "timeout": 30,
+        "pool_size": int(os.getenv("EMBEDDING_POOL_SIZE", "10")),  # keep-alive连接池大小
+        "max_retries": int(os.getenv("EMBEDDING_MAX_RETRIES", "5")),  # 429/5xx最大重试次数
+        "backoff_base": 0.5,  # 指数退避初始等待（秒）
+        "backoff_max": 30,  # 单次退避最长等待（秒）
+        "rate_limit_per_second": float(os.getenv("EMBEDDING_RATE_LIMIT", "10")),  # 按API配额设置的每秒请求数
+        "rate_limit_burst": int(os.getenv("EMBEDDING_RATE_BURST", "10"))  # 允许的突发请求数
+    }
+    
+    # 持久化向量缓存配置（服务与构建脚本共享，按sha256(模型名 + 文本)寻址）
+    EMBEDDING_CACHE_CONFIG = {
+        "enabled": os.getenv("EMBEDDING_CACHE_ENABLED", "True").lower() == "true",
+        "path": os.getenv("EMBEDDING_CACHE_PATH", "./data/embedding_cache/embeddings.sqlite3"),
+        "max_entries": int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))  # 超出后按LRU淘汰
+    }
+    
+    # 查询向量进程内缓存配置（LRU + TTL）
+    QUERY_CACHE_CONFIG = {
+        "enabled": os.getenv("QUERY_CACHE_ENABLED", "True").lower() == "true",
+        "max_entries": int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1024")),
+        "ttl_seconds": int(os.getenv("QUERY_CACHE_TTL_SECONDS", "600"))
+    }
+    
+    # 查询向量微批调度配置：合并时间窗口内并发到达的查询为一次API调用
+    MICRO_BATCH_CONFIG = {
+        "enabled": os.getenv("MICRO_BATCH_ENABLED", "True").lower() == "true",
+        "max_wait_ms": float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "5")),
+        "max_batch_size": int(os.getenv("MICRO_BATCH_MAX_SIZE", "32")),
+        "max_concurrency": int(os.getenv("MICRO_BATCH_MAX_CONCURRENCY", "4"))  # 同时在途的批次数
+    }
+    
     # MySQL配置 - 从环境变量读取
     MYSQL_HOST = os.getenv("MYSQL_HOST", "")
     MYSQL_PORT = int(os.getenv("MYSQL_PORT", "3306"))
@@ -62,6 +117,7 @@ class Config:
     
     # DeepSeek模型特定配置
     MAX_TOKENS = 2000
+    CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "6000"))  # 提示词中检索文档内容的token预算
     TEMPERATURE = 0.1
     TOP_P = 0.9
     
@@ -98,7 +154,21 @@ class Config:
     DOCUMENT_CONFIG = {
         "chunk_size": 1000,
         "chunk_overlap": 200,
-        "max_chunks_per_document": 50
+        "max_chunks_per_document": 50,
+        "chunk_unit": os.getenv("CHUNK_UNIT", "char").lower(),  # char（按字符数）或 token（按token数）
+        "chunk_tokens": int(os.getenv("CHUNK_TOKENS", "512")),  # 按token分块时每块的token数
+        "chunk_overlap_tokens": int(os.getenv("CHUNK_OVERLAP_TOKENS", "64")),
+        # 父子块检索：入库按较小的子块建索引，检索命中后合并相邻子块返回所在的父段落
+        "parent_child": os.getenv("PARENT_CHILD_RETRIEVAL", "false").lower() == "true",
+        "child_chunk_size": int(os.getenv("CHILD_CHUNK_SIZE", "300")),
+        "child_chunk_overlap": int(os.getenv("CHILD_CHUNK_OVERLAP", "50")),
+        "child_chunk_tokens": int(os.getenv("CHILD_CHUNK_TOKENS", "160")),  # 按token分块时子块的token数
+        "child_chunk_overlap_tokens": int(os.getenv("CHILD_CHUNK_OVERLAP_TOKENS", "24")),
+        # 按集合覆盖分块方式：逻辑知识库名 → 覆盖的配置项（如 {"standards": {"chunk_unit": "token"}}）
+        "collection_chunking": {
+            name.strip(): {"chunk_unit": "token"}
+            for name in os.getenv("TOKEN_CHUNK_COLLECTIONS", "").split(",") if name.strip()
+        }
     }
     
     # 检索配置详细设置
@@ -106,7 +176,28 @@ class Config:
         "similarity_threshold": SIMILARITY_THRESHOLD,
         "max_results": MAX_RETRIEVAL_RESULTS,
         "rerank_top_k": 3,
-        "include_metadata": True
+        "include_metadata": True,
+        "fanout_workers": int(os.getenv("RETRIEVAL_FANOUT_WORKERS", "4")),  # 多集合并行检索线程数
+        "backend": os.getenv("RETRIEVAL_BACKEND", "chroma").lower(),  # chroma（HNSW）、numpy（内存精确检索）或 memmap（共享内存映射快照）
+        "hybrid": os.getenv("RETRIEVAL_HYBRID", "true").lower() == "true",  # 向量检索 + BM25词法检索，RRF融合
+        "rrf_k": 60,  # RRF平滑常数
+        "bm25_k1": 1.5,
+        "bm25_b": 0.75,
+        # HNSW索引参数：space/M/construction_ef仅在新建集合时生效，search_ef启动时同步到已有集合
+        "hnsw": {
+            "space": os.getenv("HNSW_SPACE", "cosine").lower(),  # cosine、l2 或 ip
+            "M": int(os.getenv("HNSW_M", "16")),
+            "construction_ef": int(os.getenv("HNSW_CONSTRUCTION_EF", "100")),
+            "search_ef": int(os.getenv("HNSW_SEARCH_EF", "100"))
+        },
+        # 近重复折叠的SimHash汉明半径（64位指纹；≈80%以上内容重合的文档块距离在6以内）
+        "near_duplicate_distance": int(os.getenv("NEAR_DUPLICATE_DISTANCE", "6")),
+        # 父子块检索：命中子块前后各取的相邻子块数，以及合并后父段落最多包含的子块数
+        "parent_window": int(os.getenv("PARENT_WINDOW", "2")),
+        "parent_max_chunks": int(os.getenv("PARENT_MAX_CHUNKS", "8")),
+        # 建立元数据索引的字段（过滤检索使用）
+        "metadata_index_fields": ["source_file", "project_name", "drawing_type", "drawing_phase",
+                                  "document_type", "standard_number", "drawing_id"]
     }
     
     # 工程领域配置
@@ -143,6 +234,7 @@ class Config:
         "base_url": OPENAI_BASE_URL,
         "model": MODEL_NAME,
         "max_tokens": MAX_TOKENS,
+        "context_max_tokens": CONTEXT_MAX_TOKENS,
         "temperature": TEMPERATURE,
         "top_p": TOP_P,
         "stream": False,
@@ -155,6 +247,20 @@ class Config:
         """获取DeepSeek配置"""
         return cls.DEEPSEEK_CONFIG
     
+    @classmethod
+    def get_chunking_config(cls, collection_name: str = None):
+        """获取集合的分块配置（蓝绿重建的版本集合如standards__v3按逻辑名standards查找）"""
+        config = {
+            key: cls.DOCUMENT_CONFIG[key]
+            for key in ("chunk_unit", "chunk_size", "chunk_overlap", "chunk_tokens", "chunk_overlap_tokens",
+                        "parent_child", "child_chunk_size", "child_chunk_overlap",
+                        "child_chunk_tokens", "child_chunk_overlap_tokens")
+        }
+        if collection_name:
+            logical_name = re.sub(r"__v\d+$", "", collection_name)
+            config.update(cls.DOCUMENT_CONFIG["collection_chunking"].get(logical_name, {}))
+        return config
+    
     @classmethod
     def get_mysql_config(cls):
         """获取MySQL配置"""
@@ -189,7 +295,7 @@ class Config:
         if not cls.OPENAI_API_KEY:
             missing_configs.append("DEEPSEEK_API_KEY")
         
-        if not cls.bigmodel_api_key:
+        if cls.EMBEDDING_BACKEND == "bigmodel" and not cls.bigmodel_api_key:
             missing_configs.append("BIGMODEL_API_KEY")
         
         if not cls.MYSQL_PASSWORD:
@@ -203,7 +309,10 @@ class Config:
         print("✅ 配置验证通过")
         print(f"   DeepSeek API: {cls.OPENAI_BASE_URL}")
         print(f"   模型: {cls.MODEL_NAME}")
-        print(f"   BigModel API: {cls.bigmodel_base_url}")
+        if cls.EMBEDDING_BACKEND == "bigmodel":
+            print(f"   BigModel API: {cls.bigmodel_base_url}")
+        else:
+            print(f"   Embedding后端: {cls.EMBEDDING_BACKEND}")
         print(f"   MySQL: {cls.MYSQL_HOST}:{cls.MYSQL_PORT}")
         
         return True 
\ No newline at end of file
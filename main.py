@@ -3,6 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, FileResponse
 from datetime import datetime
+import asyncio
 import uuid
 import logging
 import os
@@ -11,7 +12,7 @@ from typing import List, Optional, Dict
 
 from core.config import Config
 from core.models import QuestionRequest, AnswerResponse, KnowledgeDocument, SystemStatus  
-from services.bigmodel_knowledge_base import BigModelKnowledgeBase as KnowledgeBaseManager
+from services.knowledge_base_registry import get_knowledge_base_registry
 from services.llm_service import LLMService, enhance_engineering_question
 from services.mysql_standards_service import get_mysql_standards_service
 from services.drawing_upload_service import get_drawing_service
@@ -53,13 +54,21 @@ KNOWLEDGE_BASES = {
 # 默认使用standards集合（国家标准库）
 DEFAULT_COLLECTION = "standards"
 
-# 使用BigModel知识库，指定standards集合
-kb_manager = KnowledgeBaseManager(
-    api_key=config.bigmodel_api_key,
-    collection_name=DEFAULT_COLLECTION
-)
+# 知识库注册表：全进程共享一个ChromaDB客户端，按集合名缓存知识库管理器
+kb_registry = get_knowledge_base_registry()
+
 llm_service = LLMService()
 
+
+def get_current_kb():
+    """
+    获取当前知识库的管理器
+    
+    每次请求都按别名重新解析，蓝绿重建切换别名后立即使用新版本集合
+    """
+    return kb_registry.get(DEFAULT_COLLECTION)
+
+
 # 初始化MySQL标准服务
 try:
     standards_service = get_mysql_standards_service()
@@ -308,9 +317,13 @@ async def startup_event():
     """应用启动时的初始化"""
     logger.info("工程监理智能问答系统启动中...")
     
+    # 预加载所有知识库集合，避免首次请求时创建
+    loaded = kb_registry.preload(KNOWLEDGE_BASES.keys())
+    logger.info(f"📚 已预加载知识库: {', '.join(loaded)}")
+    
     # 显示当前知识库信息
     try:
-        info = kb_manager.get_collection_info()
+        info = get_current_kb().get_collection_info()
         logger.info(f"📚 当前知识库: {KNOWLEDGE_BASES[DEFAULT_COLLECTION]} ({DEFAULT_COLLECTION})")
         logger.info(f"📊 文档数量: {info.get('count', 0)} 个")
         logger.info(f"🤖 向量模型: {info.get('embedding_model', 'unknown')}")
@@ -347,73 +360,24 @@ async def ask_question(request: QuestionRequest):
         if is_greeting_or_casual(request.question):
             return llm_service.generate_answer_without_context(request.question)
         
-        # 初始化所有知识库管理器
-        standards_kb_manager = KnowledgeBaseManager(
-            api_key=config.bigmodel_api_key,
-            collection_name="standards"
-        )
-        regulations_kb_manager = KnowledgeBaseManager(
-            api_key=config.bigmodel_api_key,
-            collection_name="regulations"
-        )
-        
         # 步骤1: 直接使用用户问题检索知识库（不添加额外内容）
         user_question = request.question
         
-        # 步骤2: 检索所有知识库
-        all_results = []
-        seen_content = set()  # 避免重复内容
-        
-        logger.info("🔍 开始检索所有知识库...")
-        
-        # 搜索国家标准库
-        logger.info(f"📊 搜索standards库: {user_question}")
-        standards_result = standards_kb_manager.search(user_question, n_results=config.MAX_RETRIEVAL_RESULTS)
-        
-        if standards_result and "results" in standards_result:
-            for result in standards_result["results"]:
-                content_hash = hash(result['content'][:100])
-                if content_hash not in seen_content:
-                    seen_content.add(content_hash)
-                    result['source_type'] = 'standards'
-                    all_results.append(result)
-        
-        # 搜索法规库
-        logger.info(f"🏛️ 搜索regulations库: {user_question}")
-        regulations_result = regulations_kb_manager.search(user_question, n_results=config.MAX_RETRIEVAL_RESULTS)
-        
-        if regulations_result and "results" in regulations_result:
-            for result in regulations_result["results"]:
-                content_hash = hash(result['content'][:100])
-                if content_hash not in seen_content:
-                    seen_content.add(content_hash)
-                    result['source_type'] = 'regulations'
-                    all_results.append(result)
-        
-        # 搜索图纸知识库
+        # 步骤2: 检索所有知识库（查询向量只计算一次，各集合并行查询后按相似度归并）
+        search_collections = ["standards", "regulations"]
         if drawing_service and drawing_service.drawings_kb:
-            try:
-                logger.info(f"📋 搜索drawings库: {user_question}")
-                drawings_result = drawing_service.drawings_kb.search(user_question, n_results=config.MAX_RETRIEVAL_RESULTS)
-                
-                if drawings_result and "results" in drawings_result:
-                    for result in drawings_result["results"]:
-                        content_hash = hash(result['content'][:100])
-                        if content_hash not in seen_content:
-                            seen_content.add(content_hash)
-                            result['source_type'] = 'drawings'
-                            all_results.append(result)
-            except Exception as e:
-                logger.warning(f"图纸知识库搜索失败: {e}")
-        
-        # 按相似度排序并取前N个结果
-        all_results.sort(key=lambda x: x.get('similarity', 0), reverse=True)
-        final_results = all_results[:config.MAX_RETRIEVAL_RESULTS * 2]
-        
-        # 包装为标准格式
-        sources_result = {"results": final_results}
+            search_collections.append("drawings")
+        
+        logger.info(f"🔍 开始检索知识库 {search_collections}: {user_question}")
+        sources_result = await kb_registry.search_many_async(
+            user_question,
+            search_collections,
+            n_results=config.MAX_RETRIEVAL_RESULTS,
+            top_k=config.MAX_RETRIEVAL_RESULTS * 2,
+            similarity_threshold=config.SIMILARITY_THRESHOLD
+        )
         
-        # 处理搜索结果并应用相似度阈值过滤
+        # 处理搜索结果（阈值已在归并前按集合过滤，这里再次检查）
         sources = []
         if sources_result and "results" in sources_result:
             for result in sources_result["results"]:
@@ -445,8 +409,9 @@ async def ask_question(request: QuestionRequest):
         session_id = request.session_id or "default"
         history = session_history.get(session_id, [])
         
-        # 步骤3: 大模型生成答案
-        response = llm_service.generate_answer(
+        # 步骤3: 大模型生成答案（在线程池中执行，相同的并发问题共享一次调用）
+        response = await asyncio.to_thread(
+            llm_service.generate_answer,
             question=request.question,
             sources=sources,
             context_history=history
@@ -718,7 +683,7 @@ async def upload_document(
         )
         
         # 添加到知识库
-        success = kb_manager.add_document(document)
+        success = get_current_kb().add_document(document)
         
         if success:
             return {"message": "文档上传成功", "document_id": document.id}
@@ -742,6 +707,7 @@ async def upload_documents_batch(
         
         results = []
         total_chunks = 0
+        kb_manager = get_current_kb()
         
         for file in files:
             # 检查文件类型
@@ -826,6 +792,7 @@ async def add_text_to_knowledge_base(
             raise HTTPException(status_code=400, detail="单次添加的文本长度不能超过50000字符")
         
         # 分割文档
+        kb_manager = get_current_kb()
         chunks = kb_manager.split_document(text_content, chunk_size, chunk_overlap)
         
         # 准备元数据
@@ -867,6 +834,7 @@ async def remove_documents_by_source(
     try:
         # 这个功能需要在BigModelKnowledgeBase中实现
         # 目前ChromaDB支持根据metadata过滤删除
+        kb_manager = get_current_kb()
         removed_count = kb_manager.remove_documents_by_source(source_file)
         
         kb_stats = kb_manager.get_knowledge_base_stats()
@@ -885,7 +853,7 @@ async def remove_documents_by_source(
 async def get_system_status():
     """获取系统状态"""
     try:
-        stats = kb_manager.get_knowledge_base_stats()
+        stats = get_current_kb().get_knowledge_base_stats()
         
         return SystemStatus(
             status="正常运行",
@@ -902,7 +870,7 @@ async def get_system_status():
 async def search_knowledge_base(query: str, top_k: int = 5):
     """搜索当前知识库"""
     try:
-        sources_result = kb_manager.search(query, n_results=top_k)
+        sources_result = await get_current_kb().search_async(query, n_results=top_k)
         
         results = []
         if sources_result and "results" in sources_result:
@@ -926,6 +894,30 @@ async def search_knowledge_base(query: str, top_k: int = 5):
         logger.error(f"知识库搜索失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/grep")
+async def grep_knowledge_bases(q: str, collections: str = "standards,regulations,drawings",
+                               limit: int = 50, context: int = 30):
+    """精确短语检索：返回包含该短语的文档块及高亮位置（基于n-gram倒排索引）"""
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="查询短语不能为空")
+    
+    try:
+        names = [name.strip() for name in collections.split(",") if name.strip() in KNOWLEDGE_BASES]
+        if not names:
+            raise HTTPException(status_code=400, detail=f"可用的知识库: {list(KNOWLEDGE_BASES.keys())}")
+        
+        start_time = datetime.now()
+        result = await asyncio.to_thread(kb_registry.grep_many, q, names, limit, context)
+        result["collections"] = names
+        result["elapsed_ms"] = round((datetime.now() - start_time).total_seconds() * 1000, 2)
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"短语检索失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/knowledge-bases")
 async def get_knowledge_bases():
     """获取可用的知识库列表"""
@@ -934,14 +926,11 @@ async def get_knowledge_bases():
         kb_status = {}
         for kb_id, kb_name in KNOWLEDGE_BASES.items():
             try:
-                # 临时创建知识库管理器检查状态
-                temp_kb = KnowledgeBaseManager(
-                    api_key=config.bigmodel_api_key,
-                    collection_name=kb_id
-                )
-                info = temp_kb.get_collection_info()
+                # 从注册表获取知识库管理器检查状态
+                info = kb_registry.get(kb_id).get_collection_info()
                 kb_status[kb_id] = {
                     "name": kb_name,
+                    "collection": info.get('name', kb_id),
                     "status": "available",
                     "document_count": info.get('count', 0),
                     "is_current": kb_id == DEFAULT_COLLECTION
@@ -967,7 +956,7 @@ async def get_knowledge_bases():
 @app.post("/switch-knowledge-base")
 async def switch_knowledge_base(request: dict):
     """切换知识库"""
-    global kb_manager, DEFAULT_COLLECTION
+    global DEFAULT_COLLECTION
     
     # 处理请求参数
     if isinstance(request, str):
@@ -982,17 +971,13 @@ async def switch_knowledge_base(request: dict):
         )
     
     try:
-        # 创建新的知识库管理器
-        new_kb_manager = KnowledgeBaseManager(
-            api_key=config.bigmodel_api_key,
-            collection_name=collection_name
-        )
+        # 从注册表获取知识库管理器
+        new_kb_manager = kb_registry.get(collection_name)
         
         # 测试新知识库是否可用
         info = new_kb_manager.get_collection_info()
         
         # 切换成功
-        kb_manager = new_kb_manager
         DEFAULT_COLLECTION = collection_name
         
         logger.info(f"成功切换到知识库: {collection_name} ({KNOWLEDGE_BASES[collection_name]})")
@@ -3,14 +3,60 @@ BigModel Embedding Service
 使用智谱AI的embedding-2模型进行文本向量化
 """
 
+import asyncio
+import random
+import threading
+import time
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import numpy as np
-from typing import List, Union
+from typing import List, Union, Optional, Dict, Any, Tuple
 import os
 from core.config import Config
+from services.embedding_backend import EmbeddingBackend
+from services.embedding_cache import get_embedding_cache
+from services.rate_limiter import TokenBucketRateLimiter
+from services.single_flight import SingleFlight
+from services.token_utils import count_tokens_batch, truncate_to_tokens
 
-class BigModelEmbedding:
+# 需要退避重试的HTTP状态码
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# 进程内共享的HTTP连接池和限流器
+_shared_session = None
+_shared_rate_limiter = None
+_shared_lock = threading.Lock()
+
+# 合并并发的相同向量化请求
+_embedding_flight = SingleFlight()
+
+def get_shared_session() -> requests.Session:
+    """获取进程内共享的keep-alive连接池会话"""
+    global _shared_session
+    with _shared_lock:
+        if _shared_session is None:
+            pool_size = Config.EMBEDDING_CONFIG["pool_size"]
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _shared_session = session
+    return _shared_session
+
+def get_shared_rate_limiter() -> TokenBucketRateLimiter:
+    """获取进程内共享的BigModel API限流器"""
+    global _shared_rate_limiter
+    with _shared_lock:
+        if _shared_rate_limiter is None:
+            _shared_rate_limiter = TokenBucketRateLimiter(
+                rate_per_second=Config.EMBEDDING_CONFIG["rate_limit_per_second"],
+                capacity=Config.EMBEDDING_CONFIG["rate_limit_burst"]
+            )
+    return _shared_rate_limiter
+
+class BigModelEmbedding(EmbeddingBackend):
     """BigModel embedding-2模型服务"""
     
     def __init__(self, api_key: str = None):
@@ -23,6 +69,16 @@ class BigModelEmbedding:
         self.api_key = api_key or Config.bigmodel_api_key
         self.base_url = Config.bigmodel_base_url
         self.model = Config.bigmodel_embedding_model
+        self.embedding_config = Config.EMBEDDING_CONFIG
+        
+        # 持久化向量缓存（未启用时为None）
+        self.cache = get_embedding_cache()
+        
+        # 共享连接池和限流器
+        self.session = get_shared_session()
+        self.rate_limiter = get_shared_rate_limiter()
+        self._async_client = None
+        self._async_client_loop = None
         
         if not self.api_key:
             raise ValueError("请设置BigModel API密钥")
@@ -40,50 +96,219 @@ class BigModelEmbedding:
         """
         将文本编码为向量
         
+        先查询持久化缓存，未命中的文本按token数分批，
+        每批通过一次API请求获取向量，结果按输入顺序写入float32数组。
+        
         Args:
             texts: 单个文本或文本列表
             
         Returns:
-            向量数组
+            形状为(文本数, 维度)的float32向量数组
         """
         if isinstance(texts, str):
             texts = [texts]
         
-        embeddings = []
+        embeddings, missing_texts = self._lookup_cache(texts)
         
-        for text in texts:
-            embedding = self._get_embedding(text)
-            embeddings.append(embedding)
+        fetched = None
+        if missing_texts:
+            # 相同文本的并发请求只调用一次API
+            fetched = _embedding_flight.do(
+                (self.model, tuple(missing_texts)), self._fetch_embeddings, missing_texts
+            )
         
-        return np.array(embeddings)
+        return self._assemble(texts, embeddings, fetched_texts=missing_texts, fetched=fetched)
     
-    def _get_embedding(self, text: str) -> List[float]:
+    def _fetch_embeddings(self, texts: List[str]) -> np.ndarray:
         """
-        获取单个文本的向量表示
+        分批请求API获取向量，并写入持久化缓存
         
         Args:
-            text: 输入文本
+            texts: 需要请求的文本（已去重）
+            
+        Returns:
+            与输入顺序一致的float32向量数组
+        """
+        fetched = self._concat_batches(
+            [self._get_embeddings_batch(batch) for batch in self._iter_batches(texts)]
+        )
+        
+        if self.cache is not None:
+            self.cache.put_many(self.model, texts, fetched)
+        return fetched
+    
+    def _lookup_cache(self, texts: List[str]) -> Tuple[List[Optional[Any]], List[str]]:
+        """
+        从缓存中查找向量
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            (与输入顺序一致的向量列表，未命中位置为None；去重后的未命中文本列表)
+        """
+        if self.cache is not None:
+            embeddings = self.cache.get_many(self.model, texts)
+        else:
+            embeddings = [None] * len(texts)
+        
+        # 去重，同一文本只请求一次
+        missing_texts = list(dict.fromkeys(
+            text for text, embedding in zip(texts, embeddings) if embedding is None
+        ))
+        return embeddings, missing_texts
+    
+    def _assemble(self, texts: List[str], embeddings: List[Optional[np.ndarray]],
+                  fetched_texts: List[str], fetched: Optional[np.ndarray]) -> np.ndarray:
+        """
+        将缓存命中的向量和新获取的向量按输入顺序写入预分配的float32数组
+        
+        Args:
+            texts: 原始文本列表
+            embeddings: 缓存查询结果，未命中位置为None
+            fetched_texts: 新请求的文本
+            fetched: 与fetched_texts逐行对应的新向量
+            
+        Returns:
+            形状为(文本数, 维度)的float32向量数组
+        """
+        if fetched is not None and len(fetched):
+            dimension = fetched.shape[1]
+        else:
+            dimension = next((len(vector) for vector in embeddings if vector is not None),
+                             self.get_embedding_dimension())
+        
+        result = np.empty((len(texts), dimension), dtype=np.float32)
+        row_by_text = {text: row for row, text in enumerate(fetched_texts)} if fetched is not None else {}
+        for i, text in enumerate(texts):
+            vector = embeddings[i]
+            result[i] = vector if vector is not None else fetched[row_by_text[text]]
+        return result
+    
+    @staticmethod
+    def _concat_batches(batches: List[np.ndarray]) -> np.ndarray:
+        """将多个批次的向量拷贝到一个预分配的float32数组中"""
+        if len(batches) == 1:
+            return batches[0]
+        
+        total = sum(len(batch) for batch in batches)
+        result = np.empty((total, batches[0].shape[1]), dtype=np.float32)
+        offset = 0
+        for batch in batches:
+            result[offset:offset + len(batch)] = batch
+            offset += len(batch)
+        return result
+    
+    def get_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """获取持久化向量缓存统计，未启用缓存时返回None"""
+        if self.cache is None:
+            return None
+        return self.cache.get_stats()
+    
+    def _iter_batches(self, texts: List[str]):
+        """
+        按token数打包批次，使每次请求尽量接近单次请求的token上限
+        
+        超过单条输入token上限的文本会被截断并打印警告；
+        批次中的文本数同时受batch_size（接口单次最多输入条数）限制。
+        
+        Args:
+            texts: 文本列表
+            
+        Yields:
+            文本批次（顺序与输入一致）
+        """
+        batch_size = self.embedding_config["batch_size"]
+        max_batch_tokens = self.embedding_config["max_batch_tokens"]
+        max_input_tokens = min(self.embedding_config["max_input_tokens"], max_batch_tokens)
+        
+        batch = []
+        batch_tokens = 0
+        
+        for text, tokens in zip(texts, count_tokens_batch(texts)):
+            if tokens > max_input_tokens:
+                print(f"⚠️ 文本超过单条token上限({tokens} > {max_input_tokens})，已截断: {text[:30]}...")
+                text = truncate_to_tokens(text, max_input_tokens, token_count=tokens)
+                tokens = max_input_tokens
+            
+            if batch and (len(batch) >= batch_size or batch_tokens + tokens > max_batch_tokens):
+                yield batch
+                batch = []
+                batch_tokens = 0
+            batch.append(text)
+            batch_tokens += tokens
+        
+        if batch:
+            yield batch
+    
+    def _get_embeddings_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        一次请求获取一批文本的向量表示
+        
+        请求体过大被拒绝时，将批次一分为二后重试。
+        
+        Args:
+            texts: 文本批次
             
         Returns:
-            向量列表
+            与输入顺序一致的float32向量数组
+        """
+        try:
+            return self._request_embeddings(texts)
+        except requests.exceptions.HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else None
+            if status_code in (400, 413) and len(texts) > 1:
+                middle = len(texts) // 2
+                print(f"⚠️ 批量请求被拒绝({status_code})，拆分为 {middle} + {len(texts) - middle} 个文本重试")
+                return self._concat_batches([
+                    self._get_embeddings_batch(texts[:middle]),
+                    self._get_embeddings_batch(texts[middle:])
+                ])
+            raise
+    
+    def _request_embeddings(self, texts: List[str]) -> np.ndarray:
+        """
+        调用/embeddings接口，input为文本列表
+        
+        Args:
+            texts: 文本批次
+            
+        Returns:
+            与输入顺序一致的float32向量数组
         """
         url = f"{self.base_url}/embeddings"
         
         data = {
             "model": self.model,
-            "input": text
+            "input": texts
         }
         
+        max_retries = self.embedding_config["max_retries"]
+        
         try:
-            response = requests.post(url, headers=self.headers, json=data, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
-            
-            if 'data' in result and len(result['data']) > 0:
-                return result['data'][0]['embedding']
-            else:
-                raise ValueError(f"API返回格式错误: {result}")
+            for attempt in range(max_retries + 1):
+                self.rate_limiter.acquire()
+                
+                try:
+                    response = self.session.post(url, headers=self.headers, json=data,
+                                                 timeout=self.embedding_config["timeout"])
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    if attempt >= max_retries:
+                        raise
+                    delay = self._retry_delay(attempt)
+                    print(f"⚠️ BigModel API连接失败({e})，{delay:.1f}秒后第{attempt + 1}次重试")
+                    time.sleep(delay)
+                    continue
+                
+                if response.status_code in RETRY_STATUS_CODES and attempt < max_retries:
+                    delay = self._retry_delay(attempt, response.headers.get("Retry-After"))
+                    print(f"⚠️ BigModel API返回{response.status_code}，{delay:.1f}秒后第{attempt + 1}次重试")
+                    time.sleep(delay)
+                    continue
+                
+                response.raise_for_status()
+                
+                return self._parse_embeddings_response(response.json(), len(texts))
                 
         except requests.exceptions.RequestException as e:
             print(f"❌ BigModel API请求失败: {e}")
@@ -92,6 +317,202 @@ class BigModelEmbedding:
             print(f"❌ 处理响应时出错: {e}")
             raise
     
+    def _retry_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """
+        计算重试等待时间：指数退避 + 随机抖动，优先遵循Retry-After响应头
+        
+        Args:
+            attempt: 已重试次数（从0开始）
+            retry_after: Retry-After响应头的值
+            
+        Returns:
+            等待秒数
+        """
+        if retry_after:
+            try:
+                return min(float(retry_after), self.embedding_config["backoff_max"])
+            except ValueError:
+                pass
+        
+        backoff = min(self.embedding_config["backoff_max"],
+                      self.embedding_config["backoff_base"] * (2 ** attempt))
+        return random.uniform(backoff / 2, backoff)
+    
+    @staticmethod
+    def _parse_embeddings_response(result: dict, expected_count: int) -> np.ndarray:
+        """
+        解析/embeddings接口响应，直接写入预分配的float32数组
+        
+        Args:
+            result: 响应JSON
+            expected_count: 期望的向量数量
+            
+        Returns:
+            按index还原输入顺序的float32向量数组
+        """
+        items = result.get('data') or []
+        if len(items) != expected_count:
+            raise ValueError(f"API返回向量数量不匹配: 期望 {expected_count} 个，实际 {len(items)} 个")
+        
+        embeddings = np.empty((expected_count, len(items[0]['embedding'])), dtype=np.float32)
+        for position, item in enumerate(items):
+            # 按index字段还原输入顺序
+            embeddings[item.get('index', position)] = item['embedding']
+        return embeddings
+    
+    async def encode_async(self, texts: Union[str, List[str]]) -> np.ndarray:
+        """
+        异步将文本编码为向量，不阻塞事件循环
+        
+        缓存未命中的文本分批并发请求，同时在途的请求数受max_concurrency限制，
+        结果按输入顺序重新组装。
+        
+        Args:
+            texts: 单个文本或文本列表
+            
+        Returns:
+            形状为(文本数, 维度)的float32向量数组
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        
+        embeddings, missing_texts = await asyncio.to_thread(self._lookup_cache, texts)
+        
+        fetched = None
+        if missing_texts:
+            # 相同文本的并发请求只调用一次API
+            fetched = await _embedding_flight.do_async(
+                (self.model, tuple(missing_texts)), self._fetch_embeddings_async, missing_texts
+            )
+        
+        return self._assemble(texts, embeddings, fetched_texts=missing_texts, fetched=fetched)
+    
+    async def _fetch_embeddings_async(self, texts: List[str]) -> np.ndarray:
+        """
+        分批并发请求API获取向量，并写入持久化缓存
+        
+        Args:
+            texts: 需要请求的文本（已去重）
+            
+        Returns:
+            与输入顺序一致的float32向量数组
+        """
+        # token计数和截断是CPU密集的同步操作，放到线程池中打包批次，避免大批量上传阻塞事件循环
+        batches = await asyncio.to_thread(lambda: list(self._iter_batches(texts)))
+        semaphore = asyncio.Semaphore(self.embedding_config["max_concurrency"])
+        client = self._get_async_client()
+        
+        async def run_batch(batch: List[str]) -> np.ndarray:
+            async with semaphore:
+                return await self._get_embeddings_batch_async(client, batch)
+        
+        results = await asyncio.gather(*(run_batch(batch) for batch in batches))
+        fetched = self._concat_batches(list(results))
+        
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put_many, self.model, texts, fetched)
+        return fetched
+    
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """获取绑定当前事件循环的keep-alive异步客户端"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client.is_closed or self._async_client_loop is not loop:
+            pool_size = self.embedding_config["pool_size"]
+            self._async_client = httpx.AsyncClient(
+                timeout=self.embedding_config["timeout"],
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+            )
+            self._async_client_loop = loop
+        return self._async_client
+    
+    async def _get_embeddings_batch_async(self, client: httpx.AsyncClient, texts: List[str]) -> np.ndarray:
+        """
+        异步获取一批文本的向量表示，请求体过大时拆分重试
+        
+        Args:
+            client: 异步HTTP客户端
+            texts: 文本批次
+            
+        Returns:
+            与输入顺序一致的float32向量数组
+        """
+        try:
+            return await self._request_embeddings_async(client, texts)
+        except httpx.HTTPStatusError as e:
+            status_code = e.response.status_code
+            if status_code in (400, 413) and len(texts) > 1:
+                middle = len(texts) // 2
+                print(f"⚠️ 批量请求被拒绝({status_code})，拆分为 {middle} + {len(texts) - middle} 个文本重试")
+                first, second = await asyncio.gather(
+                    self._get_embeddings_batch_async(client, texts[:middle]),
+                    self._get_embeddings_batch_async(client, texts[middle:])
+                )
+                return self._concat_batches([first, second])
+            raise
+    
+    async def _request_embeddings_async(self, client: httpx.AsyncClient, texts: List[str]) -> np.ndarray:
+        """
+        异步调用/embeddings接口
+        
+        Args:
+            client: 异步HTTP客户端
+            texts: 文本批次
+            
+        Returns:
+            与输入顺序一致的float32向量数组
+        """
+        url = f"{self.base_url}/embeddings"
+        
+        data = {
+            "model": self.model,
+            "input": texts
+        }
+        
+        max_retries = self.embedding_config["max_retries"]
+        
+        try:
+            for attempt in range(max_retries + 1):
+                await self.rate_limiter.acquire_async()
+                
+                try:
+                    response = await client.post(url, headers=self.headers, json=data)
+                except httpx.TransportError as e:
+                    if attempt >= max_retries:
+                        raise
+                    delay = self._retry_delay(attempt)
+                    print(f"⚠️ BigModel API连接失败({e})，{delay:.1f}秒后第{attempt + 1}次重试")
+                    await asyncio.sleep(delay)
+                    continue
+                
+                if response.status_code in RETRY_STATUS_CODES and attempt < max_retries:
+                    delay = self._retry_delay(attempt, response.headers.get("Retry-After"))
+                    print(f"⚠️ BigModel API返回{response.status_code}，{delay:.1f}秒后第{attempt + 1}次重试")
+                    await asyncio.sleep(delay)
+                    continue
+                
+                response.raise_for_status()
+                
+                return self._parse_embeddings_response(response.json(), len(texts))
+        
+        except httpx.HTTPError as e:
+            print(f"❌ BigModel API异步请求失败: {e}")
+            raise
+        except Exception as e:
+            print(f"❌ 处理响应时出错: {e}")
+            raise
+    
+    def _get_embedding(self, text: str) -> np.ndarray:
+        """
+        获取单个文本的向量表示
+        
+        Args:
+            text: 输入文本
+            
+        Returns:
+            float32向量
+        """
+        return self._get_embeddings_batch([text])[0]
+    
     def get_embedding_dimension(self) -> int:
         """获取向量维度"""
         return 1024  # embedding-2模型的维度
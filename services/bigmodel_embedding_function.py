@@ -1,17 +1,24 @@
 """
-符合ChromaDB接口的BigModel Embedding函数
+符合ChromaDB接口的Embedding函数
+向量化后端由Config.EMBEDDING_BACKEND决定（BigModel或本地哈希向量）
 """
 
 from typing import List
 from chromadb.api.types import EmbeddingFunction, Embeddings
-from services.bigmodel_embedding import BigModelEmbedding
+from services.embedding_backend import EmbeddingBackend, create_embedding_service
 
 class BigModelEmbeddingFunction(EmbeddingFunction):
     """符合ChromaDB接口的BigModel embedding函数"""
     
-    def __init__(self, api_key: str):
-        """初始化embedding函数"""
-        self.embedding_service = BigModelEmbedding(api_key)
+    def __init__(self, api_key: str = None, embedding_service: EmbeddingBackend = None):
+        """
+        初始化embedding函数
+        
+        Args:
+            api_key: BigModel API密钥
+            embedding_service: 已创建的向量化服务，传入时直接复用
+        """
+        self.embedding_service = embedding_service or create_embedding_service(api_key)
     
     def __call__(self, input: List[str]) -> Embeddings:
         """
@@ -19,9 +26,8 @@ class BigModelEmbeddingFunction(EmbeddingFunction):
         
         Args:
             input: 文本列表
-            
+        
         Returns:
-            向量列表
+            float32向量列表（每行为ndarray，不转换为Python列表）
         """
-        embeddings = self.embedding_service.encode(input)
-        return embeddings.tolist() 
\ No newline at end of file
+        return list(self.embedding_service.encode(input)) 
\ No newline at end of file
@@ -3,36 +3,63 @@ BigModel知识库管理器
 使用智谱AI的embedding-2模型和ChromaDB构建知识库
 """
 
+import asyncio
+import hashlib
 import chromadb
 from chromadb.config import Settings
 import os
 import re
-from typing import List, Dict, Any, Optional
+import threading
+from contextlib import contextmanager
+from typing import Callable, List, Dict, Any, Optional
 import numpy as np
-from services.bigmodel_embedding import BigModelEmbedding
+from services.embedding_backend import EmbeddingBackend, create_embedding_service
 from services.bigmodel_embedding_function import BigModelEmbeddingFunction
+from services.embedding_cache import get_query_embedding_cache
+from services.embedding_batcher import get_embedding_batcher
+from services.vector_index import NumpyVectorIndex, distance_to_similarity
+from services.vector_snapshot import MemmapVectorIndex, snapshot_path
+from services.collection_version import CollectionWriteVersion
+from services.lexical_index import BM25Index, reciprocal_rank_fusion
+from services.phrase_index import NgramPhraseIndex
+from services.metadata_index import MetadataIndex
+from services.simhash import collapse_near_duplicates, simhash_hex
+from services.text_splitter import split_with_config
+from services.parent_context import assemble_parents, parents_where, plan_parents
 from core.config import Config
 
+# 旧版本的块ID：doc_<hash(content) % 1000000>[_<批内序号>]，hash()随进程变化，不能用于去重
+_LEGACY_CHUNK_ID_PATTERN = re.compile(r"^doc_\d{1,6}(?:_\d+)?$")
+
 class BigModelKnowledgeBase:
     """使用BigModel embedding的知识库管理器"""
     
-    def __init__(self, api_key: str = None, collection_name: str = "engineering_knowledge_bigmodel"):
+    def __init__(self, api_key: str = None, collection_name: str = "engineering_knowledge_bigmodel",
+                 client=None, embedding_service: EmbeddingBackend = None):
         """
         初始化知识库管理器
         
         Args:
             api_key: BigModel API密钥
             collection_name: 集合名称
+            client: 共享的ChromaDB客户端，未传入时新建
+            embedding_service: 共享的向量化服务，未传入时按配置新建
         """
         self.api_key = api_key
         self.collection_name = collection_name
         
-        # 初始化BigModel embedding服务
-        self.embedding_service = BigModelEmbedding(api_key)
-        self.embedding_function = BigModelEmbeddingFunction(api_key)
+        # 初始化embedding服务（后端由Config.EMBEDDING_BACKEND决定）
+        self.embedding_service = embedding_service or create_embedding_service(api_key)
+        self.embedding_function = BigModelEmbeddingFunction(embedding_service=self.embedding_service)
+        
+        # 查询向量缓存（进程内共享，未启用时为None）
+        self.query_cache = get_query_embedding_cache()
+        
+        # 查询向量微批调度器（进程内共享，未启用时为None）
+        self.query_batcher = get_embedding_batcher(self.embedding_service)
         
         # 初始化ChromaDB客户端
-        self.client = chromadb.PersistentClient(
+        self.client = client or chromadb.PersistentClient(
             path=Config.CHROMA_PERSIST_DIRECTORY,
             settings=Settings(
                 anonymized_telemetry=False,
@@ -40,31 +67,108 @@ class BigModelKnowledgeBase:
             )
         )
         
-        # 创建或获取集合
+        # 创建或获取集合，并读取其距离空间（旧集合为l2，新集合按配置）和建库时的分块方式
         self.collection = self._get_or_create_collection()
+        self.distance_space = self._get_distance_space()
+        self.chunking_mode = self._get_chunking_mode()
+        if self.chunking_mode != self._configured_chunking_mode():
+            print(f"⚠️ 集合 {self.collection_name} 的分块方式为 {self.chunking_mode}，与配置不一致，重建知识库后生效")
+        
+        # 集合的写入版本（任何进程写入后变化），进程内的索引据此发现其他进程的写入
+        self.write_version = CollectionWriteVersion(self.collection_name)
+        
+        # 精确检索索引：numpy为进程内矩阵（记录加载时的写入版本），memmap为多进程共享的磁盘快照
+        self.vector_index = None
+        self._vector_index_version = None
+        retrieval_backend = Config.RETRIEVAL_CONFIG["backend"]
+        if retrieval_backend == "numpy":
+            self.vector_index = NumpyVectorIndex(space=self.distance_space)
+            self._vector_index_version = self.write_version.current()
+            loaded = self.vector_index.load_from_collection(self.collection)
+            print(f"🧮 NumPy精确检索索引已加载: {loaded} 个向量")
+        elif retrieval_backend == "memmap":
+            self.vector_index = MemmapVectorIndex(snapshot_path(self.collection_name), space=self.distance_space)
+            # 快照缺失或与集合不一致（如被其他后端的进程写入过）时重新导出
+            if self.vector_index.generation is None or len(self.vector_index) != self.collection.count():
+                exported = self.vector_index.load_from_collection(self.collection)
+                print(f"💾 已导出向量快照: {exported} 个向量")
+            else:
+                print(f"💾 已映射向量快照: {len(self.vector_index)} 个向量 ({self.vector_index.generation})")
+        
+        # 二级索引（lexical: BM25词法索引，phrase: n-gram短语索引，metadata: 元数据索引），首次使用时建立，
+        # 记录建立或最后同步时集合的写入版本，其他进程写入后（版本变化）整体重建
+        self._secondary_indexes: Dict[str, Any] = {}
+        self._secondary_index_versions: Dict[str, Optional[str]] = {}
+        self._secondary_index_lock = threading.Lock()
+        
+        # 已检查过旧块ID的来源（每个来源每个进程只检查一次）
+        self._id_checked_sources = set()
         
         print(f"✅ BigModel知识库管理器初始化成功")
         print(f"   集合名称: {self.collection_name}")
+        print(f"   距离空间: {self.distance_space}")
         print(f"   数据库路径: {Config.CHROMA_PERSIST_DIRECTORY}")
     
     def _get_or_create_collection(self):
         """获取或创建集合"""
+        hnsw = Config.RETRIEVAL_CONFIG["hnsw"]
         try:
             # 尝试获取现有集合
             collection = self.client.get_collection(name=self.collection_name)
             print(f"📚 使用现有集合: {self.collection_name}")
+            self._apply_search_ef(collection, hnsw["search_ef"])
         except Exception:
-            # 创建新集合，使用自定义嵌入函数
+            # 创建新集合，使用自定义嵌入函数和配置的HNSW参数
             collection = self.client.create_collection(
                 name=self.collection_name,
                 embedding_function=self.embedding_function,
-                metadata={"description": "工程监理知识库 - BigModel版"}
+                metadata={
+                    "description": "工程监理知识库 - BigModel版",
+                    "chunking_mode": self._configured_chunking_mode(),
+                    "hnsw:space": hnsw["space"],
+                    "hnsw:M": hnsw["M"],
+                    "hnsw:construction_ef": hnsw["construction_ef"],
+                    "hnsw:search_ef": hnsw["search_ef"]
+                }
             )
-            print(f"📚 创建新集合: {self.collection_name}")
+            print(f"📚 创建新集合: {self.collection_name}（{hnsw['space']}空间，M={hnsw['M']}）")
         
         return collection
     
-    def _embedding_function(self, input: List[str]) -> List[List[float]]:
+    @staticmethod
+    def _get_hnsw_settings(collection) -> Dict[str, Any]:
+        """读取集合的HNSW参数（兼容新版configuration和旧版hnsw:*元数据）"""
+        configuration = getattr(collection, "configuration", None) or {}
+        settings = dict(configuration.get("hnsw") or {})
+        for key, value in (collection.metadata or {}).items():
+            if key.startswith("hnsw:"):
+                settings.setdefault(key[len("hnsw:"):], value)
+        return settings
+    
+    def _get_distance_space(self) -> str:
+        """集合的距离空间，未显式设置时为ChromaDB默认的l2"""
+        return self._get_hnsw_settings(self.collection).get("space", "l2")
+    
+    def _configured_chunking_mode(self) -> str:
+        """配置的分块方式：parent_child（父子块检索）或standard"""
+        return "parent_child" if Config.get_chunking_config(self.collection_name)["parent_child"] else "standard"
+    
+    def _get_chunking_mode(self) -> str:
+        """集合建库时记录的分块方式，未记录的旧集合为standard"""
+        return (self.collection.metadata or {}).get("chunking_mode", "standard")
+    
+    def _apply_search_ef(self, collection, search_ef: int):
+        """将配置的search_ef同步到已有集合（search_ef是唯一可在建索引后调整的参数）"""
+        current = self._get_hnsw_settings(collection)
+        if current.get("ef_search", current.get("search_ef")) == search_ef:
+            return
+        try:
+            collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+            print(f"⚙️ 已将集合 {collection.name} 的ef_search调整为 {search_ef}")
+        except Exception as e:
+            print(f"⚠️ 无法调整集合 {collection.name} 的ef_search: {e}")
+    
+    def _embedding_function(self, input: List[str]) -> List[np.ndarray]:
         """
         ChromaDB使用的嵌入函数
         
@@ -72,14 +176,72 @@ class BigModelKnowledgeBase:
             input: 文本列表
             
         Returns:
-            嵌入向量列表
+            float32嵌入向量列表
+        """
+        return list(self.embedding_service.encode(input))
+    
+    @staticmethod
+    def make_chunk_id(content: str, source_file: str = "") -> str:
+        """
+        生成稳定的文档块ID: sha256(来源文件 + 块内容)
+        
+        同一来源的相同内容在任何进程中都得到相同ID，重复导入时可据此去重。
+        
+        Args:
+            content: 文档块内容
+            source_file: 来源文件名
+            
+        Returns:
+            文档块ID
         """
-        embeddings = self.embedding_service.encode(input)
-        return embeddings.tolist()
+        digest = hashlib.sha256(f"{source_file or ''}\0{content}".encode("utf-8")).hexdigest()
+        return f"doc_{digest[:32]}"
+    
+    def _get_existing_ids(self, doc_ids: List[str]) -> set:
+        """
+        查询集合中已存在的ID
+        
+        Args:
+            doc_ids: 待检查的ID列表
+            
+        Returns:
+            已存在的ID集合
+        """
+        existing = set()
+        for start in range(0, len(doc_ids), 500):
+            result = self.collection.get(ids=doc_ids[start:start + 500], include=[])
+            existing.update(result['ids'])
+        return existing
+    
+    def migrate_legacy_ids(self, source_files: List[str] = None) -> int:
+        """
+        将旧版本hash()生成的块ID按当前规则重写（复用已存储的向量）
+        
+        旧ID与sha256块ID不同，不迁移时再次导入同一文件会产生重复块。
+        add_document/add_documents_batch/sync_source在首次写入某个来源前自动调用。
+        
+        Args:
+            source_files: 要检查的来源，None表示集合中的全部来源
+            
+        Returns:
+            迁移的文档块数
+        """
+        if source_files is None:
+            source_files = self.list_sources()
+        
+        migrated = 0
+        for source_file in dict.fromkeys(source_files):
+            if not source_file or source_file in self._id_checked_sources:
+                continue
+            stored_ids = self.collection.get(where={"source_file": source_file}, include=[])['ids']
+            if any(_LEGACY_CHUNK_ID_PATTERN.match(doc_id) for doc_id in stored_ids):
+                migrated += self.rekey_source(source_file)
+            self._id_checked_sources.add(source_file)
+        return migrated
     
     def add_document(self, content: str, metadata: Dict[str, Any] = None) -> str:
         """
-        添加单个文档到知识库
+        添加单个文档到知识库（已存在的相同文档块直接跳过）
         
         Args:
             content: 文档内容
@@ -88,28 +250,29 @@ class BigModelKnowledgeBase:
         Returns:
             文档ID
         """
-        # 生成文档ID
-        doc_id = f"doc_{hash(content) % 1000000}"
-        
         # 默认元数据
         if metadata is None:
             metadata = {}
         
+        # 生成文档ID
+        doc_id = self.make_chunk_id(content, metadata.get("source_file", ""))
+        
+        self.migrate_legacy_ids([metadata.get("source_file", "")])
+        if self._get_existing_ids([doc_id]):
+            print(f"⏭️ 文档已存在，跳过: {doc_id}")
+            return doc_id
+        
         metadata.update({
             "content_length": len(content),
-            "type": "document"
+            "type": "document",
+            "simhash": simhash_hex(content)
         })
         
         # 获取向量表示
-        embedding = self.embedding_service.encode([content])[0].tolist()
+        embeddings = self.embedding_service.encode([content])
         
         # 添加到集合
-        self.collection.add(
-            documents=[content],
-            embeddings=[embedding],
-            metadatas=[metadata],
-            ids=[doc_id]
-        )
+        self._write_chunks([doc_id], [content], embeddings, [metadata])
         
         print(f"✅ 添加文档: {doc_id}")
         return doc_id
@@ -118,45 +281,347 @@ class BigModelKnowledgeBase:
         """
         批量添加文档
         
+        文档块ID由sha256(来源文件 + 块内容)生成，集合中已存在的块不再向量化，
+        重复导入未变化的文档不产生API调用，也不会产生重复数据。
+        
         Args:
             documents: 文档列表
             metadatas: 元数据列表
             
         Returns:
-            文档ID列表
+            文档ID列表（与输入一一对应，包括已存在而跳过的块）
         """
         if not documents:
             return []
         
-        # 生成文档ID
-        doc_ids = [f"doc_{hash(doc) % 1000000}_{i}" for i, doc in enumerate(documents)]
-        
         # 处理元数据
         if metadatas is None:
             metadatas = [{} for _ in documents]
         
+        # 生成稳定的文档ID
+        doc_ids = [
+            self.make_chunk_id(doc, metadata.get("source_file", ""))
+            for doc, metadata in zip(documents, metadatas)
+        ]
+        
+        # 过滤集合中已存在的块和本批次内的重复块
+        self.migrate_legacy_ids([metadata.get("source_file", "") for metadata in metadatas])
+        existing_ids = self._get_existing_ids(list(dict.fromkeys(doc_ids)))
+        new_indices = []
+        for i, doc_id in enumerate(doc_ids):
+            if doc_id not in existing_ids:
+                existing_ids.add(doc_id)
+                new_indices.append(i)
+        
+        skipped = len(documents) - len(new_indices)
+        if not new_indices:
+            print(f"⏭️ {len(documents)} 个文档块均已存在，跳过")
+            return doc_ids
+        
+        new_documents = [documents[i] for i in new_indices]
+        new_metadatas = [metadatas[i] for i in new_indices]
+        
         # 为每个文档添加基本元数据
-        for i, metadata in enumerate(metadatas):
+        for i, metadata in zip(new_indices, new_metadatas):
             metadata.update({
                 "content_length": len(documents[i]),
                 "type": "document",
-                "batch_index": i
+                "batch_index": i,
+                "simhash": simhash_hex(documents[i])
             })
         
         # 获取向量表示
-        print(f"🔄 正在获取 {len(documents)} 个文档的向量表示...")
-        embeddings = self.embedding_service.encode(documents)
+        print(f"🔄 正在获取 {len(new_documents)} 个文档的向量表示...")
+        embeddings = self.embedding_service.encode(new_documents)
+        
+        # 批量写入集合
+        self._write_chunks([doc_ids[i] for i in new_indices], new_documents, embeddings, new_metadatas)
+        
+        print(f"✅ 批量添加了 {len(new_documents)} 个文档" + (f"，跳过已存在的 {skipped} 个" if skipped else ""))
+        return doc_ids
+    
+    def sync_source(self, source_file: str, chunks: List[str], metadatas: List[Dict[str, Any]] = None) -> Dict[str, int]:
+        """
+        增量同步一个来源文件的文档块
+        
+        按块ID（即块内容哈希）对比集合中已存储的块：只向量化并写入新增的块，
+        只删除文件中已不存在的块，未变化的块仅刷新元数据（如chunk_index）。
+        先写入后删除，同步过程中该文件始终可被检索。
+        
+        Args:
+            source_file: 来源文件（目录同步时为相对于同步根目录的路径，避免不同目录下的同名文件冲突）
+            chunks: 文件当前的全部文档块
+            metadatas: 与chunks对应的元数据
+            
+        Returns:
+            同步统计：added、removed、unchanged
+        """
+        if metadatas is None:
+            metadatas = [{} for _ in chunks]
+        for metadata in metadatas:
+            metadata["source_file"] = source_file
+        
+        self.migrate_legacy_ids([source_file])
+        stored_ids = set(self.collection.get(where={"source_file": source_file}, include=[])['ids'])
         
-        # 批量添加到集合
-        self.collection.add(
+        new_ids = [self.make_chunk_id(chunk, source_file) for chunk in chunks]
+        
+        # 新增的块（同一文件内的重复块只保留第一个）
+        added_indices = []
+        kept_indices = []
+        seen = set()
+        for i, doc_id in enumerate(new_ids):
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            (kept_indices if doc_id in stored_ids else added_indices).append(i)
+        
+        removed_ids = list(stored_ids - seen)
+        
+        # 新增、刷新元数据和删除合并为一次索引更新（memmap后端只发布一个快照版本）
+        with self.batch_writes():
+            if added_indices:
+                self.add_documents_batch(
+                    [chunks[i] for i in added_indices],
+                    [metadatas[i] for i in added_indices]
+                )
+            
+            if kept_indices:
+                kept_metadatas = []
+                for i in kept_indices:
+                    metadata = metadatas[i]
+                    metadata.update({
+                        "content_length": len(chunks[i]),
+                        "type": "document",
+                        "simhash": simhash_hex(chunks[i])
+                    })
+                    kept_metadatas.append(metadata)
+                kept_ids = [new_ids[i] for i in kept_indices]
+                self.collection.update(ids=kept_ids, metadatas=kept_metadatas)
+                if self.vector_index is not None:
+                    self.vector_index.update_metadatas(kept_ids, kept_metadatas)
+                # 只有元数据索引受元数据变化影响
+                self._sync_secondary_indexes(
+                    lambda index: index.add(kept_ids, None, kept_metadatas), names=("metadata",)
+                )
+            
+            if removed_ids:
+                self._delete_ids(removed_ids)
+        
+        stats = {
+            "added": len(added_indices),
+            "removed": len(removed_ids),
+            "unchanged": len(kept_indices)
+        }
+        print(f"🔁 同步 {source_file}: 新增 {stats['added']}，删除 {stats['removed']}，未变化 {stats['unchanged']}")
+        return stats
+    
+    def rekey_source(self, source_file: str, new_source_file: str = None,
+                     match: Callable[[Dict[str, Any]], bool] = None) -> int:
+        """
+        将来源文件的文档块迁移到新的来源名下（块ID随来源重新生成）
+        
+        复用集合中已存储的向量，不重新向量化。用于迁移旧版本写入的数据（如以文件名记录的来源）。
+        
+        Args:
+            source_file: 当前的来源名
+            new_source_file: 新的来源名，默认不变
+            match: 按元数据筛选要迁移的块，None表示全部
+            
+        Returns:
+            迁移的文档块数
+        """
+        new_source_file = new_source_file or source_file
+        stored = self.collection.get(where={"source_file": source_file}, include=['documents', 'metadatas'])
+        
+        moves = {}
+        for doc_id, document, metadata in zip(stored['ids'], stored['documents'], stored['metadatas']):
+            metadata = metadata or {}
+            if match is not None and not match(metadata):
+                continue
+            new_id = self.make_chunk_id(document, new_source_file)
+            if new_id != doc_id or new_source_file != source_file:
+                moves[doc_id] = new_id
+        if not moves:
+            return 0
+        
+        fetched = self.collection.get(ids=list(moves), include=['documents', 'metadatas', 'embeddings'])
+        # 内容相同的块迁移后ID相同，只保留一个
+        rows = {}
+        for i, doc_id in enumerate(fetched['ids']):
+            rows.setdefault(moves[doc_id], i)
+        new_ids = list(rows)
+        documents = [fetched['documents'][i] for i in rows.values()]
+        metadatas = [{**(fetched['metadatas'][i] or {}), "source_file": new_source_file} for i in rows.values()]
+        embeddings = np.asarray(fetched['embeddings'], dtype=np.float32)[list(rows.values())]
+        
+        # 先写入新块再删除旧块，迁移过程中文档始终可被检索
+        with self.batch_writes():
+            self._write_chunks(new_ids, documents, embeddings, metadatas)
+            stale_ids = [doc_id for doc_id in fetched['ids'] if doc_id not in rows]
+            if stale_ids:
+                self._delete_ids(stale_ids)
+        
+        if new_source_file != source_file:
+            print(f"🔀 迁移来源 {source_file} → {new_source_file}: {len(new_ids)} 个文档块")
+        else:
+            print(f"🔀 重写块ID {source_file}: {len(new_ids)} 个文档块")
+        return len(new_ids)
+    
+    @contextmanager
+    def batch_writes(self):
+        """
+        批量写入事务：事务内的全部写入只在结束时更新一次精确检索索引的快照
+        
+        memmap后端下每次写入都会重写整份快照，构建或同步多个文件时应在外层包一层，
+        使整个构建只发布一个版本。其他后端下没有额外效果。
+        
+        用法:
+            with kb.batch_writes():
+                for chunks, metadatas in files:
+                    kb.add_documents_batch(chunks, metadatas)
+        """
+        if self.vector_index is None:
+            yield
+            return
+        
+        with self.vector_index.batch():
+            yield
+    
+    def _write_chunks(self, ids: List[str], documents: List[str], embeddings: np.ndarray,
+                      metadatas: List[Dict[str, Any]]):
+        """写入文档块到集合，并同步到精确检索索引（memmap后端会重新生成快照，批量写入事务内除外）"""
+        self.collection.upsert(
             documents=documents,
-            embeddings=embeddings.tolist(),
+            embeddings=embeddings,
             metadatas=metadatas,
-            ids=doc_ids
+            ids=ids
         )
+        if self.vector_index is not None:
+            self.vector_index.upsert(ids, embeddings, documents, metadatas)
+        self._sync_secondary_indexes(lambda index: index.add(ids, documents, metadatas))
+    
+    def _delete_ids(self, ids: List[str]):
+        """从集合删除文档块，并同步到精确检索索引（memmap后端会重新生成快照，批量写入事务内除外）"""
+        self.collection.delete(ids=ids)
+        if self.vector_index is not None:
+            self.vector_index.delete(ids)
+        self._sync_secondary_indexes(lambda index: index.remove(ids))
+    
+    def _sync_secondary_indexes(self, apply, names=None):
+        """
+        集合写入后更新写入版本，并将本进程的写入增量应用到已建立的二级索引
         
-        print(f"✅ 批量添加了 {len(documents)} 个文档")
-        return doc_ids
+        写入前的版本与索引记录的版本一致（其间没有其他进程写入）时，增量应用后索引即对应新版本；
+        否则保留旧记录，下次使用时整体重建。
+        
+        Args:
+            apply: 应用到索引的函数
+            names: 受本次写入影响的索引名，None表示全部
+        """
+        previous, version = self.write_version.bump()
+        for name, index in list(self._secondary_indexes.items()):
+            if names is None or name in names:
+                apply(index)
+            if self._secondary_index_versions.get(name) == previous:
+                self._secondary_index_versions[name] = version
+        # 精确检索索引已由调用方同步
+        if self._vector_index_version == previous:
+            self._vector_index_version = version
+    
+    def _refresh_vector_index(self):
+        """NumPy后端的进程内矩阵在其他进程写入集合后（写入版本变化）重新加载；memmap快照在查询时自行检查新版本"""
+        if type(self.vector_index) is not NumpyVectorIndex:
+            return
+        version = self.write_version.current()
+        if version == self._vector_index_version:
+            return
+        
+        with self._secondary_index_lock:
+            if version != self._vector_index_version:
+                loaded = self.vector_index.load_from_collection(self.collection)
+                self._vector_index_version = version
+                print(f"🧮 NumPy精确检索索引已重新加载: {loaded} 个向量")
+    
+    def _get_secondary_index(self, name: str, factory, label: str):
+        """
+        获取二级索引，首次使用时从集合建立
+        
+        本进程的写入通过_write_chunks/_delete_ids增量同步；集合的写入版本与索引记录的不一致时
+        （其他worker进程、增量同步工具或构建脚本写入过）整体重建。
+        """
+        version = self.write_version.current()
+        index = self._secondary_indexes.get(name)
+        if index is not None and version == self._secondary_index_versions.get(name):
+            return index
+        
+        with self._secondary_index_lock:
+            index = self._secondary_indexes.get(name)
+            if index is None or version != self._secondary_index_versions.get(name):
+                index = factory()
+                count = index.load_from_collection(self.collection)
+                self._secondary_indexes[name] = index
+                self._secondary_index_versions[name] = version
+                print(f"🔤 {label}已建立: {count} 个文档块")
+        return index
+    
+    def get_lexical_index(self) -> BM25Index:
+        """获取BM25词法索引（混合检索使用）"""
+        return self._get_secondary_index(
+            "lexical",
+            lambda: BM25Index(k1=Config.RETRIEVAL_CONFIG["bm25_k1"], b=Config.RETRIEVAL_CONFIG["bm25_b"]),
+            "BM25词法索引"
+        )
+    
+    def get_phrase_index(self) -> NgramPhraseIndex:
+        """获取n-gram短语索引（精确短语检索使用）"""
+        return self._get_secondary_index("phrase", NgramPhraseIndex, "n-gram短语索引")
+    
+    def get_metadata_index(self) -> MetadataIndex:
+        """获取元数据索引（过滤检索使用）"""
+        return self._get_secondary_index(
+            "metadata",
+            lambda: MetadataIndex(Config.RETRIEVAL_CONFIG["metadata_index_fields"]),
+            "元数据索引"
+        )
+    
+    def grep(self, phrase: str, limit: int = 50, context: int = 30) -> Dict[str, Any]:
+        """
+        精确短语检索：返回包含该短语的文档块及全部匹配位置
+        
+        Args:
+            phrase: 查询短语（不区分大小写）
+            limit: 最多返回的文档块数
+            context: 片段中匹配位置前后保留的字符数
+            
+        Returns:
+            检索结果：query、total（命中块总数）、matches（含来源文件、偏移和高亮片段）
+        """
+        found = self.get_phrase_index().search(phrase, limit=limit, context=context)
+        matches = found["matches"]
+        
+        if matches:
+            stored = self.collection.get(ids=[match["id"] for match in matches], include=['metadatas'])
+            metadatas = dict(zip(stored['ids'], stored['metadatas']))
+            for match in matches:
+                metadata = metadatas.get(match["id"]) or {}
+                match.update({
+                    "source_file": metadata.get("source_file", "未知文件"),
+                    "chunk_index": metadata.get("chunk_index"),
+                    "metadata": metadata
+                })
+        
+        return {"query": phrase, "total": found["total"], "matches": matches}
+    
+    def list_sources(self) -> List[str]:
+        """获取集合中所有来源文件名"""
+        results = self.collection.get(include=['metadatas'])
+        sources = {
+            metadata.get("source_file")
+            for metadata in results['metadatas'] or []
+            if metadata and metadata.get("source_file")
+        }
+        return sorted(sources)
     
     def search(self, query: str, n_results: int = 5, include_distances: bool = True) -> Dict[str, Any]:
         """
@@ -171,15 +636,292 @@ class BigModelKnowledgeBase:
             搜索结果
         """
         # 获取查询向量
-        query_embedding = self.embedding_service.encode([query])[0].tolist()
+        query_embedding = self.get_query_embedding(query)
+        
+        return self.search_by_embedding(query, query_embedding, n_results, include_distances)
+    
+    def search_by_embedding(self, query: str, query_embedding: np.ndarray, n_results: int = 5,
+                            include_distances: bool = True, candidate_ids: List[str] = None) -> Dict[str, Any]:
+        """
+        使用已计算好的查询向量搜索（多集合检索时共享同一个查询向量）
+        
+        Args:
+            query: 查询文本（用于结果展示）
+            query_embedding: 查询向量
+            n_results: 返回结果数量
+            include_distances: 是否包含距离信息
+            candidate_ids: 只在这些文档块中检索（None表示不限制）
+            
+        Returns:
+            搜索结果
+        """
+        if candidate_ids is not None and not candidate_ids:
+            return {"query": query, "results": []}
+        
+        if self.vector_index is not None:
+            self._refresh_vector_index()
+            results = self.vector_index.query(query_embedding, n_results, candidate_ids=candidate_ids)
+        elif candidate_ids is not None:
+            results = self._query_candidates(query_embedding, list(candidate_ids), n_results)
+        else:
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                include=['documents', 'metadatas', 'distances']
+            )
+        
+        return self._format_search_results(query, results, include_distances)
+    
+    def _query_candidates(self, query_embedding: np.ndarray, candidate_ids: List[str], n_results: int) -> Dict[str, Any]:
+        """
+        只在候选文档块中做向量检索（ChromaDB后端）
+        
+        优先使用collection.query(ids=...)；不支持ids参数的旧版chromadb取回候选块的向量后精确排序，
+        返回结构与collection.query一致。
+        """
+        n_results = min(n_results, len(candidate_ids))
+        try:
+            return self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                include=['documents', 'metadatas', 'distances'],
+                ids=candidate_ids
+            )
+        except TypeError:
+            pass
+        
+        fetched = self.collection.get(ids=candidate_ids, include=['documents', 'metadatas', 'embeddings'])
+        if not fetched['ids']:
+            return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+        distances = np.asarray(self._embedding_distances(query_embedding, fetched['embeddings']))
+        order = np.argsort(distances, kind="stable")[:n_results]
+        return {
+            "ids": [[fetched['ids'][i] for i in order]],
+            "documents": [[fetched['documents'][i] for i in order]],
+            "metadatas": [[fetched['metadatas'][i] for i in order]],
+            "distances": [distances[order].tolist()]
+        }
+    
+    def search_filtered(self, query: str, filters: Dict[str, Any], n_results: int = 5) -> Dict[str, Any]:
+        """
+        带元数据过滤的检索：先求出满足条件的候选文档块，再在候选中按向量相似度排序
+        
+        RETRIEVAL_CONFIG["metadata_index_fields"]中的字段由元数据索引求候选（集合被其他进程写入后索引自动重建），
+        其余字段交给ChromaDB的where过滤。
+        
+        Args:
+            query: 查询文本
+            filters: 字段 → 值（值为列表表示任一值），多个字段之间取交集
+            n_results: 返回结果数量
+            
+        Returns:
+            搜索结果
+        """
+        filters = {field: value for field, value in filters.items() if value is not None}
+        if not filters:
+            return self.search(query, n_results=n_results)
+        
+        indexed_fields = set(Config.RETRIEVAL_CONFIG["metadata_index_fields"])
+        indexed = {field: value for field, value in filters.items() if field in indexed_fields}
+        unindexed = {field: value for field, value in filters.items() if field not in indexed_fields}
+        candidate_ids = self.get_metadata_index().lookup(indexed) if indexed else None
+        if unindexed:
+            matched = set(self.collection.get(where=self._metadata_where(unindexed), include=[])['ids'])
+            candidate_ids = matched if candidate_ids is None else candidate_ids & matched
+        print(f"🏷️ 元数据过滤 {filters}: {len(candidate_ids)} 个候选文档块")
+        if not candidate_ids:
+            return {"query": query, "results": []}
+        
+        query_embedding = self.get_query_embedding(query)
+        return self.search_by_embedding(query, query_embedding, n_results, candidate_ids=list(candidate_ids))
+    
+    @staticmethod
+    def _metadata_where(filters: Dict[str, Any]) -> Dict[str, Any]:
+        """将过滤条件转为ChromaDB的where表达式（列表值为$in，多个字段用$and连接）"""
+        clauses = [
+            {field: {"$in": list(value)}} if isinstance(value, (list, tuple, set)) else {field: value}
+            for field, value in filters.items()
+        ]
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+    
+    def hybrid_search(self, query: str, n_results: int = 5,
+                      similarity_threshold: Optional[float] = None) -> Dict[str, Any]:
+        """
+        混合检索：向量检索 + BM25词法检索，RRF融合
+        
+        Args:
+            query: 查询文本
+            n_results: 返回结果数量
+            similarity_threshold: 相似度阈值
+            
+        Returns:
+            搜索结果（按融合分数降序）
+        """
+        query_embedding = self.get_query_embedding(query)
+        return self.hybrid_search_by_embedding(query, query_embedding, n_results, similarity_threshold)
+    
+    def hybrid_search_by_embedding(self, query: str, query_embedding: np.ndarray, n_results: int = 5,
+                                   similarity_threshold: Optional[float] = None) -> Dict[str, Any]:
+        """
+        使用已计算好的查询向量做混合检索
+        
+        向量检索和BM25检索各取n_results个候选，按倒数排名融合（RRF）排序。
+        只被BM25召回的文档块按其向量计算相似度，与向量结果使用同一阈值过滤，
+        因此精确命中编号/条款号的文档块能排到前面，而只有字面重合的噪声仍会被阈值挡住。
+        
+        Args:
+            query: 查询文本
+            query_embedding: 查询向量
+            n_results: 返回结果数量
+            similarity_threshold: 相似度阈值，None表示不过滤
+            
+        Returns:
+            搜索结果，每个结果带rrf_score、vector_rank、lexical_rank（未命中为None）
+        """
+        vector_results = self.search_by_embedding(query, query_embedding, n_results)["results"]
+        lexical_hits = self.get_lexical_index().search(query, n_results)
+        
+        candidates = {result["id"]: result for result in vector_results}
+        missing_ids = [doc_id for doc_id, _ in lexical_hits if doc_id not in candidates]
+        if missing_ids:
+            fetched = self.collection.get(ids=missing_ids, include=['documents', 'metadatas', 'embeddings'])
+            distances = self._embedding_distances(query_embedding, fetched['embeddings'])
+            for doc_id, document, metadata, distance in zip(fetched['ids'], fetched['documents'],
+                                                            fetched['metadatas'], distances):
+                candidates[doc_id] = {
+                    "id": doc_id,
+                    "content": document,
+                    "metadata": metadata,
+                    "similarity": distance_to_similarity(distance, self.distance_space),
+                    "distance": distance
+                }
+        
+        vector_ranking = [result["id"] for result in vector_results]
+        lexical_ranking = [doc_id for doc_id, _ in lexical_hits]
+        fused = reciprocal_rank_fusion([vector_ranking, lexical_ranking], k=Config.RETRIEVAL_CONFIG["rrf_k"])
+        vector_ranks = {doc_id: rank for rank, doc_id in enumerate(vector_ranking, start=1)}
+        lexical_scores = dict(lexical_hits)
+        lexical_ranks = {doc_id: rank for rank, doc_id in enumerate(lexical_ranking, start=1)}
+        
+        results = []
+        for doc_id in sorted(fused, key=fused.get, reverse=True):
+            result = candidates.get(doc_id)
+            if result is None:
+                continue
+            if similarity_threshold is not None and result["similarity"] < similarity_threshold:
+                continue
+            result.update({
+                "rrf_score": fused[doc_id],
+                "vector_rank": vector_ranks.get(doc_id),
+                "lexical_rank": lexical_ranks.get(doc_id),
+                "lexical_score": lexical_scores.get(doc_id)
+            })
+            results.append(result)
+            if len(results) >= n_results:
+                break
+        
+        print(f"🔀 混合检索: '{query}' - 向量 {len(vector_ranking)} + 词法 {len(lexical_ranking)} 个候选，融合后保留 {len(results)} 个")
+        return {"query": query, "results": results}
+    
+    def _embedding_distances(self, query_embedding: np.ndarray, embeddings) -> List[float]:
+        """按集合的距离空间计算查询距离，与当前检索后端返回的距离一致"""
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(-1, query.shape[0])
+        # 精确检索后端和cosine空间使用归一化向量；ChromaDB的l2/ip空间使用原始向量
+        if self.vector_index is not None or self.distance_space == "cosine":
+            query = query / (np.linalg.norm(query) or 1.0)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix = matrix / norms
+        if self.distance_space == "l2":
+            return np.sum((matrix - query) ** 2, axis=1).tolist()
+        return (1.0 - matrix @ query).tolist()
+    
+    async def search_async(self, query: str, n_results: int = 5, include_distances: bool = True) -> Dict[str, Any]:
+        """
+        异步搜索相关文档，供FastAPI异步接口调用
+        
+        查询向量通过异步HTTP请求获取，ChromaDB查询放到线程池执行，
+        均不阻塞事件循环。
+        
+        Args:
+            query: 查询文本
+            n_results: 返回结果数量
+            include_distances: 是否包含距离信息
+            
+        Returns:
+            搜索结果
+        """
+        # 获取查询向量
+        query_embedding = await self.get_query_embedding_async(query)
         
         # 执行搜索
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results,
-            include=['documents', 'metadatas', 'distances']
+        return await asyncio.to_thread(
+            self.search_by_embedding, query, query_embedding, n_results, include_distances
         )
+    
+    def get_query_embedding(self, query: str) -> np.ndarray:
+        """
+        获取查询向量，优先使用查询缓存
         
+        Args:
+            query: 查询文本
+            
+        Returns:
+            float32查询向量
+        """
+        model = self.embedding_service.model
+        if self.query_cache is not None:
+            cached = self.query_cache.get(model, query)
+            if cached is not None:
+                return cached
+        
+        if self.query_batcher is not None:
+            query_embedding = self.query_batcher.encode(query)
+        else:
+            query_embedding = self.embedding_service.encode([query])[0]
+        
+        if self.query_cache is not None:
+            self.query_cache.put(model, query, query_embedding)
+        return query_embedding
+    
+    async def get_query_embedding_async(self, query: str) -> np.ndarray:
+        """
+        异步获取查询向量，优先使用查询缓存
+        
+        Args:
+            query: 查询文本
+            
+        Returns:
+            float32查询向量
+        """
+        model = self.embedding_service.model
+        if self.query_cache is not None:
+            cached = self.query_cache.get(model, query)
+            if cached is not None:
+                return cached
+        
+        if self.query_batcher is not None:
+            query_embedding = await self.query_batcher.encode_async(query)
+        else:
+            query_embedding = (await self.embedding_service.encode_async([query]))[0]
+        
+        if self.query_cache is not None:
+            self.query_cache.put(model, query, query_embedding)
+        return query_embedding
+    
+    def _format_search_results(self, query: str, results: Dict[str, Any], include_distances: bool) -> Dict[str, Any]:
+        """
+        将ChromaDB查询结果格式化为统一结构
+        
+        Args:
+            query: 查询文本
+            results: collection.query的返回值
+            include_distances: 是否包含距离信息
+            
+        Returns:
+            格式化后的搜索结果
+        """
         # 格式化结果
         formatted_results = {
             "query": query,
@@ -195,9 +937,9 @@ class BigModelKnowledgeBase:
                 }
                 
                 if include_distances and 'distances' in results:
-                    # ChromaDB返回的是距离，转换为相似度（1 - 归一化距离）
+                    # ChromaDB返回的是距离，按集合的距离空间转换为相似度
                     distance = results['distances'][0][i]
-                    similarity = max(0, 1 - distance / 2)  # 简单的距离到相似度转换
+                    similarity = distance_to_similarity(distance, self.distance_space)
                     result_item["similarity"] = similarity
                     result_item["distance"] = distance
                 
@@ -225,9 +967,49 @@ class BigModelKnowledgeBase:
             "total_chunks": count,
             "collection_name": self.collection_name,
             "embedding_model": self.embedding_service.model,
-            "embedding_dimension": self.embedding_service.get_embedding_dimension()
+            "embedding_dimension": self.embedding_service.get_embedding_dimension(),
+            "embedding_cache": self.embedding_service.get_cache_stats(),
+            "query_cache": self.query_cache.get_stats() if self.query_cache is not None else None,
+            "query_micro_batching": self.query_batcher.get_stats() if self.query_batcher is not None else None,
+            "retrieval_backend": Config.RETRIEVAL_CONFIG["backend"],
+            "distance_space": self.distance_space,
+            "hnsw": self._get_hnsw_settings(self.collection),
+            "vector_index": self.vector_index.get_stats() if self.vector_index is not None else None,
+            "hybrid_retrieval": Config.RETRIEVAL_CONFIG["hybrid"],
+            "chunking": {**Config.get_chunking_config(self.collection_name), "mode": self.chunking_mode},
+            "secondary_indexes": {name: index.get_stats() for name, index in self._secondary_indexes.items()},
+            "write_version": self.write_version.current()
         }
     
+    def uses_parent_retrieval(self) -> bool:
+        """该集合是否按父子块方式建库（以集合元数据为准，避免配置变化后对普通块做父段落扩展）"""
+        return self.chunking_mode == "parent_child"
+    
+    def expand_to_parents(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        将命中的子块扩展为所在的父段落（前后各取parent_window个相邻子块，同一文件内重叠的窗口合并）
+        
+        全部父段落的子块用一次collection.get取回。
+        
+        Args:
+            results: 按相关性降序排列的子块结果
+            
+        Returns:
+            父段落结果（沿用最佳命中子块的排名和分数，content为父段落全文，parent为起止块序号和命中子块ID）
+        """
+        if not results:
+            return []
+        
+        plans = plan_parents(
+            results, Config.RETRIEVAL_CONFIG["parent_window"], Config.RETRIEVAL_CONFIG["parent_max_chunks"]
+        )
+        where = parents_where(plans)
+        if where is None:
+            return [plan["hits"][0] for plan in plans]
+        
+        fetched = self.collection.get(where=where, include=['documents', 'metadatas'])
+        return assemble_parents(plans, fetched)
+    
     def search_documents(self, query: str, top_k: int = 5, similarity_threshold: float = 0.3):
         """
         搜索文档（兼容接口）
@@ -242,31 +1024,48 @@ class BigModelKnowledgeBase:
         """
         from core.models import DocumentSource
         
-        # 使用现有的search方法，获取更多结果以便过滤
-        results = self.search(query, n_results=min(top_k * 2, 20), include_distances=True)
+        # 获取更多结果以便过滤；启用混合检索时结果已按RRF融合分数排序
+        hybrid = Config.RETRIEVAL_CONFIG["hybrid"]
+        if hybrid:
+            results = self.hybrid_search(query, n_results=min(top_k * 2, 20))
+        else:
+            results = self.search(query, n_results=min(top_k * 2, 20), include_distances=True)
+        
+        # 折叠近重复的文档块（同一条文的多份副本、高度重叠的相邻窗口），结果已按相关性排序
+        distinct_results = collapse_near_duplicates(
+            results["results"], Config.RETRIEVAL_CONFIG["near_duplicate_distance"]
+        )
+        
+        # 只保留相似度超过阈值的结果
+        relevant_results = [
+            result for result in distinct_results
+            if result.get("similarity", 0.0) >= similarity_threshold
+        ]
         
-        # 转换为DocumentSource格式并应用相似度阈值过滤
+        # 父子块检索：命中的子块扩展为所在的父段落
+        if self.uses_parent_retrieval():
+            relevant_results = self.expand_to_parents(relevant_results)
+        
+        # 转换为DocumentSource格式
         sources = []
-        for result in results["results"]:
+        for result in relevant_results:
             similarity_score = result.get("similarity", 0.0)
-            
-            # 只保留相似度超过阈值的结果
-            if similarity_score >= similarity_threshold:
-                source = DocumentSource(
-                    title=result["metadata"].get("source_file", "未知文档"),
-                    content=result["content"],
-                    source=result["metadata"].get("source_file", "未知来源"),
-                    similarity=similarity_score,
-                    metadata=result["metadata"],
-                    file_name=result["metadata"].get("source_file", "未知文档"),
-                    regulation_code=result["metadata"].get("regulation_code"),
-                    section=result["metadata"].get("section"),
-                    similarity_score=similarity_score
-                )
-                sources.append(source)
+            source = DocumentSource(
+                title=result["metadata"].get("source_file", "未知文档"),
+                content=result["content"],
+                source=result["metadata"].get("source_file", "未知来源"),
+                similarity=similarity_score,
+                metadata=result["metadata"],
+                file_name=result["metadata"].get("source_file", "未知文档"),
+                regulation_code=result["metadata"].get("regulation_code"),
+                section=result["metadata"].get("section"),
+                similarity_score=similarity_score
+            )
+            sources.append(source)
         
-        # 按相似度排序并返回前top_k个结果
-        sources.sort(key=lambda x: x.similarity_score, reverse=True)
+        # 按相似度排序并返回前top_k个结果（混合检索保持融合排序）
+        if not hybrid:
+            sources.sort(key=lambda x: x.similarity_score, reverse=True)
         filtered_sources = sources[:top_k]
         
         # 记录过滤信息
@@ -281,6 +1080,13 @@ class BigModelKnowledgeBase:
         try:
             self.client.delete_collection(name=self.collection_name)
             self.collection = self._get_or_create_collection()
+            # 重建的集合使用配置的距离空间和分块方式
+            self.distance_space = self._get_distance_space()
+            self.chunking_mode = self._get_chunking_mode()
+            if self.vector_index is not None:
+                self.vector_index.space = self.distance_space
+                self.vector_index.clear()
+            self._sync_secondary_indexes(lambda index: index.clear())
             print(f"🗑️ 已清空集合: {self.collection_name}")
         except Exception as e:
             print(f"❌ 清空集合失败: {e}")
@@ -298,7 +1104,8 @@ class BigModelKnowledgeBase:
         try:
             # 先查询要删除的文档
             results = self.collection.get(
-                where={"source_file": source_file}
+                where={"source_file": source_file},
+                include=[]
             )
             
             if not results['ids']:
@@ -306,9 +1113,7 @@ class BigModelKnowledgeBase:
                 return 0
             
             # 删除文档
-            self.collection.delete(
-                where={"source_file": source_file}
-            )
+            self._delete_ids(results['ids'])
             
             removed_count = len(results['ids'])
             print(f"🗑️ 成功删除 {removed_count} 个文档块（来源: {source_file}）")
@@ -332,7 +1137,7 @@ class BigModelKnowledgeBase:
             if not doc_ids:
                 return 0
             
-            self.collection.delete(ids=doc_ids)
+            self._delete_ids(doc_ids)
             
             print(f"🗑️ 成功删除 {len(doc_ids)} 个文档块")
             return len(doc_ids)
@@ -354,11 +1159,11 @@ class BigModelKnowledgeBase:
             更新后的文档ID
         """
         if doc_id is None:
-            doc_id = f"doc_{hash(content) % 1000000}"
+            doc_id = self.make_chunk_id(content, (metadata or {}).get("source_file", ""))
         
         try:
             # 先删除现有文档
-            self.collection.delete(ids=[doc_id])
+            self._delete_ids([doc_id])
             print(f"🔄 删除旧文档: {doc_id}")
         except Exception:
             # 如果文档不存在，继续添加新文档
@@ -401,7 +1206,7 @@ class BigModelKnowledgeBase:
     
     def split_document(self, content: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
         """
-        分割文档为小块
+        分割文档为小块（优先在条文边界切分）
         
         Args:
             content: 文档内容
@@ -411,34 +1216,39 @@ class BigModelKnowledgeBase:
         Returns:
             文档块列表
         """
-        if len(content) <= chunk_size:
-            return [content]
+        return [chunk["content"] for chunk in self.split_document_with_structure(content, chunk_size, chunk_overlap)]
+    
+    def split_document_with_structure(self, content: str, chunk_size: int = None,
+                                      chunk_overlap: int = None) -> List[Dict[str, Any]]:
+        """
+        分割文档并返回每块所属的章和条文号
         
-        chunks = []
-        start = 0
+        分块方式按集合配置（Config.get_chunking_config）：按字符分块时chunk_size/chunk_overlap覆盖配置值；
+        集合配置为按token分块时使用配置的token预算，并在结果中附带每块的token_count；
+        集合按父子块方式建库时按子块大小分割（child_chunk_size/child_chunk_overlap，
+        按token分块时为child_chunk_tokens/child_chunk_overlap_tokens），与集合中已有的块保持一致。
         
-        while start < len(content):
-            # 确定结束位置
-            end = start + chunk_size
-            
-            # 如果不是最后一块，尝试在句号或换行符处分割
-            if end < len(content):
-                # 寻找最近的句号或换行符
-                for i in range(end, start + chunk_size - 100, -1):
-                    if content[i] in '。\n':
-                        end = i + 1
-                        break
-            
-            chunk = content[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
-            
-            # 设置下一个开始位置（考虑重叠）
-            start = end - chunk_overlap
-            if start >= len(content):
-                break
+        Args:
+            content: 文档内容
+            chunk_size: 块大小（字符），默认取配置
+            chunk_overlap: 重叠大小（字符），默认取配置
         
-        return chunks
+        Returns:
+            [{content, start, end, chapter, clause, clause_end[, token_count]}]，可用chunk_metadata()转为元数据
+        """
+        chunking = Config.get_chunking_config(self.collection_name)
+        if self.uses_parent_retrieval():
+            # 父子块检索的集合按子块大小建索引，父段落在检索时由相邻子块拼出
+            chunking["chunk_size"] = chunking["child_chunk_size"]
+            chunking["chunk_overlap"] = chunking["child_chunk_overlap"]
+            chunking["chunk_tokens"] = chunking["child_chunk_tokens"]
+            chunking["chunk_overlap_tokens"] = chunking["child_chunk_overlap_tokens"]
+        else:
+            if chunk_size is not None:
+                chunking["chunk_size"] = chunk_size
+            if chunk_overlap is not None:
+                chunking["chunk_overlap"] = chunk_overlap
+        return split_with_config(content, chunking)
 
 def build_knowledge_base_from_file(file_path: str, api_key: str) -> BigModelKnowledgeBase:
     """
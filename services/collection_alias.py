@@ -0,0 +1,108 @@
+"""
+集合别名存储
+逻辑知识库名（如standards）→ 实际ChromaDB集合名（如standards__v3）的映射，保存为JSON文件。
+写入通过临时文件 + os.replace原子替换，读取时按文件修改时间自动重新加载，
+构建脚本切换别名后，运行中的服务在下一次解析时即可看到新集合
+"""
+
+import json
+import os
+import tempfile
+import threading
+from typing import Dict
+
+from core.config import Config
+
+
+class CollectionAliasStore:
+    """基于JSON文件的集合别名映射"""
+    
+    def __init__(self, path: str):
+        """
+        初始化别名存储
+        
+        Args:
+            path: 别名JSON文件路径
+        """
+        self.path = path
+        self._aliases: Dict[str, str] = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+    
+    def _reload_if_changed(self):
+        """文件有变化时重新加载映射"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self._aliases, self._mtime = {}, None
+            return
+        
+        if mtime == self._mtime:
+            return
+        
+        with open(self.path, 'r', encoding='utf-8') as f:
+            self._aliases = json.load(f)
+        self._mtime = mtime
+    
+    def resolve(self, name: str) -> str:
+        """
+        解析逻辑名对应的实际集合名
+        
+        Args:
+            name: 逻辑知识库名
+        
+        Returns:
+            实际集合名，未设置别名时返回原名
+        """
+        with self._lock:
+            self._reload_if_changed()
+            return self._aliases.get(name, name)
+    
+    def set(self, name: str, collection_name: str):
+        """
+        原子地将别名指向新集合
+        
+        Args:
+            name: 逻辑知识库名
+            collection_name: 实际集合名
+        """
+        with self._lock:
+            self._reload_if_changed()
+            aliases = dict(self._aliases)
+            aliases[name] = collection_name
+            
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".aliases-", suffix=".json")
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(aliases, f, ensure_ascii=False, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            
+            self._aliases = aliases
+            self._mtime = os.stat(self.path).st_mtime_ns
+    
+    def get_all(self) -> Dict[str, str]:
+        """获取全部别名映射"""
+        with self._lock:
+            self._reload_if_changed()
+            return dict(self._aliases)
+
+
+# 全局别名存储实例
+collection_alias_store = None
+_alias_store_lock = threading.Lock()
+
+def get_collection_alias_store() -> CollectionAliasStore:
+    """获取全局集合别名存储"""
+    global collection_alias_store
+    with _alias_store_lock:
+        if collection_alias_store is None:
+            collection_alias_store = CollectionAliasStore(Config.COLLECTION_ALIAS_PATH)
+    return collection_alias_store
@@ -0,0 +1,105 @@
+"""
+集合写入版本
+每个集合一个版本文件，任何进程写入集合后都生成新的随机版本号（文件锁下原子替换）。
+各进程的进程内索引（BM25、n-gram短语、元数据）记录建立时的版本号，
+查询前比较文件中的版本，其他进程（其他uvicorn worker、增量同步工具、构建脚本）写入后即可发现并重建
+"""
+
+import os
+import tempfile
+import threading
+import uuid
+from typing import Optional, Tuple
+
+from core.config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows下只做进程内互斥
+    fcntl = None
+
+
+class CollectionWriteVersion:
+    """基于文件的集合写入版本号"""
+    
+    def __init__(self, collection_name: str, root: str = None):
+        """
+        初始化集合的写入版本
+        
+        Args:
+            collection_name: 实际集合名
+            root: 版本文件目录，默认读取配置
+        """
+        self.directory = root or Config.COLLECTION_VERSION_DIRECTORY
+        self.path = os.path.join(self.directory, f"{collection_name}.version")
+        self._version = None
+        self._stat_key = None
+        self._lock = threading.Lock()
+    
+    def current(self) -> Optional[str]:
+        """
+        读取当前版本号（文件未变化时不重新读取）
+        
+        Returns:
+            版本号，集合尚未被写入过时为None
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        # os.replace每次生成新inode，与修改时间一起判断
+        key = (stat.st_ino, stat.st_mtime_ns)
+        with self._lock:
+            if key != self._stat_key:
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        self._version = f.read().strip() or None
+                except FileNotFoundError:
+                    return None
+                self._stat_key = key
+            return self._version
+    
+    def bump(self) -> Tuple[Optional[str], str]:
+        """
+        写入集合后生成新版本号
+        
+        在文件锁下读取旧版本并替换为新版本，调用方据此判断两次写入之间是否有其他进程写入过：
+        旧版本与本进程索引记录的版本一致时，索引增量应用本次写入后即与新版本一致。
+        
+        Returns:
+            (旧版本号, 新版本号)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(f"{self.path}.lock", 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                self._stat_key = None
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        previous = f.read().strip() or None
+                except FileNotFoundError:
+                    previous = None
+                
+                version = uuid.uuid4().hex
+                fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".version-")
+                try:
+                    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                        f.write(version)
+                    os.replace(tmp_path, self.path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+                return previous, version
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    
+    def remove(self):
+        """删除版本文件（集合被删除时调用）"""
+        for path in (self.path, f"{self.path}.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -22,7 +22,7 @@ from minio import Minio
 from minio.error import S3Error
 
 from core.config import Config
-from services.bigmodel_knowledge_base import BigModelKnowledgeBase
+from services.knowledge_base_registry import get_knowledge_base_registry
 
 logger = logging.getLogger(__name__)
 
@@ -51,14 +51,21 @@ class DrawingUploadService:
         # 初始化客户端
         self._init_clients()
         
-        # 创建项目图纸向量知识库
-        self.drawings_kb = BigModelKnowledgeBase(
-            api_key=self.config.bigmodel_api_key,
-            collection_name="drawings"
-        )
+        # 预先创建项目图纸向量知识库（使用时通过drawings_kb按别名重新解析）
+        get_knowledge_base_registry().get("drawings")
         
         logger.info("✅ 项目图纸上传服务初始化完成")
     
+    @property
+    def drawings_kb(self):
+        """
+        项目图纸向量知识库
+        
+        每次访问都从全局注册表按别名解析，蓝绿重建切换后立即使用新集合，
+        与问答接口的多集合检索共享同一个管理器及其二级索引。
+        """
+        return get_knowledge_base_registry().get("drawings")
+    
     def _init_clients(self):
         """初始化各种客户端"""
         # 初始化Gemini客户端
@@ -284,8 +291,11 @@ class DrawingUploadService:
     def vectorize_drawing_text(self, text: str, drawing_info: Dict[str, Any]) -> int:
         """将图纸文本向量化并存储到知识库"""
         try:
+            # 分割和写入使用同一个集合
+            drawings_kb = self.drawings_kb
+            
             # 分割文本为合适的块
-            chunks = self.drawings_kb.split_document(text, chunk_size=800, chunk_overlap=100)
+            chunks = drawings_kb.split_document(text, chunk_size=800, chunk_overlap=100)
             
             # 准备元数据
             metadatas = []
@@ -306,7 +316,7 @@ class DrawingUploadService:
                 metadatas.append(metadata)
             
             # 批量添加到向量知识库
-            doc_ids = self.drawings_kb.add_documents_batch(chunks, metadatas)
+            doc_ids = drawings_kb.add_documents_batch(chunks, metadatas)
             
             logger.info(f"✅ 图纸文本向量化完成，添加了 {len(doc_ids)} 个文档块")
             return len(doc_ids)
@@ -680,25 +690,17 @@ class DrawingUploadService:
     def search_drawings_in_vector_db(self, query: str, top_k: int = 5,
                                    project_name: str = None,
                                    drawing_type: str = None) -> List[Dict[str, Any]]:
-        """在向量数据库中搜索图纸相关内容"""
+        """在向量数据库中搜索图纸相关内容（项目/图纸类型过滤走元数据索引）"""
         try:
             # 构建过滤条件
-            where_filter = {}
+            filters = {}
             if project_name:
-                where_filter["project_name"] = project_name
+                filters["project_name"] = project_name
             if drawing_type:
-                where_filter["drawing_type"] = drawing_type
-            
-            # 搜索向量数据库
-            if where_filter:
-                results = self.drawings_kb.collection.query(
-                    query_texts=[query],
-                    n_results=top_k,
-                    where=where_filter,
-                    include=['documents', 'metadatas', 'distances']
-                )
-            else:
-                results = self.drawings_kb.search(query, n_results=top_k)
+                filters["drawing_type"] = drawing_type
+            
+            # 搜索向量数据库：先按元数据索引确定候选块，再在候选中按向量相似度排序
+            results = self.drawings_kb.search_filtered(query, filters, n_results=top_k)
             
             # 格式化结果
             formatted_results = []
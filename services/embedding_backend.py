@@ -0,0 +1,73 @@
+"""
+Embedding后端接口
+定义向量化服务的统一接口，并按Config.EMBEDDING_BACKEND创建对应实现
+- bigmodel: 智谱AI embedding-2 HTTP API（默认）
+- local: 本地确定性哈希n-gram向量，无需网络，用于离线压测和基准测试
+"""
+
+import asyncio
+from abc import ABC, abstractmethod
+from typing import List, Union, Optional, Dict, Any
+
+import numpy as np
+
+from core.config import Config
+
+
+class EmbeddingBackend(ABC):
+    """向量化服务基类（未实现encode/get_embedding_dimension的子类无法实例化）"""
+    
+    # 向量模型名称，用于缓存键和统计信息
+    model: str = ""
+    
+    @abstractmethod
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        """
+        将文本编码为向量
+        
+        Args:
+            texts: 单个文本或文本列表
+        
+        Returns:
+            形状为(文本数, 维度)的向量数组
+        """
+    
+    async def encode_async(self, texts: Union[str, List[str]]) -> np.ndarray:
+        """异步将文本编码为向量，默认在线程池中执行encode"""
+        return await asyncio.to_thread(self.encode, texts)
+    
+    @abstractmethod
+    def get_embedding_dimension(self) -> int:
+        """获取向量维度"""
+    
+    def get_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """获取向量缓存统计，无缓存时返回None"""
+        return None
+
+
+def create_embedding_service(api_key: str = None, backend: str = None) -> EmbeddingBackend:
+    """
+    按配置创建向量化服务
+    
+    Args:
+        api_key: BigModel API密钥（仅bigmodel后端使用）
+        backend: 后端名称，默认读取Config.EMBEDDING_BACKEND
+    
+    Returns:
+        向量化服务实例
+    """
+    backend = (backend or Config.EMBEDDING_BACKEND).lower()
+    
+    if backend == "bigmodel":
+        from services.bigmodel_embedding import BigModelEmbedding
+        return BigModelEmbedding(api_key)
+    
+    if backend == "local":
+        from services.local_embedding import LocalHashEmbedding
+        local_config = Config.LOCAL_EMBEDDING_CONFIG
+        return LocalHashEmbedding(
+            dimension=local_config["dimension"],
+            ngram_range=local_config["ngram_range"]
+        )
+    
+    raise ValueError(f"不支持的embedding后端: {backend}（可选: bigmodel, local）")
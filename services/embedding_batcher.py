@@ -0,0 +1,163 @@
+"""
+查询向量微批调度器
+将短时间窗口内并发到达的查询向量化请求合并为一次批量API调用。
+调度线程只负责收集请求，凑好的批次交给线程池发送，多个批次可以同时在途；
+每个向量化服务（后端 + 模型 + API密钥）使用各自的调度器
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import Config
+
+
+class EmbeddingMicroBatcher:
+    """查询向量微批调度器"""
+    
+    def __init__(self, embedding_service, max_wait_ms: float = 5, max_batch_size: int = 32,
+                 max_concurrency: int = 4):
+        """
+        初始化微批调度器
+        
+        Args:
+            embedding_service: 提供encode(texts)的向量化服务
+            max_wait_ms: 第一个请求到达后最多等待的毫秒数
+            max_batch_size: 单批最多合并的文本数
+            max_concurrency: 同时在途的批次数
+        """
+        self.embedding_service = embedding_service
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max(1, max_concurrency)
+        
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        # 批次发送线程池：上一批的API调用未返回时，调度线程继续收集并发送下一批
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix="embedding-batch"
+        )
+        
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+    
+    def _ensure_worker(self):
+        """按需启动后台调度线程"""
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embedding-micro-batcher", daemon=True)
+                self._worker.start()
+    
+    def submit(self, text: str) -> Future:
+        """
+        提交一个待向量化的文本
+        
+        Args:
+            text: 查询文本
+        
+        Returns:
+            结果为该文本向量的Future
+        """
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+    
+    def encode(self, text: str) -> np.ndarray:
+        """同步获取单个文本的向量"""
+        return self.submit(text).result()
+    
+    async def encode_async(self, text: str) -> np.ndarray:
+        """异步获取单个文本的向量，不阻塞事件循环"""
+        return await asyncio.wrap_future(self.submit(text))
+    
+    def _run(self):
+        """后台调度循环：收集一个时间窗口内的请求后批量处理"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            self._executor.submit(self._process_batch, batch)
+    
+    def _process_batch(self, batch: List[Tuple[str, Future]]):
+        """批量向量化并把结果分发给各个调用者"""
+        pending = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not pending:
+            return
+        
+        try:
+            embeddings = self.embedding_service.encode([text for text, _ in pending])
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        
+        for (_, future), embedding in zip(pending, embeddings):
+            future.set_result(embedding)
+        
+        with self._stats_lock:
+            self.batches += 1
+            self.texts += len(pending)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取批处理统计"""
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": self.texts / self.batches if self.batches else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_batch_size": self.max_batch_size,
+            "max_concurrency": self.max_concurrency
+        }
+
+
+def _service_key(embedding_service) -> Tuple[str, str, str]:
+    """向量化服务的标识：后端类型 + 模型 + API密钥，相同标识的服务共用一个调度器"""
+    return (
+        type(embedding_service).__name__,
+        getattr(embedding_service, "model", ""),
+        getattr(embedding_service, "api_key", None) or ""
+    )
+
+
+# 按向量化服务区分的调度器实例
+embedding_batchers: Dict[Tuple[str, str, str], EmbeddingMicroBatcher] = {}
+_embedding_batcher_lock = threading.Lock()
+
+def get_embedding_batcher(embedding_service) -> Optional[EmbeddingMicroBatcher]:
+    """获取该向量化服务的查询向量微批调度器，未启用时返回None"""
+    batch_config = Config.MICRO_BATCH_CONFIG
+    if not batch_config["enabled"]:
+        return None
+    
+    key = _service_key(embedding_service)
+    with _embedding_batcher_lock:
+        batcher = embedding_batchers.get(key)
+        if batcher is None:
+            batcher = EmbeddingMicroBatcher(
+                embedding_service,
+                max_wait_ms=batch_config["max_wait_ms"],
+                max_batch_size=batch_config["max_batch_size"],
+                max_concurrency=batch_config["max_concurrency"]
+            )
+            embedding_batchers[key] = batcher
+    return batcher
@@ -0,0 +1,367 @@
+"""
+Embedding缓存
+- EmbeddingCache: 基于SQLite的持久化向量缓存，按sha256(模型名 + 文本)寻址，供服务和构建脚本共享
+- QueryEmbeddingCache: 进程内的查询向量LRU缓存（带TTL），避免同一问题重复向量化
+"""
+
+import atexit
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any, Tuple
+
+import numpy as np
+
+from core.config import Config
+
+# 命中条目的last_access先记在内存中，累计条数达到ACCESS_FLUSH_SIZE或距上次写回超过ACCESS_FLUSH_SECONDS时批量写回
+ACCESS_FLUSH_SIZE = 256
+ACCESS_FLUSH_SECONDS = 30.0
+# 条目数在进程内近似维护（不含其他进程的写入），本进程每写入容量的1/RECOUNT_FRACTION条时精确计数一次
+RECOUNT_FRACTION = 20
+
+
+class EmbeddingCache:
+    """持久化的内容寻址向量缓存（LRU淘汰）"""
+    
+    def __init__(self, path: str, max_entries: int = 200000):
+        """
+        初始化向量缓存
+        
+        Args:
+            path: SQLite数据库文件路径
+            max_entries: 最多缓存的向量条数，超出后按最近访问时间淘汰
+        """
+        self.path = path
+        self.max_entries = max_entries
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        
+        # 读路径不写数据库：访问时间按批写回，条目数近似维护，可能超过上限时才精确计数和淘汰
+        self._pending_access: Dict[str, float] = {}
+        self._last_access_flush = time.monotonic()
+        self._approx_entries = 0
+        self._inserts_since_count = 0
+        self._recount_interval = max(1, max_entries // RECOUNT_FRACTION)
+        self._bookkeeping_lock = threading.Lock()
+        
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        
+        conn = self._get_connection()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        conn.commit()
+        self._approx_entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    
+    def _get_connection(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接（WAL模式，支持多进程并发读写）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+    
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """生成缓存键: sha256(模型名 + 文本)"""
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+    
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        批量查询缓存
+        
+        Args:
+            model: 向量模型名称
+            texts: 文本列表
+        
+        Returns:
+            与输入顺序一致的向量列表，未命中的位置为None
+        """
+        if not texts:
+            return []
+        
+        keys = [self.make_key(model, text) for text in texts]
+        conn = self._get_connection()
+        
+        found = {}
+        unique_keys = list(set(keys))
+        # SQLite默认最多999个绑定参数，分段查询
+        for start in range(0, len(unique_keys), 500):
+            part = unique_keys[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        
+        if found:
+            self._touch(found)
+        
+        results = [found.get(key) for key in keys]
+        hit_count = sum(1 for vector in results if vector is not None)
+        with self._stats_lock:
+            self.hits += hit_count
+            self.misses += len(keys) - hit_count
+        
+        return results
+    
+    def put_many(self, model: str, texts: List[str], embeddings) -> None:
+        """
+        批量写入缓存
+        
+        Args:
+            model: 向量模型名称
+            texts: 文本列表
+            embeddings: 与texts一一对应的向量
+        """
+        if not texts:
+            return
+        
+        now = time.time()
+        rows = [
+            (self.make_key(model, text), np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        
+        conn = self._get_connection()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows
+        )
+        conn.commit()
+        
+        # 替换已有条目也计入，近似值只会偏大；其他进程的写入由定期精确计数补上
+        with self._bookkeeping_lock:
+            self._approx_entries += len(rows)
+            self._inserts_since_count += len(rows)
+            may_overflow = (self._approx_entries > self.max_entries
+                            or self._inserts_since_count >= self._recount_interval)
+        if may_overflow:
+            self._evict_if_needed(conn)
+    
+    def _touch(self, keys) -> None:
+        """记录命中条目的访问时间，累计够一批或间隔足够长时写回"""
+        now = time.time()
+        with self._bookkeeping_lock:
+            for key in keys:
+                self._pending_access[key] = now
+            due = (len(self._pending_access) >= ACCESS_FLUSH_SIZE
+                   or time.monotonic() - self._last_access_flush >= ACCESS_FLUSH_SECONDS)
+        if due:
+            self.flush_access()
+    
+    def flush_access(self) -> None:
+        """将内存中累计的访问时间写回数据库（淘汰前和进程退出时也会调用）"""
+        with self._bookkeeping_lock:
+            pending, self._pending_access = self._pending_access, {}
+            self._last_access_flush = time.monotonic()
+        if not pending:
+            return
+        
+        conn = self._get_connection()
+        # 其他进程写入的更晚的访问时间不被覆盖
+        conn.executemany(
+            "UPDATE embeddings SET last_access = ? WHERE key = ? AND last_access < ?",
+            [(accessed, key, accessed) for key, accessed in pending.items()]
+        )
+        conn.commit()
+    
+    def _evict_if_needed(self, conn: sqlite3.Connection) -> None:
+        """精确计数，超过容量上限时淘汰最久未访问的条目"""
+        self.flush_access()
+        count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        with self._bookkeeping_lock:
+            self._approx_entries = count
+            self._inserts_since_count = 0
+        
+        overflow = count - self.max_entries
+        if overflow <= 0:
+            return
+        
+        # 额外多淘汰1%，避免每次写入都触发淘汰
+        evict_count = overflow + max(1, self.max_entries // 100)
+        deleted = conn.execute(
+            """
+            DELETE FROM embeddings WHERE key IN (
+                SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?
+            )
+            """,
+            (evict_count,)
+        ).rowcount
+        conn.commit()
+        
+        with self._bookkeeping_lock:
+            self._approx_entries -= deleted
+        with self._stats_lock:
+            self.evictions += deleted
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存命中统计"""
+        conn = self._get_connection()
+        entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                "path": self.path,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "pending_access_updates": len(self._pending_access),
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+
+
+class QueryEmbeddingCache:
+    """进程内查询向量缓存（LRU + TTL）"""
+    
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 600):
+        """
+        初始化查询向量缓存
+        
+        Args:
+            max_entries: 最多缓存的查询数
+            ttl_seconds: 缓存有效期（秒）
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+    
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """规范化查询文本：全角转半角、合并空白、统一小写"""
+        query = unicodedata.normalize("NFKC", query)
+        query = re.sub(r"\s+", " ", query).strip()
+        return query.lower()
+    
+    def get(self, model: str, query: str) -> Optional[Any]:
+        """
+        查询缓存的向量
+        
+        Args:
+            model: 向量模型名称
+            query: 查询文本
+            
+        Returns:
+            缓存的向量，未命中或已过期时返回None
+        """
+        key = (model, self.normalize_query(query))
+        now = time.monotonic()
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            expires_at, embedding = entry
+            if expires_at < now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+    
+    def put(self, model: str, query: str, embedding: Any) -> None:
+        """
+        写入查询向量
+        
+        Args:
+            model: 向量模型名称
+            query: 查询文本
+            embedding: 查询向量
+        """
+        key = (model, self.normalize_query(query))
+        expires_at = time.monotonic() + self.ttl_seconds
+        
+        with self._lock:
+            self._entries[key] = (expires_at, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+# 全局缓存实例
+embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """获取全局向量缓存实例，未启用时返回None"""
+    global embedding_cache
+    cache_config = Config.EMBEDDING_CACHE_CONFIG
+    if not cache_config["enabled"]:
+        return None
+    
+    with _embedding_cache_lock:
+        if embedding_cache is None:
+            embedding_cache = EmbeddingCache(
+                path=cache_config["path"],
+                max_entries=cache_config["max_entries"]
+            )
+            # 退出前写回尚未写入的访问时间
+            atexit.register(embedding_cache.flush_access)
+    return embedding_cache
+
+
+# 全局查询向量缓存实例
+query_embedding_cache = None
+
+def get_query_embedding_cache() -> Optional[QueryEmbeddingCache]:
+    """获取全局查询向量缓存实例，未启用时返回None"""
+    global query_embedding_cache
+    cache_config = Config.QUERY_CACHE_CONFIG
+    if not cache_config["enabled"]:
+        return None
+    
+    with _embedding_cache_lock:
+        if query_embedding_cache is None:
+            query_embedding_cache = QueryEmbeddingCache(
+                max_entries=cache_config["max_entries"],
+                ttl_seconds=cache_config["ttl_seconds"]
+            )
+    return query_embedding_cache
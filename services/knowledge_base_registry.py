@@ -0,0 +1,419 @@
+"""
+知识库注册表
+进程内共享一个ChromaDB客户端和一个向量化服务，按集合名缓存知识库管理器，
+避免在请求路径上重复创建客户端、embedding服务和解析集合。
+逻辑知识库名通过别名解析到实际集合，支持蓝绿重建后原子切换
+"""
+
+import asyncio
+import heapq
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import chromadb
+from chromadb.config import Settings
+
+from core.config import Config
+from services.bigmodel_knowledge_base import BigModelKnowledgeBase
+from services.collection_alias import get_collection_alias_store
+from services.embedding_backend import create_embedding_service
+from services.simhash import collapse_near_duplicates
+from services.vector_snapshot import remove_snapshot
+from services.collection_version import CollectionWriteVersion
+
+
+class KnowledgeBaseRegistry:
+    """按集合名缓存的知识库管理器注册表"""
+    
+    def __init__(self, api_key: str = None):
+        """
+        初始化注册表
+        
+        Args:
+            api_key: BigModel API密钥
+        """
+        self.api_key = api_key or Config.bigmodel_api_key
+        
+        # 所有集合共享的ChromaDB客户端和向量化服务
+        self.client = chromadb.PersistentClient(
+            path=Config.CHROMA_PERSIST_DIRECTORY,
+            settings=Settings(
+                anonymized_telemetry=False,
+                allow_reset=True
+            )
+        )
+        self.embedding_service = create_embedding_service(self.api_key)
+        self.alias_store = get_collection_alias_store()
+        
+        self._knowledge_bases: Dict[str, BigModelKnowledgeBase] = {}
+        # 逻辑知识库名 → 上次解析到的实际集合名，别名切换后据此清理旧版本的管理器
+        self._resolved: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        
+        # 多集合并行检索线程池
+        self._search_executor = ThreadPoolExecutor(
+            max_workers=Config.RETRIEVAL_CONFIG["fanout_workers"],
+            thread_name_prefix="kb-search"
+        )
+        
+        print(f"✅ 知识库注册表初始化成功")
+        print(f"   数据库路径: {Config.CHROMA_PERSIST_DIRECTORY}")
+    
+    def resolve(self, name: str) -> str:
+        """解析逻辑知识库名对应的实际集合名"""
+        return self.alias_store.resolve(name)
+    
+    def get(self, name: str) -> BigModelKnowledgeBase:
+        """
+        获取知识库管理器，首次访问时创建并缓存
+        
+        Args:
+            name: 逻辑知识库名（按别名解析）或实际集合名
+        
+        Returns:
+            知识库管理器
+        """
+        collection_name = self.resolve(name)
+        previous = self._resolved.get(name)
+        if previous != collection_name:
+            # 别名已切换（可能由其他进程的重建完成），旧版本集合不再提供服务，移出缓存
+            if previous is not None:
+                self._evict(previous)
+            self._resolved[name] = collection_name
+        return self._get_physical(collection_name)
+    
+    def _get_physical(self, collection_name: str) -> BigModelKnowledgeBase:
+        """按实际集合名获取知识库管理器"""
+        kb = self._knowledge_bases.get(collection_name)
+        if kb is not None:
+            return kb
+        
+        with self._lock:
+            kb = self._knowledge_bases.get(collection_name)
+            if kb is None:
+                kb = BigModelKnowledgeBase(
+                    api_key=self.api_key,
+                    collection_name=collection_name,
+                    client=self.client,
+                    embedding_service=self.embedding_service
+                )
+                self._knowledge_bases[collection_name] = kb
+        return kb
+    
+    def _evict(self, collection_name: str):
+        """将实际集合的知识库管理器移出缓存（进行中的请求仍持有原对象，不受影响）"""
+        with self._lock:
+            self._knowledge_bases.pop(collection_name, None)
+    
+    def preload(self, collection_names: Iterable[str]) -> List[str]:
+        """
+        预先创建并缓存多个集合的知识库管理器（应用启动时调用）
+        
+        Args:
+            collection_names: 集合名称列表
+        
+        Returns:
+            加载成功的集合名称列表
+        """
+        loaded = []
+        for collection_name in collection_names:
+            try:
+                self.get(collection_name)
+                loaded.append(collection_name)
+            except Exception as e:
+                print(f"⚠️ 预加载知识库失败: {collection_name} - {e}")
+        return loaded
+    
+    def loaded_collections(self) -> List[str]:
+        """获取已缓存的集合名称"""
+        return list(self._knowledge_bases.keys())
+    
+    def list_collection_names(self) -> List[str]:
+        """列出ChromaDB中的全部实际集合名"""
+        # 不同版本的chromadb返回集合对象或集合名
+        return [getattr(collection, "name", collection) for collection in self.client.list_collections()]
+    
+    def _generations(self, name: str) -> Dict[int, str]:
+        """
+        获取逻辑知识库的全部版本集合
+        
+        Returns:
+            版本号 → 集合名，未加版本后缀的旧集合视为第0版
+        """
+        pattern = re.compile(rf"^{re.escape(name)}__v(\d+)$")
+        generations = {}
+        for collection_name in self.list_collection_names():
+            if collection_name == name:
+                generations[0] = collection_name
+                continue
+            match = pattern.match(collection_name)
+            if match:
+                generations[int(match.group(1))] = collection_name
+        return generations
+    
+    def drop_collection(self, collection_name: str):
+        """删除实际集合并移出缓存"""
+        self._evict(collection_name)
+        self.client.delete_collection(name=collection_name)
+        remove_snapshot(collection_name)
+        CollectionWriteVersion(collection_name).remove()
+        print(f"🗑️ 已删除集合: {collection_name}")
+    
+    def rebuild_collection(self, name: str, build_fn: Callable[[BigModelKnowledgeBase], Any],
+                           smoke_query: str, keep_generations: Optional[int] = None) -> str:
+        """
+        蓝绿重建知识库：写入新版本集合，冒烟查询通过后原子切换别名，再清理旧版本
+        
+        重建期间线上请求始终使用当前集合，不会出现空索引。
+        
+        Args:
+            name: 逻辑知识库名（如standards）
+            build_fn: 向传入的暂存知识库写入数据的函数
+            smoke_query: 切换前执行的冒烟查询，必须返回结果
+            keep_generations: 除当前集合外保留的旧版本数，默认读取配置
+            
+        Returns:
+            新的实际集合名
+        """
+        if keep_generations is None:
+            keep_generations = Config.COLLECTION_KEEP_GENERATIONS
+        
+        generations = self._generations(name)
+        version = max(generations, default=0) + 1
+        staging_name = f"{name}__v{version}"
+        
+        print(f"🟦 开始蓝绿重建: {name} → 暂存集合 {staging_name}（当前: {self.resolve(name)}）")
+        staging_kb = self._get_physical(staging_name)
+        
+        try:
+            # 暂存集合的全部写入只发布一次向量快照（memmap后端）
+            with staging_kb.batch_writes():
+                build_fn(staging_kb)
+            
+            count = staging_kb.collection.count()
+            if count == 0:
+                raise RuntimeError("暂存集合为空")
+            smoke = staging_kb.search(smoke_query, n_results=1)
+            if not smoke["results"]:
+                raise RuntimeError(f"冒烟查询无结果: {smoke_query}")
+        except Exception as e:
+            print(f"❌ 重建失败，保留当前集合 {self.resolve(name)}: {e}")
+            self.drop_collection(staging_name)
+            raise
+        
+        previous = self.resolve(name)
+        self.alias_store.set(name, staging_name)
+        print(f"🟩 别名已切换: {name} → {staging_name}（{count} 个文档块，原集合: {previous}）")
+        
+        # 保留的旧版本只用于回滚，不再缓存其管理器
+        self._resolved[name] = staging_name
+        if previous != staging_name:
+            self._evict(previous)
+        
+        # 清理旧版本：保留当前集合和最近keep_generations个旧版本
+        old_generations = sorted(
+            (version_number for version_number, collection_name in generations.items()
+             if collection_name != staging_name),
+            reverse=True
+        )
+        for version_number in old_generations[keep_generations:]:
+            self.drop_collection(generations[version_number])
+        
+        return staging_name
+    
+    def search_many(self, query: str, collections: List[str], n_results: int = 5,
+                    top_k: Optional[int] = None, similarity_threshold: Optional[float] = None) -> Dict[str, Any]:
+        """
+        多集合检索：查询向量只计算一次，各集合在线程池中并行查询，结果按相似度归并
+        
+        Args:
+            query: 查询文本
+            collections: 集合名称列表
+            n_results: 每个集合返回的结果数
+            top_k: 归并后保留的结果数，默认等于n_results
+            similarity_threshold: 相似度阈值，各集合的结果在归并前过滤，None表示不过滤
+            
+        Returns:
+            搜索结果，每个结果带source_type（来源集合名）
+        """
+        knowledge_bases = [self.get(name) for name in collections]
+        if not knowledge_bases:
+            return {"query": query, "results": []}
+        
+        query_embedding = knowledge_bases[0].get_query_embedding(query)
+        
+        futures = [
+            self._search_executor.submit(self._search_function(kb), query, query_embedding, n_results)
+            for kb in knowledge_bases
+        ]
+        per_collection = []
+        for name, future in zip(collections, futures):
+            try:
+                per_collection.append((name, future.result()))
+            except Exception as e:
+                print(f"⚠️ 知识库检索失败: {name} - {e}")
+        
+        return self._expand_parents(
+            self._merge_results(query, per_collection, top_k or n_results, similarity_threshold)
+        )
+    
+    async def search_many_async(self, query: str, collections: List[str], n_results: int = 5,
+                                top_k: Optional[int] = None,
+                                similarity_threshold: Optional[float] = None) -> Dict[str, Any]:
+        """
+        多集合检索的异步版本，供FastAPI异步接口调用
+        
+        Args:
+            query: 查询文本
+            collections: 集合名称列表
+            n_results: 每个集合返回的结果数
+            top_k: 归并后保留的结果数，默认等于n_results
+            similarity_threshold: 相似度阈值，各集合的结果在归并前过滤，None表示不过滤
+            
+        Returns:
+            搜索结果，每个结果带source_type（来源集合名）
+        """
+        knowledge_bases = [self.get(name) for name in collections]
+        if not knowledge_bases:
+            return {"query": query, "results": []}
+        
+        query_embedding = await knowledge_bases[0].get_query_embedding_async(query)
+        
+        loop = asyncio.get_running_loop()
+        outcomes = await asyncio.gather(
+            *(loop.run_in_executor(self._search_executor, self._search_function(kb), query, query_embedding, n_results)
+              for kb in knowledge_bases),
+            return_exceptions=True
+        )
+        per_collection = []
+        for name, outcome in zip(collections, outcomes):
+            if isinstance(outcome, Exception):
+                print(f"⚠️ 知识库检索失败: {name} - {outcome}")
+                continue
+            per_collection.append((name, outcome))
+        
+        merged = self._merge_results(query, per_collection, top_k or n_results, similarity_threshold)
+        if any(kb.uses_parent_retrieval() for kb in knowledge_bases):
+            # 父段落读取是阻塞的ChromaDB调用，放到线程池执行
+            return await loop.run_in_executor(self._search_executor, self._expand_parents, merged)
+        return merged
+    
+    def grep_many(self, phrase: str, collections: List[str], limit: int = 50,
+                  context: int = 30) -> Dict[str, Any]:
+        """
+        多集合精确短语检索，各集合在线程池中并行查询
+        
+        Args:
+            phrase: 查询短语
+            collections: 集合名称列表
+            limit: 每个集合最多返回的文档块数
+            context: 片段中匹配位置前后保留的字符数
+            
+        Returns:
+            检索结果：query、total、matches（每个结果带source_type）
+        """
+        futures = [
+            (name, self._search_executor.submit(self.get(name).grep, phrase, limit, context))
+            for name in collections
+        ]
+        matches = []
+        total = 0
+        for name, future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"⚠️ 短语检索失败: {name} - {e}")
+                continue
+            total += result["total"]
+            for match in result["matches"]:
+                match["source_type"] = name
+                matches.append(match)
+        
+        return {"query": phrase, "total": total, "matches": matches}
+    
+    def _expand_parents(self, merged: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        启用父子块检索的集合，将归并结果中的子块扩展为父段落（每个集合一次批量读取），保持归并后的排名
+        
+        Args:
+            merged: _merge_results的返回值
+            
+        Returns:
+            扩展后的搜索结果
+        """
+        results = merged["results"]
+        positions_by_collection: Dict[str, List[int]] = {}
+        for position, result in enumerate(results):
+            positions_by_collection.setdefault(result['source_type'], []).append(position)
+        
+        ranked = []
+        for name, positions in positions_by_collection.items():
+            kb = self.get(name)
+            if not kb.uses_parent_retrieval():
+                ranked.extend((position, results[position]) for position in positions)
+                continue
+            # 父段落沿用最佳命中子块的ID，按该子块在归并结果中的位置排序
+            position_by_id = {results[position].get('id'): position for position in positions}
+            for parent in kb.expand_to_parents([results[position] for position in positions]):
+                ranked.append((position_by_id[parent.get('id')], parent))
+        
+        ranked.sort(key=lambda item: item[0])
+        return {**merged, "results": [result for _, result in ranked]}
+    
+    @staticmethod
+    def _search_function(kb: BigModelKnowledgeBase) -> Callable:
+        """单集合检索函数：启用混合检索时为向量 + BM25的RRF融合，否则为纯向量检索"""
+        if Config.RETRIEVAL_CONFIG["hybrid"]:
+            return kb.hybrid_search_by_embedding
+        return kb.search_by_embedding
+    
+    @staticmethod
+    def _merge_results(query: str, per_collection: List[tuple], top_k: int,
+                       similarity_threshold: Optional[float] = None) -> Dict[str, Any]:
+        """
+        归并各集合的结果（各自已按融合分数或相似度降序），近重复内容（SimHash汉明距离在半径内）只保留排名最高的一条
+        
+        低于阈值的结果在归并前丢弃，不占用top_k名额。
+        
+        Args:
+            query: 查询文本
+            per_collection: (集合名, 搜索结果)列表
+            top_k: 保留的结果数
+            similarity_threshold: 相似度阈值，None表示不过滤
+            
+        Returns:
+            归并后的搜索结果
+        """
+        def tagged(name: str, results: List[Dict[str, Any]]):
+            for result in results:
+                if similarity_threshold is not None and result.get('similarity', 0) < similarity_threshold:
+                    continue
+                result['source_type'] = name
+                yield result
+        
+        # 混合检索结果按RRF分数归并（各集合使用相同的k，分数可比），否则按相似度
+        merged = heapq.merge(
+            *(tagged(name, result["results"]) for name, result in per_collection),
+            key=lambda item: -item.get('rrf_score', item.get('similarity', 0))
+        )
+        
+        final_results = collapse_near_duplicates(
+            merged, Config.RETRIEVAL_CONFIG["near_duplicate_distance"], limit=top_k
+        )
+        
+        return {"query": query, "results": final_results}
+
+
+# 全局注册表实例
+knowledge_base_registry = None
+_registry_lock = threading.Lock()
+
+def get_knowledge_base_registry(api_key: str = None) -> KnowledgeBaseRegistry:
+    """获取全局知识库注册表实例（api_key仅在首次创建时使用）"""
+    global knowledge_base_registry
+    with _registry_lock:
+        if knowledge_base_registry is None:
+            knowledge_base_registry = KnowledgeBaseRegistry(api_key)
+    return knowledge_base_registry
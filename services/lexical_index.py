@@ -0,0 +1,183 @@
+"""
+BM25词法索引
+中文按字二元组（bigram）切分，英文/数字保留完整词（如"gb"、"50010"、"8.2.1"、"0.3m/s"），
+标准编号额外生成连写词（"GB 50010" → "gb50010"，"GB/T 50010" → "gbt50010"），弥补稠密向量对精确编号、条款号和数值的模糊匹配
+"""
+
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+# 中日韩字符连续片段
+_CJK_RUN_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+# 英文/数字词，允许内部的小数点和斜杠（如8.2.1、0.3m/s）
+_ASCII_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[./][a-z0-9]+)*")
+# 标准编号：字母前缀（可带"/T"等推荐性标记）+ 可选空格 + 数字（如GB 50010、GB/T 50010、JGJ130）
+_CODE_PATTERN = re.compile(r"(?<![a-z])([a-z]{1,4}(?:/[a-z])?)[\s/]*(\d{3,})")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    切分文本为BM25词项
+    
+    Args:
+        text: 输入文本
+    
+    Returns:
+        词项列表（含重复）
+    """
+    text = text.lower()
+    tokens = []
+    for run in _CJK_RUN_PATTERN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(_ASCII_TOKEN_PATTERN.findall(text))
+    tokens.extend(prefix.replace("/", "") + number for prefix, number in _CODE_PATTERN.findall(text))
+    return tokens
+
+
+class BM25Index:
+    """增量维护的BM25倒排索引"""
+    
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        初始化空索引
+        
+        Args:
+            k1: 词频饱和参数
+            b: 文档长度归一化参数
+        """
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}  # 词项 → {文档ID: 词频}
+        self._doc_terms: Dict[str, Counter] = {}  # 文档ID → 词频（删除时定位倒排项）
+        self._doc_lengths: Dict[str, int] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+    
+    def load_from_collection(self, collection, batch_size: int = 5000) -> int:
+        """
+        从ChromaDB集合分页读取全部文档建立索引
+        
+        Args:
+            collection: ChromaDB集合
+            batch_size: 每页读取条数
+        
+        Returns:
+            索引的文档数
+        """
+        self.clear()
+        offset = 0
+        while True:
+            page = collection.get(include=['documents'], limit=batch_size, offset=offset)
+            if not page['ids']:
+                break
+            self.add(page['ids'], page['documents'])
+            offset += len(page['ids'])
+            if len(page['ids']) < batch_size:
+                break
+        return len(self)
+    
+    def add(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]] = None):
+        """添加或替换文档（metadatas仅为与其他索引接口一致，不使用）"""
+        with self._lock:
+            for doc_id, document in zip(ids, documents):
+                self._remove_locked(doc_id)
+                terms = Counter(tokenize(document or ""))
+                for term, frequency in terms.items():
+                    self._postings.setdefault(term, {})[doc_id] = frequency
+                length = sum(terms.values())
+                self._doc_terms[doc_id] = terms
+                self._doc_lengths[doc_id] = length
+                self._total_length += length
+    
+    def remove(self, ids: List[str]):
+        """删除文档"""
+        with self._lock:
+            for doc_id in ids:
+                self._remove_locked(doc_id)
+    
+    def _remove_locked(self, doc_id: str):
+        """删除单个文档（调用方持有锁）"""
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(doc_id)
+    
+    def clear(self):
+        """清空索引"""
+        with self._lock:
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_lengths.clear()
+            self._total_length = 0
+    
+    def search(self, query: str, n_results: int = 10) -> List[Tuple[str, float]]:
+        """
+        BM25检索
+        
+        Args:
+            query: 查询文本
+            n_results: 返回结果数量
+        
+        Returns:
+            (文档ID, BM25分数)列表，按分数降序，只包含至少命中一个词项的文档
+        """
+        query_terms = set(tokenize(query))
+        scores: Dict[str, float] = {}
+        
+        with self._lock:
+            doc_count = len(self._doc_lengths)
+            if not doc_count or not query_terms:
+                return []
+            average_length = self._total_length / doc_count or 1.0
+            
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        
+        return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取索引统计"""
+        return {
+            "documents": len(self._doc_lengths),
+            "terms": len(self._postings)
+        }
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> Dict[str, float]:
+    """
+    倒数排名融合（RRF）：score(d) = Σ 1 / (k + rank)，rank从1开始
+    
+    Args:
+        rankings: 多路检索的文档ID排名列表
+        k: 平滑常数
+    
+    Returns:
+        文档ID → 融合分数
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return fused
@@ -4,12 +4,22 @@ from typing import List, Dict, Optional
 from datetime import datetime
 import json
 import re
+import hashlib
 from core.config import Config
 from core.models import DocumentSource, AnswerResponse
+from services.embedding_cache import QueryEmbeddingCache
+from services.single_flight import SingleFlight
+from services.token_utils import count_tokens_batch, truncate_to_tokens
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 合并并发的相同问答请求
+_answer_flight = SingleFlight()
+
+# 单篇参考文档至少保留的内容token数，剩余预算不足时不再加入截断得过短的文档
+MIN_SOURCE_CONTEXT_TOKENS = 64
+
 class LLMService:
     """DeepSeek大语言模型服务"""
     
@@ -32,7 +42,33 @@ class LLMService:
                        question: str, 
                        sources: List[DocumentSource],
                        context_history: Optional[List[Dict]] = None) -> AnswerResponse:
-        """根据检索到的文档生成答案"""
+        """
+        根据检索到的文档生成答案
+        
+        问题（规范化后）、检索来源和对话历史都相同的并发请求共享同一次DeepSeek调用，
+        每个调用者拿到各自的响应副本。
+        """
+        key = self._answer_flight_key(question, sources, context_history)
+        response = _answer_flight.do(key, self._generate_answer, question, sources, context_history)
+        return response.model_copy(deep=True)
+    
+    @staticmethod
+    def _answer_flight_key(question: str,
+                           sources: List[DocumentSource],
+                           context_history: Optional[List[Dict]]) -> str:
+        """生成问答请求的合并键"""
+        payload = json.dumps({
+            "question": QueryEmbeddingCache.normalize_query(question),
+            "sources": [source.content for source in sources],
+            "history": [(msg.get("role"), msg.get("content")) for msg in (context_history or [])[-6:]]
+        }, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def _generate_answer(self, 
+                        question: str, 
+                        sources: List[DocumentSource],
+                        context_history: Optional[List[Dict]] = None) -> AnswerResponse:
+        """调用DeepSeek生成答案"""
         try:
             logger.info(f"生成答案 - 问题: {question}")
             
@@ -76,25 +112,47 @@ class LLMService:
             return self._create_error_response(question, str(e))
     
     def _build_context(self, sources: List[DocumentSource]) -> str:
-        """构建上下文信息"""
+        """
+        构建上下文信息
+        
+        按相关度顺序将文档装入token预算（context_max_tokens）：放得下的文档保留全文，
+        第一篇放不下的文档截断到剩余预算，之后的文档不再加入。
+        """
         if not sources:
             return "未找到相关的规范或图纸信息。"
         
-        context_parts = []
-        for i, source in enumerate(sources):
-            # 截取内容的前800字符，避免过长
-            content_preview = source.content[:800] + "..." if len(source.content) > 800 else source.content
-            
-            context_part = f"""
+        headers = [
+            f"""
 【参考文档 {i+1}】
 文件名: {source.file_name}
 规范编号: {source.regulation_code or "未指定"}
 章节: {source.section or "未指定"}
 相关度: {source.similarity_score:.2f}
 文档内容:
-{content_preview}
 """
-            context_parts.append(context_part)
+            for i, source in enumerate(sources)
+        ]
+        header_tokens = count_tokens_batch(headers)
+        content_tokens = count_tokens_batch([source.content for source in sources])
+        
+        remaining = self.config.get_deepseek_config()["context_max_tokens"]
+        context_parts = []
+        for header, header_count, source, content_count in zip(headers, header_tokens, sources, content_tokens):
+            available = remaining - header_count
+            if available < MIN_SOURCE_CONTEXT_TOKENS:
+                break
+            
+            if content_count <= available:
+                content, used = source.content, content_count
+            else:
+                # 预留省略号的1个token
+                content = truncate_to_tokens(source.content, available - 1, token_count=content_count) + "..."
+                used = available
+            context_parts.append(f"{header}{content}\n")
+            remaining -= header_count + used
+        
+        if len(context_parts) < len(sources):
+            logger.info(f"上下文token预算已用尽，装入 {len(context_parts)}/{len(sources)} 篇参考文档")
         
         return "\n".join(context_parts)
     
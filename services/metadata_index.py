@@ -0,0 +1,132 @@
+"""
+元数据二级索引
+为指定的元数据字段维护 值 → 文档块ID集合 的映射，带过滤条件的检索先按元数据求出候选块，
+再只在候选块内按向量相似度排序，候选规模只与过滤结果有关，不随项目数量增长
+"""
+
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+
+class MetadataIndex:
+    """增量维护的元数据倒排索引"""
+    
+    def __init__(self, fields: Iterable[str]):
+        """
+        初始化空索引
+        
+        Args:
+            fields: 建立索引的元数据字段
+        """
+        self.fields = list(fields)
+        self._postings: Dict[str, Dict[Any, Set[str]]] = {field: {} for field in self.fields}
+        self._doc_values: Dict[str, Dict[str, Any]] = {}  # 文档ID → 已索引的字段值（删除时定位倒排项）
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._doc_values)
+    
+    def load_from_collection(self, collection, batch_size: int = 5000) -> int:
+        """
+        从ChromaDB集合分页读取全部元数据建立索引
+        
+        Args:
+            collection: ChromaDB集合
+            batch_size: 每页读取条数
+        
+        Returns:
+            索引的文档数
+        """
+        self.clear()
+        offset = 0
+        while True:
+            page = collection.get(include=['metadatas'], limit=batch_size, offset=offset)
+            if not page['ids']:
+                break
+            self.add(page['ids'], None, page['metadatas'])
+            offset += len(page['ids'])
+            if len(page['ids']) < batch_size:
+                break
+        return len(self)
+    
+    def add(self, ids: List[str], documents: Optional[List[str]], metadatas: List[Dict[str, Any]]):
+        """添加或替换文档的元数据（documents仅为与其他索引接口一致，不使用）"""
+        with self._lock:
+            for doc_id, metadata in zip(ids, metadatas):
+                self._remove_locked(doc_id)
+                values = {
+                    field: metadata[field]
+                    for field in self.fields
+                    if metadata and metadata.get(field) is not None
+                }
+                for field, value in values.items():
+                    self._postings[field].setdefault(value, set()).add(doc_id)
+                self._doc_values[doc_id] = values
+    
+    def remove(self, ids: List[str]):
+        """删除文档"""
+        with self._lock:
+            for doc_id in ids:
+                self._remove_locked(doc_id)
+    
+    def _remove_locked(self, doc_id: str):
+        """删除单个文档（调用方持有锁）"""
+        values = self._doc_values.pop(doc_id, None)
+        if not values:
+            return
+        for field, value in values.items():
+            doc_ids = self._postings[field].get(value)
+            if doc_ids is not None:
+                doc_ids.discard(doc_id)
+                if not doc_ids:
+                    del self._postings[field][value]
+    
+    def clear(self):
+        """清空索引"""
+        with self._lock:
+            for postings in self._postings.values():
+                postings.clear()
+            self._doc_values.clear()
+    
+    def lookup(self, filters: Dict[str, Any]) -> Set[str]:
+        """
+        按过滤条件求候选文档ID
+        
+        Args:
+            filters: 字段 → 值；值为列表时表示取其中任一值，多个字段之间取交集
+        
+        Returns:
+            满足全部条件的文档ID集合
+        """
+        unknown = [field for field in filters if field not in self._postings]
+        if unknown:
+            raise ValueError(f"元数据字段未建立索引: {unknown}")
+        
+        with self._lock:
+            candidate_sets = []
+            for field, value in filters.items():
+                values = value if isinstance(value, (list, tuple, set)) else [value]
+                matched = set()
+                for item in values:
+                    matched |= self._postings[field].get(item, set())
+                candidate_sets.append(matched)
+        
+        if not candidate_sets:
+            return set(self._doc_values)
+        candidate_sets.sort(key=len)
+        candidates = set(candidate_sets[0])
+        for doc_ids in candidate_sets[1:]:
+            candidates &= doc_ids
+        return candidates
+    
+    def values(self, field: str) -> Dict[Any, int]:
+        """字段的全部取值及对应文档块数"""
+        with self._lock:
+            return {value: len(doc_ids) for value, doc_ids in self._postings.get(field, {}).items()}
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取索引统计"""
+        return {
+            "documents": len(self._doc_values),
+            "fields": {field: len(postings) for field, postings in self._postings.items()}
+        }
@@ -0,0 +1,167 @@
+"""
+父子块检索
+集合按较小的子块建立索引（向量更精确），检索命中子块后按chunk_index取其前后相邻的子块，
+同一文件内重叠或相接的窗口合并为一个父段落，拼接时去掉相邻子块之间的重叠文本。
+全部父段落的子块用一次带$or过滤条件的collection.get取回
+"""
+
+from typing import Any, Dict, List, Optional
+
+# 判定相邻子块重叠的最短公共文本长度（过短容易把恰好相同的标点、词语误判为重叠）
+MIN_OVERLAP_CHARS = 8
+# 查找重叠时只检查上一块末尾的字符数
+MAX_OVERLAP_CHARS = 2000
+
+
+def plan_parents(results: List[Dict[str, Any]], window: int, max_chunks: int) -> List[Dict[str, Any]]:
+    """
+    为命中的子块规划父段落窗口
+    
+    Args:
+        results: 按相关性降序排列的子块结果（含metadata.source_file和metadata.chunk_index）
+        window: 命中子块前后各取的相邻子块数
+        max_chunks: 合并后父段落最多包含的子块数
+    
+    Returns:
+        按最佳命中排名排序的计划列表：{source_file, start, end（含）, hits: [子块结果]}；
+        缺少来源文件或块序号的结果单独成项，start为None
+    """
+    windows_by_file: Dict[str, List[tuple]] = {}
+    plans = []
+    for rank, result in enumerate(results):
+        metadata = result.get("metadata") or {}
+        source_file = metadata.get("source_file")
+        chunk_index = metadata.get("chunk_index")
+        if source_file is None or not isinstance(chunk_index, int):
+            plans.append({
+                "rank": rank, "source_file": source_file, "start": None, "end": None, "hits": [(rank, result)]
+            })
+            continue
+        
+        start = max(0, chunk_index - window)
+        end = chunk_index + window
+        chunk_count = metadata.get("chunk_count")
+        if isinstance(chunk_count, int) and chunk_count > 0:
+            end = min(end, chunk_count - 1)
+        windows_by_file.setdefault(source_file, []).append((start, end, rank, result))
+    
+    # 同一文件内按起点排序，重叠或相接的窗口合并（合并后不超过max_chunks个子块）
+    for source_file, windows in windows_by_file.items():
+        windows.sort(key=lambda item: (item[0], item[1]))
+        current = None
+        for start, end, rank, result in windows:
+            mergeable = current is not None and start <= current["end"] + 1 and \
+                max(end, current["end"]) - current["start"] < max_chunks
+            if mergeable:
+                current["end"] = max(current["end"], end)
+                current["rank"] = min(current["rank"], rank)
+                current["hits"].append((rank, result))
+                continue
+            current = {"rank": rank, "source_file": source_file, "start": start, "end": end, "hits": [(rank, result)]}
+            plans.append(current)
+    
+    plans.sort(key=lambda plan: plan["rank"])
+    for plan in plans:
+        # 命中子块按排名排序，第一个为最佳命中
+        plan["hits"] = [result for _, result in sorted(plan["hits"], key=lambda hit: hit[0])]
+        del plan["rank"]
+    return plans
+
+
+def parents_where(plans: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    取回全部父段落子块的ChromaDB过滤条件
+    
+    Returns:
+        where条件，没有需要取回的窗口时为None
+    """
+    clauses = [
+        {"$and": [
+            {"source_file": plan["source_file"]},
+            {"chunk_index": {"$gte": plan["start"]}},
+            {"chunk_index": {"$lte": plan["end"]}}
+        ]}
+        for plan in plans
+        if plan["start"] is not None
+    ]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def _strip_overlap(previous: str, current: str) -> Optional[str]:
+    """
+    去掉current开头与previous末尾重叠的部分
+    
+    Returns:
+        去重后的current；两块之间没有重叠时为None
+    """
+    if len(current) < MIN_OVERLAP_CHARS:
+        return None
+    probe = current[:MIN_OVERLAP_CHARS]
+    # 最早的匹配位置对应最长的重叠
+    position = previous.find(probe, max(0, len(previous) - MAX_OVERLAP_CHARS))
+    while position != -1:
+        suffix_length = len(previous) - position
+        if current.startswith(previous[position:]):
+            return current[suffix_length:]
+        position = previous.find(probe, position + 1)
+    return None
+
+
+def join_chunks(chunks: List[str]) -> str:
+    """按顺序拼接相邻子块，去掉块间重叠文本；不重叠的块之间以换行分隔"""
+    if not chunks:
+        return ""
+    parts = [chunks[0]]
+    for previous, current in zip(chunks, chunks[1:]):
+        remainder = _strip_overlap(previous, current)
+        parts.append(remainder if remainder is not None else "\n" + current)
+    return "".join(parts)
+
+
+def assemble_parents(plans: List[Dict[str, Any]], fetched: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    用取回的子块拼出父段落结果
+    
+    每个父段落沿用排名最高的命中子块的字段（id、相似度、融合分数、来源集合等），
+    content替换为父段落全文，并附加parent信息：起止块序号和命中的子块ID（起止块序号同时写入metadata的副本）。
+    
+    Args:
+        plans: plan_parents的返回值
+        fetched: collection.get的返回值（含ids、documents、metadatas）
+    
+    Returns:
+        父段落结果列表（顺序同plans）
+    """
+    chunks_by_file: Dict[str, Dict[int, str]] = {}
+    for document, metadata in zip(fetched.get("documents") or [], fetched.get("metadatas") or []):
+        metadata = metadata or {}
+        chunk_index = metadata.get("chunk_index")
+        if isinstance(chunk_index, int):
+            chunks_by_file.setdefault(metadata.get("source_file"), {}).setdefault(chunk_index, document)
+    
+    parents = []
+    for plan in plans:
+        best = plan["hits"][0]
+        if plan["start"] is None:
+            parents.append(best)
+            continue
+        
+        chunks = chunks_by_file.get(plan["source_file"], {})
+        indices = [index for index in range(plan["start"], plan["end"] + 1) if index in chunks]
+        parent = dict(best)
+        if indices:
+            parent["content"] = join_chunks([chunks[index] for index in indices])
+        parent["parent"] = {
+            "chunk_start": indices[0] if indices else plan["start"],
+            "chunk_end": indices[-1] if indices else plan["end"],
+            "hit_ids": [hit.get("id") for hit in plan["hits"]]
+        }
+        parent["metadata"] = {
+            **(best.get("metadata") or {}),
+            "parent_chunk_start": parent["parent"]["chunk_start"],
+            "parent_chunk_end": parent["parent"]["chunk_end"]
+        }
+        parents.append(parent)
+    return parents
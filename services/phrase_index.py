@@ -0,0 +1,195 @@
+"""
+N-gram短语索引
+对全部文档块按字符二元组建立倒排索引，短语查询时先按各二元组的倒排表求交得到候选块，
+再在候选块内定位全部精确出现位置。查找精确数值要求（如"0.3m/s"）或条款原文时
+无需像where_document $contains那样扫描全表。
+每个文档块只保存一份原文，删除留下的空槽位超过一半时整体重新编号回收
+"""
+
+import threading
+from typing import Any, Dict, List
+
+# 索引使用的字符n-gram长度
+NGRAM_SIZE = 2
+# 空槽位达到该数量且超过全部槽位的该比例时回收
+COMPACT_MIN_FREE_SLOTS = 1024
+COMPACT_RATIO = 0.5
+
+
+def _grams(text: str) -> set:
+    """文本的全部字符n-gram（已转小写）"""
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+class NgramPhraseIndex:
+    """增量维护的字符n-gram倒排索引"""
+    
+    def __init__(self):
+        self._documents: List[str] = []  # 槽位 → 原文（删除后为None，查询时对候选块转小写匹配）
+        self._ids: List[str] = []
+        self._slots: Dict[str, int] = {}  # 文档ID → 槽位
+        self._postings: Dict[str, set] = {}  # n-gram → 槽位集合
+        self._compactions = 0
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._slots)
+    
+    def load_from_collection(self, collection, batch_size: int = 5000) -> int:
+        """
+        从ChromaDB集合分页读取全部文档建立索引
+        
+        Args:
+            collection: ChromaDB集合
+            batch_size: 每页读取条数
+        
+        Returns:
+            索引的文档数
+        """
+        self.clear()
+        offset = 0
+        while True:
+            page = collection.get(include=['documents'], limit=batch_size, offset=offset)
+            if not page['ids']:
+                break
+            self.add(page['ids'], page['documents'])
+            offset += len(page['ids'])
+            if len(page['ids']) < batch_size:
+                break
+        return len(self)
+    
+    def add(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]] = None):
+        """添加或替换文档（metadatas仅为与其他索引接口一致，不使用）"""
+        with self._lock:
+            for doc_id, document in zip(ids, documents):
+                self._remove_locked(doc_id)
+                document = document or ""
+                slot = len(self._documents)
+                self._documents.append(document)
+                self._ids.append(doc_id)
+                self._slots[doc_id] = slot
+                for gram in _grams(document.lower()):
+                    self._postings.setdefault(gram, set()).add(slot)
+            self._compact_locked()
+    
+    def remove(self, ids: List[str]):
+        """删除文档"""
+        with self._lock:
+            for doc_id in ids:
+                self._remove_locked(doc_id)
+            self._compact_locked()
+    
+    def _remove_locked(self, doc_id: str):
+        """删除单个文档（调用方持有锁），槽位留空，由_compact_locked统一回收"""
+        slot = self._slots.pop(doc_id, None)
+        if slot is None:
+            return
+        for gram in _grams(self._documents[slot].lower()):
+            slots = self._postings.get(gram)
+            if slots is not None:
+                slots.discard(slot)
+                if not slots:
+                    del self._postings[gram]
+        self._documents[slot] = None
+        self._ids[slot] = None
+    
+    def _compact_locked(self):
+        """空槽位过多时回收：存活文档按原顺序重新编号，倒排表随之改写（调用方持有锁）"""
+        free = len(self._documents) - len(self._slots)
+        if free < COMPACT_MIN_FREE_SLOTS or free < len(self._documents) * COMPACT_RATIO:
+            return
+        
+        remap = {}
+        documents, ids = [], []
+        for slot, document in enumerate(self._documents):
+            if document is None:
+                continue
+            remap[slot] = len(documents)
+            documents.append(document)
+            ids.append(self._ids[slot])
+        
+        self._postings = {gram: {remap[slot] for slot in slots} for gram, slots in self._postings.items()}
+        self._documents, self._ids = documents, ids
+        self._slots = {doc_id: slot for slot, doc_id in enumerate(ids)}
+        self._compactions += 1
+    
+    def clear(self):
+        """清空索引"""
+        with self._lock:
+            self._documents.clear()
+            self._ids.clear()
+            self._slots.clear()
+            self._postings.clear()
+    
+    def search(self, phrase: str, limit: int = 50, context: int = 30) -> Dict[str, Any]:
+        """
+        精确短语检索（不区分大小写）
+        
+        Args:
+            phrase: 查询短语
+            limit: 最多返回的文档块数
+            context: 片段中匹配位置前后保留的字符数
+        
+        Returns:
+            matches: [{id, offsets: [[开始, 结束]], snippets: [{text, highlight: [开始, 结束]}]}]，
+            total: 命中的文档块总数
+        """
+        needle = phrase.lower()
+        if not needle:
+            return {"matches": [], "total": 0}
+        
+        with self._lock:
+            if len(needle) >= NGRAM_SIZE:
+                # 按倒排表从短到长求交
+                posting_lists = sorted(
+                    (self._postings.get(gram, set()) for gram in _grams(needle)),
+                    key=len
+                )
+                candidates = set(posting_lists[0])
+                for slots in posting_lists[1:]:
+                    if not candidates:
+                        break
+                    candidates &= slots
+            else:
+                candidates = set(self._slots.values())
+            
+            matches = []
+            total = 0
+            for slot in sorted(candidates):
+                original = self._documents[slot]
+                text = original.lower()
+                offsets = []
+                start = text.find(needle)
+                while start != -1:
+                    offsets.append([start, start + len(needle)])
+                    start = text.find(needle, start + 1)
+                if not offsets:
+                    continue
+                total += 1
+                if len(matches) >= limit:
+                    continue
+                
+                snippets = []
+                for begin, end in offsets:
+                    snippet_start = max(0, begin - context)
+                    snippets.append({
+                        "text": original[snippet_start:end + context],
+                        "highlight": [begin - snippet_start, end - snippet_start]
+                    })
+                matches.append({
+                    "id": self._ids[slot],
+                    "content_length": len(original),
+                    "offsets": offsets,
+                    "snippets": snippets
+                })
+        
+        return {"matches": matches, "total": total}
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取索引统计"""
+        return {
+            "documents": len(self._slots),
+            "grams": len(self._postings),
+            "free_slots": len(self._documents) - len(self._slots),
+            "compactions": self._compactions
+        }
@@ -0,0 +1,59 @@
+"""
+客户端令牌桶限流器
+用于将外部API调用速率控制在配额以内，线程安全，同时支持同步和异步等待
+"""
+
+import asyncio
+import threading
+import time
+
+
+class TokenBucketRateLimiter:
+    """令牌桶限流器"""
+    
+    def __init__(self, rate_per_second: float, capacity: float = None):
+        """
+        初始化限流器
+        
+        Args:
+            rate_per_second: 每秒补充的令牌数（即稳定速率）
+            capacity: 桶容量（允许的突发请求数），默认等于rate_per_second
+        """
+        if rate_per_second <= 0:
+            raise ValueError("rate_per_second必须大于0")
+        
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity or max(1.0, rate_per_second)
+        
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _reserve(self, tokens: float) -> float:
+        """
+        预留令牌，返回需要等待的秒数
+        
+        令牌不足时余额会变为负数，后续调用者自动排在其后等待。
+        """
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated_at
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate_per_second)
+            self._updated_at = now
+            
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate_per_second
+    
+    def acquire(self, tokens: float = 1) -> None:
+        """阻塞直到获得令牌"""
+        wait_seconds = self._reserve(tokens)
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+    
+    async def acquire_async(self, tokens: float = 1) -> None:
+        """异步等待直到获得令牌"""
+        wait_seconds = self._reserve(tokens)
+        if wait_seconds > 0:
+            await asyncio.sleep(wait_seconds)
@@ -0,0 +1,114 @@
+"""
+SimHash近重复检测
+对文本的字符shingle计算64位SimHash指纹，内容基本相同的文档块（如法规库和regulations目录中的同一条文、
+重叠比例很高的相邻窗口）指纹的汉明距离很小。入库时写入元数据，检索时按汉明半径折叠近重复结果
+"""
+
+import hashlib
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# 指纹位数
+FINGERPRINT_BITS = 64
+# 字符shingle长度
+SHINGLE_SIZE = 3
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_BIT_POSITIONS = np.arange(FINGERPRINT_BITS, dtype=np.uint64)
+
+
+def _shingle_hash(shingle: str) -> int:
+    """shingle的64位哈希"""
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text: str) -> int:
+    """
+    计算文本的64位SimHash指纹（忽略空白差异）
+    
+    Args:
+        text: 输入文本
+    
+    Returns:
+        指纹整数
+    """
+    text = _WHITESPACE_PATTERN.sub("", text or "").lower()
+    if len(text) < SHINGLE_SIZE:
+        shingles = {text: 1} if text else {}
+    else:
+        shingles = {}
+        for i in range(len(text) - SHINGLE_SIZE + 1):
+            shingle = text[i:i + SHINGLE_SIZE]
+            shingles[shingle] = shingles.get(shingle, 0) + 1
+    
+    if not shingles:
+        return 0
+    
+    # 各shingle哈希的每一位按出现次数加权投票（+1/-1），用numpy一次算完
+    hashes = np.fromiter((_shingle_hash(shingle) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    counts = np.fromiter(shingles.values(), dtype=np.int64, count=len(shingles))
+    bits = (hashes[:, None] >> _BIT_POSITIONS) & np.uint64(1)
+    weights = counts @ (bits.astype(np.int64) * 2 - 1)
+    
+    fingerprint = 0
+    for bit in np.flatnonzero(weights > 0):
+        fingerprint |= 1 << int(bit)
+    return fingerprint
+
+
+def simhash_hex(text: str) -> str:
+    """SimHash指纹的16位十六进制字符串（ChromaDB元数据不支持无符号64位整数）"""
+    return f"{simhash(text):016x}"
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """两个指纹的汉明距离"""
+    return bin(a ^ b).count("1")
+
+
+def _result_fingerprint(result: Dict[str, Any]) -> int:
+    """取结果元数据中的指纹，旧数据没有指纹时按内容现算"""
+    value = (result.get("metadata") or {}).get("simhash")
+    if value:
+        return int(value, 16)
+    return simhash(result.get("content", ""))
+
+
+def collapse_near_duplicates(results: List[Dict[str, Any]], max_distance: int,
+                             limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    按汉明半径折叠近重复结果，保留排名靠前的一条
+    
+    被折叠的结果记录到保留结果的near_duplicates中（来源文件和相似度），便于展示多个出处。
+    
+    Args:
+        results: 已按相关性降序排列的结果（含content和metadata）
+        max_distance: 汉明距离不超过此值视为近重复
+        limit: 保留的结果数上限
+    
+    Returns:
+        去重后的结果
+    """
+    kept = []
+    fingerprints = []
+    for result in results:
+        fingerprint = _result_fingerprint(result)
+        duplicate_of = next(
+            (i for i, existing in enumerate(fingerprints) if hamming_distance(fingerprint, existing) <= max_distance),
+            None
+        )
+        if duplicate_of is not None:
+            kept[duplicate_of].setdefault("near_duplicates", []).append({
+                "source_file": (result.get("metadata") or {}).get("source_file"),
+                "similarity": result.get("similarity"),
+                "source_type": result.get("source_type")
+            })
+            continue
+        
+        kept.append(result)
+        fingerprints.append(fingerprint)
+        if limit is not None and len(kept) >= limit:
+            break
+    return kept
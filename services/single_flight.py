@@ -0,0 +1,98 @@
+"""
+Single-flight请求合并
+同一键的并发调用只执行一次上游请求，其余调用者等待并共享同一结果。
+异步调用只在同一事件循环内合并（任务不能被其他事件循环等待）
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """按键合并进行中的相同调用"""
+    
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._async_calls: Dict[tuple, "asyncio.Task"] = {}  # (事件循环, 合并键) → 任务
+        self._lock = threading.Lock()
+        
+        self.executed = 0
+        self.shared = 0
+    
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        执行同步调用，若相同键的调用正在进行则等待其结果
+        
+        Args:
+            key: 合并键
+            fn: 实际执行的函数
+        
+        Returns:
+            fn的返回值（并发调用者共享同一结果）
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._calls[key] = future
+                self.executed += 1
+            else:
+                self.shared += 1
+        
+        if not is_leader:
+            return future.result()
+        
+        try:
+            result = fn(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+    
+    async def do_async(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        执行异步调用，若当前事件循环中相同键的调用正在进行则等待其结果
+        
+        其他事件循环（如工作线程中asyncio.run）的相同调用各自执行，不会等待属于其他循环的任务。
+        
+        Args:
+            key: 合并键
+            fn: 返回协程的函数
+        
+        Returns:
+            协程的结果（并发调用者共享同一结果）
+        """
+        loop_key = (asyncio.get_running_loop(), key)
+        with self._lock:
+            task = self._async_calls.get(loop_key)
+            if task is None:
+                task = asyncio.ensure_future(fn(*args, **kwargs))
+                self._async_calls[loop_key] = task
+                task.add_done_callback(lambda _, done_key=loop_key: self._forget_async(done_key))
+                self.executed += 1
+            else:
+                self.shared += 1
+        
+        # shield: 单个调用者被取消时不影响其他等待者
+        return await asyncio.shield(task)
+    
+    def _forget_async(self, loop_key: tuple):
+        """异步调用完成后移除记录"""
+        with self._lock:
+            self._async_calls.pop(loop_key, None)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并统计"""
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "shared": self.shared,
+                "in_flight": len(self._calls) + len(self._async_calls)
+            }
@@ -0,0 +1,263 @@
+"""
+结构感知文本分割
+一次正则扫描找出全文的章/条/节号标题（"第X条"、"8.2.1"等行首标题），再按窗口贪心切分：
+窗口内优先在条文标题前切分，其次是最后一个换行，再次是最后一个句末标点，都没有时才硬切。
+换行和句末标点用str.rfind在窗口内查找，全文只扫描一遍，不再逐字符回扫。
+在条文标题处切分的块不再向前重叠，保证每块从完整条文开始；块所属的章和条文号一并返回，写入元数据。
+块大小可按字符数计量，也可按token数计量（由累计token数定位窗口边界，每块记录实际token数）
+"""
+
+import re
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.token_utils import count_tokens_batch, token_prefix_counts
+
+# 切分点优先级（数值越大越优先）
+HARD_CUT = 0
+SENTENCE = 1
+NEWLINE = 2
+HEADING = 3
+
+SENTENCE_ENDINGS = "。！？；!?;"
+
+_CN_NUMERALS = "〇零一二三四五六七八九十百千万两"
+_LINE_INDENT = r"[ \t　\xa0]*"
+# 节号（8.2.1、5.10.）：首段1~2位且不以0开头、其余各段1~2位，最多四级，避免把表格中的数值（0.35、150.5）当作标题
+_SECTION_NUMBER = r"[1-9]\d?(?:\.\d{1,2}){1,3}"
+# 节号后须是标题文字（非单位的汉字）或行尾；"1.5 m"、"3.2 kN"、"1.5 米"等数值行不是标题
+_UNIT_CHARS = "米毫厘吨克度秒倍"
+
+# 行首标题：以换行符开头，正则引擎可按字面前缀快速跳过非行首位置（调用方在全文前补一个换行）
+_HEADING_PATTERN = re.compile(
+    rf"\n{_LINE_INDENT}(?:"
+    rf"(?P<chapter>第[{_CN_NUMERALS}\d]+[章节])"
+    rf"|(?P<clause>第[{_CN_NUMERALS}\d]+条)"
+    rf"|(?P<section>{_SECTION_NUMBER})\.?(?=[ \t　\xa0]*(?:(?![{_UNIT_CHARS}])[\u4e00-\u9fff]|\n|$))"
+    r")"
+)
+
+
+def find_headings(content: str) -> Dict[str, Tuple[List[int], List[str]]]:
+    """
+    单次扫描找出全部行首标题
+    
+    Args:
+        content: 文档内容
+    
+    Returns:
+        {"chapter"/"clause": (标题所在行的行首位置列表, 标题列表)}，位置升序；节号（8.2.1）归入clause
+    """
+    headings = {"chapter": ([], []), "clause": ([], [])}
+    # 补在开头的换行使第一行也能匹配，补位后换行符的下标恰好是原文中该行行首的位置
+    for match in _HEADING_PATTERN.finditer("\n" + content):
+        kind = match.lastgroup
+        positions, labels = headings["chapter" if kind == "chapter" else "clause"]
+        positions.append(match.start())
+        labels.append(match.group(kind))
+    return headings
+
+
+def _label_at(headings: Tuple[List[int], List[str]], start: int, end: int,
+              reset_positions: Optional[List[int]] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    块[start, end)所属的标题范围
+    
+    起始标题取块开头处生效的标题（其后出现更高一级标题时视为已结束），没有时取块内第一个标题；
+    结束标题取块内最后一个标题。
+    """
+    positions, labels = headings
+    first = None
+    index = bisect_right(positions, start) - 1
+    if index >= 0:
+        reset = reset_positions and bisect_right(reset_positions, start) > bisect_right(reset_positions, positions[index])
+        if not reset:
+            first = labels[index]
+    
+    inside_start = bisect_left(positions, start)
+    inside_end = bisect_left(positions, end)
+    if first is None and inside_start < inside_end:
+        first = labels[inside_start]
+    last = labels[inside_end - 1] if inside_start < inside_end else first
+    return first, last
+
+
+def _find_cut(content: str, cut_positions: List[int], low: int, high: int) -> Tuple[int, int]:
+    """
+    在(low, high]内选切分位置
+    
+    Returns:
+        (切分位置, 优先级)
+    """
+    index = bisect_right(cut_positions, high) - 1
+    if index >= 0 and cut_positions[index] > low:
+        return cut_positions[index], HEADING
+    
+    newline = content.rfind("\n", low, high)
+    if newline != -1:
+        return newline + 1, NEWLINE
+    
+    sentence_end = max(content.rfind(char, low, high) for char in SENTENCE_ENDINGS)
+    if sentence_end != -1:
+        return sentence_end + 1, SENTENCE
+    return high, HARD_CUT
+
+
+def _find_overlap_start(content: str, low: int, high: int) -> int:
+    """重叠部分从[low, high)内第一个换行或句末标点之后开始，没有时从low开始"""
+    found = [
+        position + 1
+        for position in (content.find(char, low, high - 1) for char in "\n" + SENTENCE_ENDINGS)
+        if position != -1
+    ]
+    return min(found) if found else low
+
+
+def _split(content: str, window_end: Callable[[int], int], min_end: Callable[[int], int],
+           overlap_start: Callable[[int], int], overlap_enabled: bool) -> List[Dict[str, Any]]:
+    """
+    贪心分割主循环（块大小的度量由调用方给出的位置函数决定）
+    
+    Args:
+        content: 文档内容
+        window_end: 块起点 → 块结尾的最大位置
+        min_end: 块起点 → 可切分的最小位置
+        overlap_start: 块结尾 → 下一块重叠部分的最早起点
+        overlap_enabled: 是否在非条文边界处重叠
+    
+    Returns:
+        [{content, start, end, chapter, clause, clause_end}]，不存在的标题字段为None
+    """
+    headings = find_headings(content)
+    chapter_positions = headings["chapter"][0]
+    cut_positions = sorted(set(chapter_positions) | set(headings["clause"][0]))
+    length = len(content)
+    chunks = []
+    start = 0
+    
+    while start < length:
+        limit = max(window_end(start), start + 1)
+        if limit >= length:
+            end, strength = length, HEADING
+        else:
+            end, strength = _find_cut(content, cut_positions, min(min_end(start), limit - 1), limit)
+        
+        raw = content[start:end]
+        text = raw.strip()
+        if text:
+            text_start = start + len(raw) - len(raw.lstrip())
+            text_end = text_start + len(text)
+            chapter, _ = _label_at(headings["chapter"], text_start, text_end)
+            clause, clause_end = _label_at(headings["clause"], text_start, text_end, chapter_positions)
+            chunks.append({
+                "content": text,
+                "start": text_start,
+                "end": text_end,
+                "chapter": chapter,
+                "clause": clause,
+                "clause_end": clause_end
+            })
+        
+        if end >= length:
+            break
+        if strength == HEADING or not overlap_enabled:
+            start = end
+        else:
+            start = _find_overlap_start(content, max(overlap_start(end), start + 1), end)
+    
+    return chunks
+
+
+def split_chunks(content: str, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 min_chunk_size: int = None) -> List[Dict[str, Any]]:
+    """
+    按字符数分割文档
+    
+    Args:
+        content: 文档内容
+        chunk_size: 块大小（字符）
+        chunk_overlap: 非条文边界切分时与上一块的重叠字符数
+        min_chunk_size: 切分点距块开头的最小字符数，默认chunk_size的1/4，避免切出过碎的块
+    
+    Returns:
+        [{content, start, end, chapter, clause, clause_end}]，不存在的标题字段为None
+    """
+    if not content:
+        return []
+    if min_chunk_size is None:
+        min_chunk_size = chunk_size // 4
+    chunk_overlap = min(chunk_overlap, chunk_size - 1)
+    
+    return _split(
+        content,
+        window_end=lambda start: start + chunk_size,
+        min_end=lambda start: start + min_chunk_size,
+        overlap_start=lambda end: end - chunk_overlap,
+        overlap_enabled=chunk_overlap > 0
+    )
+
+
+def split_chunks_by_tokens(content: str, chunk_tokens: int = 512, chunk_overlap_tokens: int = 64,
+                           min_chunk_tokens: int = None) -> List[Dict[str, Any]]:
+    """
+    按token数分割文档（切分点的选择与按字符分割相同），每块附带实际token数
+    
+    Args:
+        content: 文档内容
+        chunk_tokens: 每块的token上限
+        chunk_overlap_tokens: 非条文边界切分时与上一块重叠的token数
+        min_chunk_tokens: 切分点距块开头的最小token数，默认chunk_tokens的1/4
+    
+    Returns:
+        [{content, start, end, chapter, clause, clause_end, token_count}]
+    """
+    if not content:
+        return []
+    if min_chunk_tokens is None:
+        min_chunk_tokens = chunk_tokens // 4
+    chunk_overlap_tokens = min(chunk_overlap_tokens, chunk_tokens - 1)
+    counts = token_prefix_counts(content)
+    
+    chunks = _split(
+        content,
+        window_end=lambda start: int(np.searchsorted(counts, counts[start] + chunk_tokens, side="right")) - 1,
+        min_end=lambda start: int(np.searchsorted(counts, counts[start] + min_chunk_tokens, side="left")),
+        overlap_start=lambda end: int(np.searchsorted(counts, counts[end] - chunk_overlap_tokens, side="left")),
+        overlap_enabled=chunk_overlap_tokens > 0
+    )
+    # 切分边界处的token可能被重新切分，按块实际内容重新计数
+    for chunk, token_count in zip(chunks, count_tokens_batch([chunk["content"] for chunk in chunks])):
+        chunk["token_count"] = token_count
+    return chunks
+
+
+def split_with_config(content: str, chunking: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    按分块配置（Config.get_chunking_config的返回值）选择按字符或按token分割
+    
+    Args:
+        content: 文档内容
+        chunking: 分块配置
+    
+    Returns:
+        分割结果，格式同split_chunks / split_chunks_by_tokens
+    """
+    if chunking["chunk_unit"] == "token":
+        return split_chunks_by_tokens(content, chunking["chunk_tokens"], chunking["chunk_overlap_tokens"])
+    return split_chunks(content, chunking["chunk_size"], chunking["chunk_overlap"])
+
+
+def split_text(content: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
+    """按结构分割文档，只返回块内容"""
+    return [chunk["content"] for chunk in split_chunks(content, chunk_size, chunk_overlap)]
+
+
+def chunk_metadata(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """块的结构元数据（ChromaDB元数据不接受None，缺失字段不写入）"""
+    return {
+        key: chunk[key]
+        for key in ("chapter", "clause", "clause_end", "token_count")
+        if chunk.get(key)
+    }
@@ -0,0 +1,135 @@
+"""
+Token计数工具
+优先使用tiktoken精确计数；tiktoken未安装或编码文件无法加载（如离线环境）时，
+退化为按字符类型估算（中日韩字符每字约1个token，其余约每4个字符1个token）
+"""
+
+import re
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+# tiktoken使用的编码名称
+ENCODING_NAME = "cl100k_base"
+
+# 中日韩字符（每字按1个token估算）
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+# 与_CJK_PATTERN相同的码位区间（向量化估算用）
+_CJK_RANGES = ((0x3000, 0x303f), (0x3400, 0x4dbf), (0x4e00, 0x9fff), (0xf900, 0xfaff), (0xff00, 0xffef))
+
+
+def _get_encoding():
+    """懒加载tiktoken编码器，失败时返回None并只提示一次"""
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return _encoding
+    
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(ENCODING_NAME)
+            except Exception as e:
+                print(f"⚠️ tiktoken编码器不可用({type(e).__name__})，使用字符数估算token")
+                _encoding = None
+            _encoding_loaded = True
+    return _encoding
+
+
+def _estimate_tokens(text: str) -> int:
+    """按字符类型估算token数"""
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + (other_count + 3) // 4
+
+
+def count_tokens(text: str) -> int:
+    """
+    计算文本的token数
+    
+    Args:
+        text: 输入文本
+    
+    Returns:
+        token数（至少为1）
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = len(encoding.encode(text, disallowed_special=()))
+    else:
+        tokens = _estimate_tokens(text)
+    return max(1, tokens)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, token_count: Optional[int] = None) -> str:
+    """
+    将文本截断到不超过max_tokens个token
+    
+    Args:
+        text: 输入文本
+        max_tokens: token上限
+        token_count: 已知的文本token数，传入可避免重复计数
+    
+    Returns:
+        截断后的文本（未超限时原样返回）
+    """
+    if token_count is None:
+        token_count = count_tokens(text)
+    if token_count <= max_tokens:
+        return text
+    
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        # 截断点可能落在多字节字符中间，逐步回退直到能完整解码
+        end = max_tokens
+        while end > 0:
+            try:
+                return encoding.decode_bytes(tokens[:end]).decode("utf-8")
+            except UnicodeDecodeError:
+                end -= 1
+        return ""
+    
+    # 估算模式：按比例粗切后逐步收缩
+    end = int(len(text) * max_tokens / token_count)
+    while end > 0 and _estimate_tokens(text[:end]) > max_tokens:
+        end -= max(1, (end // 100))
+    return text[:max(0, end)]
+
+
+def count_tokens_batch(texts: List[str]) -> List[int]:
+    """批量计算token数"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return [max(1, len(tokens)) for tokens in encoding.encode_batch(texts, disallowed_special=())]
+    return [max(1, _estimate_tokens(text)) for text in texts]
+
+
+def token_prefix_counts(text: str) -> np.ndarray:
+    """
+    每个字符位置之前的累计token数，用于按token预算定位切分位置
+    
+    Args:
+        text: 输入文本
+    
+    Returns:
+        长度为len(text)+1的非递减数组，[start, end)区间约含counts[end] - counts[start]个token
+        （tiktoken按起始字符位于区间内的token计数；估算模式为小数）
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        _, offsets = encoding.decode_with_offsets(encoding.encode(text, disallowed_special=()))
+        return np.searchsorted(np.asarray(offsets, dtype=np.int64), np.arange(len(text) + 1), side="left")
+    
+    codepoints = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    is_cjk = np.zeros(len(codepoints), dtype=bool)
+    for low, high in _CJK_RANGES:
+        is_cjk |= (codepoints >= low) & (codepoints <= high)
+    counts = np.zeros(len(codepoints) + 1, dtype=np.float64)
+    np.cumsum(np.where(is_cjk, 1.0, 0.25), out=counts[1:])
+    return counts
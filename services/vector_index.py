@@ -0,0 +1,229 @@
+"""
+内存NumPy精确检索索引
+将集合的全部向量保存为一个连续的float32矩阵（L2归一化）及并行的ID/文档/元数据数组，
+查询时一次矩阵-向量乘积 + argpartition得到精确top-k。
+适用于数万条1024维文档块的规模，作为ChromaDB HNSW检索的替代后端
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+def distance_to_similarity(distance: float, space: str) -> float:
+    """
+    将ChromaDB距离转换为相似度（归一化向量下即余弦相似度）
+    
+    Args:
+        distance: 距离
+        space: 距离空间，l2为平方L2距离（2 - 2cos），cosine为1 - cos，ip为1 - 内积
+    
+    Returns:
+        不小于0的相似度
+    """
+    if space == "l2":
+        return max(0.0, 1.0 - distance / 2.0)
+    return max(0.0, 1.0 - distance)
+
+
+def cosine_to_distance(scores: np.ndarray, space: str) -> np.ndarray:
+    """将归一化向量的余弦相似度转换为指定空间的距离（与ChromaDB一致）"""
+    if space == "l2":
+        return np.maximum(0.0, 2.0 - 2.0 * scores)
+    return np.maximum(0.0, 1.0 - scores)
+
+
+class NumpyVectorIndex:
+    """内存暴力检索索引（按余弦相似度排序，返回与所属集合距离空间一致的距离）"""
+    
+    def __init__(self, dimension: Optional[int] = None, space: str = "l2"):
+        """
+        初始化空索引
+        
+        Args:
+            dimension: 向量维度，首次写入时自动确定
+            space: 返回距离所用的空间（l2、cosine或ip），与所属集合一致
+        """
+        self.dimension = dimension
+        self.space = space
+        self._lock = threading.Lock()
+        # (ids, matrix, documents, metadatas) 快照，写入时整体替换，查询无需加锁
+        self._data = ([], np.empty((0, dimension or 0), dtype=np.float32), [], [])
+        # (快照, ID → 行号)，过滤检索时按需建立，快照替换后失效
+        self._row_lookup = (None, {})
+    
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        """按行L2归一化为float32"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+    
+    def __len__(self) -> int:
+        return len(self._data[0])
+    
+    def load_from_collection(self, collection, batch_size: int = 5000) -> int:
+        """
+        从ChromaDB集合分页加载全部向量
+        
+        Args:
+            collection: ChromaDB集合
+            batch_size: 每页读取条数
+        
+        Returns:
+            加载的条数
+        """
+        ids, documents, metadatas, blocks = [], [], [], []
+        offset = 0
+        while True:
+            page = collection.get(
+                include=['embeddings', 'documents', 'metadatas'],
+                limit=batch_size,
+                offset=offset
+            )
+            if not page['ids']:
+                break
+            ids.extend(page['ids'])
+            documents.extend(page['documents'])
+            metadatas.extend(page['metadatas'])
+            blocks.append(np.asarray(page['embeddings'], dtype=np.float32))
+            offset += len(page['ids'])
+            if len(page['ids']) < batch_size:
+                break
+        
+        matrix = self._normalize(np.concatenate(blocks)) if blocks else np.empty((0, self.dimension or 0), dtype=np.float32)
+        if len(matrix):
+            self.dimension = matrix.shape[1]
+        
+        with self._lock:
+            self._data = (ids, np.ascontiguousarray(matrix), documents, metadatas)
+        return len(ids)
+    
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict[str, Any]]):
+        """
+        写入或替换向量
+        
+        Args:
+            ids: 文档ID
+            embeddings: 与ids对应的向量
+            documents: 文档内容
+            metadatas: 元数据
+        """
+        if not ids:
+            return
+        vectors = self._normalize(embeddings)
+        
+        with self._lock:
+            old_ids, old_matrix, old_documents, old_metadatas = self._data
+            replaced = set(ids)
+            keep = [i for i, doc_id in enumerate(old_ids) if doc_id not in replaced]
+            
+            if len(keep) == len(old_ids):
+                matrix = np.concatenate([old_matrix, vectors]) if len(old_ids) else vectors
+                new_ids = old_ids + list(ids)
+                new_documents = old_documents + list(documents)
+                new_metadatas = old_metadatas + list(metadatas)
+            else:
+                matrix = np.concatenate([old_matrix[keep], vectors])
+                new_ids = [old_ids[i] for i in keep] + list(ids)
+                new_documents = [old_documents[i] for i in keep] + list(documents)
+                new_metadatas = [old_metadatas[i] for i in keep] + list(metadatas)
+            
+            self.dimension = matrix.shape[1]
+            self._data = (new_ids, np.ascontiguousarray(matrix), new_documents, new_metadatas)
+    
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """只更新元数据（向量不变）"""
+        updates = dict(zip(ids, metadatas))
+        with self._lock:
+            old_ids, matrix, documents, old_metadatas = self._data
+            new_metadatas = [updates.get(doc_id, metadata) for doc_id, metadata in zip(old_ids, old_metadatas)]
+            self._data = (old_ids, matrix, documents, new_metadatas)
+    
+    def delete(self, ids: List[str]):
+        """删除向量"""
+        if not ids:
+            return
+        removed = set(ids)
+        with self._lock:
+            old_ids, old_matrix, old_documents, old_metadatas = self._data
+            keep = [i for i, doc_id in enumerate(old_ids) if doc_id not in removed]
+            if len(keep) == len(old_ids):
+                return
+            self._data = (
+                [old_ids[i] for i in keep],
+                np.ascontiguousarray(old_matrix[keep]),
+                [old_documents[i] for i in keep],
+                [old_metadatas[i] for i in keep]
+            )
+    
+    @contextmanager
+    def batch(self):
+        """批量写入事务（内存索引的写入立即生效，无需合并；memmap快照索引在结束时统一发布）"""
+        yield
+    
+    def clear(self):
+        """清空索引"""
+        with self._lock:
+            self._data = ([], np.empty((0, self.dimension or 0), dtype=np.float32), [], [])
+    
+    def _rows_for(self, data: tuple, candidate_ids: List[str]) -> np.ndarray:
+        """候选ID对应的行号（不在索引中的ID忽略）"""
+        snapshot, lookup = self._row_lookup
+        if snapshot is not data:
+            lookup = {doc_id: row for row, doc_id in enumerate(data[0])}
+            self._row_lookup = (data, lookup)
+        return np.fromiter(
+            (lookup[doc_id] for doc_id in candidate_ids if doc_id in lookup),
+            dtype=np.int64
+        )
+    
+    def query(self, query_embedding, n_results: int = 5, candidate_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        精确top-k检索
+        
+        Args:
+            query_embedding: 查询向量
+            n_results: 返回结果数量
+            candidate_ids: 只在这些ID中检索（None表示全部）
+        
+        Returns:
+            与collection.query相同结构的结果（单个查询），距离按self.space计算
+        """
+        data = self._data
+        ids, matrix, documents, metadatas = data
+        rows = self._rows_for(data, candidate_ids) if candidate_ids is not None else None
+        k = min(n_results, len(ids) if rows is None else len(rows))
+        if k == 0:
+            return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+        
+        query = self._normalize(query_embedding).reshape(-1)
+        scores = matrix @ query if rows is None else matrix[rows] @ query
+        
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        
+        distances = cosine_to_distance(scores[top], self.space)
+        if rows is not None:
+            top = rows[top]
+        return {
+            "ids": [[ids[i] for i in top]],
+            "documents": [[documents[i] for i in top]],
+            "metadatas": [[metadatas[i] for i in top]],
+            "distances": [distances.tolist()]
+        }
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取索引统计"""
+        ids, matrix, _, _ = self._data
+        return {
+            "count": len(ids),
+            "dimension": self.dimension,
+            "memory_mb": round(matrix.nbytes / 1024 / 1024, 2)
+        }
@@ -0,0 +1,348 @@
+"""
+内存映射向量快照
+将集合导出为磁盘快照：float32向量矩阵（.npy）、ID数组、文档内容和元数据（每行一条JSON），
+后两者均为UTF-8连续字节 + 偏移数组，查询时只解码命中的行。各uvicorn worker进程用np.memmap打开同一份快照，共享操作系统页缓存，
+启动只需映射文件，内存占用不随worker数增长。
+
+快照目录结构:
+    <快照目录>/<集合名>/manifest.json      当前版本指针（原子替换）
+    <快照目录>/<集合名>/g<时间戳>/         各版本文件
+写入时在进程锁和文件锁下基于最新版本生成新版本，再原子替换manifest，
+读取方在查询前检查manifest变化并重新映射。
+批量写入（构建、同步一个文件）放在batch()事务内，只在结束时发布一个版本；事务失败时丢弃未发布的修改
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from core.config import Config
+from services.vector_index import NumpyVectorIndex
+
+try:
+    import fcntl
+except ImportError:  # Windows下只做进程内互斥
+    fcntl = None
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".lock"
+
+
+class _StringColumn:
+    """按需读取的字符串列（ID数组）"""
+    
+    def __init__(self, values: np.ndarray):
+        self._values = values
+    
+    def __len__(self) -> int:
+        return len(self._values)
+    
+    def __getitem__(self, index) -> str:
+        return str(self._values[index])
+    
+    def __iter__(self):
+        return (str(value) for value in self._values)
+
+
+class _BlobColumn:
+    """按需解码的文档内容列：连续UTF-8字节 + 偏移数组"""
+    
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+    
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+    
+    def __getitem__(self, index) -> str:
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        return self._blob[start:end].tobytes().decode("utf-8")
+    
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class _JsonBlobColumn(_BlobColumn):
+    """按需解码的元数据列：每行一条JSON"""
+    
+    def __getitem__(self, index) -> Dict[str, Any]:
+        return json.loads(super().__getitem__(index))
+
+
+class _MetadataColumns:
+    """按列存储的元数据（旧版本快照的metadata.json），取行时组装为字典（跳过缺失值）"""
+    
+    def __init__(self, columns: Dict[str, List[Any]], count: int):
+        self._columns = columns
+        self._count = count
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def __getitem__(self, index) -> Dict[str, Any]:
+        return {
+            key: values[index]
+            for key, values in self._columns.items()
+            if values[index] is not None
+        }
+    
+    def __iter__(self):
+        return (self[i] for i in range(self._count))
+
+
+class MemmapVectorIndex(NumpyVectorIndex):
+    """基于内存映射快照的精确检索索引，多进程共享同一份数据"""
+    
+    def __init__(self, path: str, space: str = "l2"):
+        """
+        打开集合的快照目录（不存在时为空索引）
+        
+        Args:
+            path: 该集合的快照目录
+            space: 返回距离所用的空间，与所属集合一致
+        """
+        super().__init__(space=space)
+        self.path = path
+        self.generation = None
+        self._manifest_key = None
+        # 可重入：batch()事务内的各次写入由同一线程再次进入
+        self._write_mutex = threading.RLock()
+        self._write_depth = 0
+        self._refresh()
+    
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.path, MANIFEST_NAME)
+    
+    def _refresh(self):
+        """manifest有变化时重新映射当前版本"""
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return
+        # os.replace每次生成新inode，与修改时间一起判断，避免同一时钟粒度内的两次写入被漏掉
+        key = (stat.st_ino, stat.st_mtime_ns)
+        if key == self._manifest_key:
+            return
+        
+        with self._lock:
+            if key == self._manifest_key:
+                return
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                data = self._open_generation(manifest)
+            except FileNotFoundError:
+                # 读取期间版本已被清理，下次查询时重试
+                return
+            self._data = data
+            self.dimension = manifest["dimension"]
+            self.generation = manifest["generation"]
+            self._manifest_key = key
+    
+    def _open_generation(self, manifest: Dict[str, Any]) -> tuple:
+        """映射指定版本的快照文件"""
+        directory = os.path.join(self.path, manifest["generation"])
+        count = manifest["count"]
+        
+        matrix = np.load(os.path.join(directory, "vectors.npy"), mmap_mode='r')
+        ids = np.load(os.path.join(directory, "ids.npy"), mmap_mode='r')
+        documents = _BlobColumn(*self._map_blob(directory, "documents.bin", "document_offsets.npy"))
+        
+        if os.path.exists(os.path.join(directory, "metadata.bin")):
+            metadatas = _JsonBlobColumn(*self._map_blob(directory, "metadata.bin", "metadata_offsets.npy"))
+        else:
+            # 旧版本快照的元数据为整体加载的列式JSON，下一次写入时转为逐行格式
+            with open(os.path.join(directory, "metadata.json"), 'r', encoding='utf-8') as f:
+                metadatas = _MetadataColumns(json.load(f), count)
+        
+        return (_StringColumn(ids), matrix, documents, metadatas)
+    
+    @staticmethod
+    def _map_blob(directory: str, blob_name: str, offsets_name: str) -> tuple:
+        """映射连续字节文件及其偏移数组"""
+        offsets = np.load(os.path.join(directory, offsets_name), mmap_mode='r')
+        blob_path = os.path.join(directory, blob_name)
+        if os.path.getsize(blob_path):
+            blob = np.memmap(blob_path, dtype=np.uint8, mode='r')
+        else:
+            blob = np.empty(0, dtype=np.uint8)
+        return blob, offsets
+    
+    @staticmethod
+    def _write_blob(directory: str, blob_name: str, offsets_name: str, values: List[str]):
+        """将字符串列表写为连续UTF-8字节文件及偏移数组"""
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(item) for item in encoded], out=offsets[1:])
+        with open(os.path.join(directory, blob_name), 'wb') as f:
+            f.write(b"".join(encoded))
+        np.save(os.path.join(directory, offsets_name), offsets)
+    
+    def _write_generation(self, ids, matrix, documents, metadatas) -> str:
+        """将数据写为一个新版本目录，返回版本名"""
+        generation = f"g{time.time_ns()}"
+        tmp_dir = os.path.join(self.path, f".{generation}.tmp")
+        os.makedirs(tmp_dir)
+        
+        dimension = self.dimension or 0
+        matrix = np.asarray(matrix, dtype=np.float32).reshape(-1, dimension) if len(ids) else \
+            np.empty((0, dimension), dtype=np.float32)
+        np.save(os.path.join(tmp_dir, "vectors.npy"), matrix)
+        np.save(os.path.join(tmp_dir, "ids.npy"), np.array(list(ids), dtype=str))
+        
+        self._write_blob(tmp_dir, "documents.bin", "document_offsets.npy", list(documents))
+        self._write_blob(
+            tmp_dir, "metadata.bin", "metadata_offsets.npy",
+            [json.dumps(metadata or {}, ensure_ascii=False) for metadata in metadatas]
+        )
+        
+        os.rename(tmp_dir, os.path.join(self.path, generation))
+        return generation
+    
+    def _publish(self, ids, matrix, documents, metadatas):
+        """写入新版本，原子替换manifest，并清理不再需要的旧版本"""
+        generation = self._write_generation(ids, matrix, documents, metadatas)
+        manifest = {
+            "generation": generation,
+            "count": len(ids),
+            "dimension": self.dimension or 0,
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=".manifest-", suffix=".json")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.manifest_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        
+        # 保留新版本和上一版本（其他进程可能尚未切换），更早的版本及中断写入的临时目录直接删除
+        keep = {generation, self.generation}
+        for name in os.listdir(self.path):
+            if name.lstrip(".").startswith("g") and name not in keep:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+    
+    @contextmanager
+    def _writing(self):
+        """
+        写入事务：加锁后基于最新版本展开为内存数据，修改后发布为新版本
+        
+        进程内用互斥锁，进程间用快照目录下的文件锁，保证并发写入不会丢失更新。
+        已在事务内时（batch()）只修改内存数据，由最外层事务统一发布。
+        事务内抛出异常时不发布，内存数据恢复为事务开始时映射的版本，与磁盘快照和其他进程保持一致。
+        """
+        with self._write_mutex:
+            if self._write_depth:
+                self._write_depth += 1
+                try:
+                    yield
+                finally:
+                    self._write_depth -= 1
+                return
+            
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, LOCK_NAME), 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    self._refresh()
+                    with self._lock:
+                        committed = (self._data, self.dimension)
+                        ids, matrix, documents, metadatas = self._data
+                        self._data = (list(ids), np.asarray(matrix), list(documents), list(metadatas))
+                    self._write_depth = 1
+                    try:
+                        yield
+                        self._publish(*self._data)
+                    except BaseException:
+                        with self._lock:
+                            self._data, self.dimension = committed
+                        raise
+                    finally:
+                        self._write_depth = 0
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            self._refresh()
+    
+    def batch(self):
+        """
+        批量写入事务：事务内的upsert/delete/update_metadatas只修改内存数据，结束时发布一个版本
+        
+        避免逐批发布时每次都重写整份快照。事务期间持有写锁，其他写入方等待。
+        """
+        return self._writing()
+    
+    def __len__(self) -> int:
+        self._refresh()
+        return super().__len__()
+    
+    def load_from_collection(self, collection, batch_size: int = 5000) -> int:
+        """从ChromaDB集合导出全部向量，生成新快照"""
+        with self._writing():
+            count = super().load_from_collection(collection, batch_size)
+        return count
+    
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict[str, Any]]):
+        """写入或替换向量，并重新生成快照"""
+        if not ids:
+            return
+        with self._writing():
+            super().upsert(ids, embeddings, documents, metadatas)
+    
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """只更新元数据，并重新生成快照"""
+        if not ids:
+            return
+        with self._writing():
+            super().update_metadatas(ids, metadatas)
+    
+    def delete(self, ids: List[str]):
+        """删除向量，并重新生成快照"""
+        if not ids:
+            return
+        with self._writing():
+            super().delete(ids)
+    
+    def clear(self):
+        """清空索引，并重新生成空快照"""
+        with self._writing():
+            super().clear()
+    
+    def query(self, query_embedding, n_results: int = 5, candidate_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """精确top-k检索（查询前检查是否有新版本快照）"""
+        self._refresh()
+        return super().query(query_embedding, n_results, candidate_ids)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取索引统计"""
+        self._refresh()
+        stats = super().get_stats()
+        stats.update({
+            "snapshot_path": self.path,
+            "generation": self.generation
+        })
+        return stats
+
+
+def snapshot_path(collection_name: str, root: str = None) -> str:
+    """集合对应的快照目录"""
+    return os.path.join(root or Config.VECTOR_SNAPSHOT_DIRECTORY, collection_name)
+
+
+def remove_snapshot(collection_name: str, root: str = None):
+    """删除集合的快照目录（集合被删除时调用）"""
+    shutil.rmtree(snapshot_path(collection_name, root), ignore_errors=True)
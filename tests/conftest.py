@@ -0,0 +1,81 @@
+"""
+测试公共配置
+全部测试使用本地哈希向量（不访问网络），ChromaDB、集合别名、写入版本、向量快照和向量缓存均放在临时目录。
+同一集合名创建的两个知识库管理器各自持有进程内索引，用来模拟两个进程（uvicorn worker、同步工具）
+"""
+
+import os
+import sys
+
+import chromadb
+import pytest
+from chromadb.config import Settings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import Config
+from services import collection_alias
+from services.local_embedding import LocalHashEmbedding
+
+
+@pytest.fixture(autouse=True)
+def isolated_storage(tmp_path, monkeypatch):
+    """将所有持久化路径指向临时目录，并关闭进程级缓存和微批调度"""
+    monkeypatch.setattr(Config, "EMBEDDING_BACKEND", "local")
+    monkeypatch.setattr(Config, "CHROMA_PERSIST_DIRECTORY", str(tmp_path / "chroma_db"))
+    monkeypatch.setattr(Config, "COLLECTION_ALIAS_PATH", str(tmp_path / "chroma_db" / "collection_aliases.json"))
+    monkeypatch.setattr(Config, "COLLECTION_VERSION_DIRECTORY", str(tmp_path / "collection_versions"))
+    monkeypatch.setattr(Config, "VECTOR_SNAPSHOT_DIRECTORY", str(tmp_path / "vector_snapshots"))
+    monkeypatch.setitem(Config.LOCAL_EMBEDDING_CONFIG, "dimension", 64)
+    monkeypatch.setitem(Config.EMBEDDING_CACHE_CONFIG, "enabled", False)
+    monkeypatch.setitem(Config.QUERY_CACHE_CONFIG, "enabled", False)
+    monkeypatch.setitem(Config.MICRO_BATCH_CONFIG, "enabled", False)
+    monkeypatch.setitem(Config.RETRIEVAL_CONFIG, "backend", "chroma")
+    monkeypatch.setattr(collection_alias, "collection_alias_store", None)
+    return tmp_path
+
+
+@pytest.fixture
+def embedding_service():
+    """本地哈希向量服务（64维，足够区分测试文本）"""
+    return LocalHashEmbedding(dimension=64)
+
+
+@pytest.fixture
+def chroma_client(isolated_storage):
+    """临时目录下的ChromaDB客户端"""
+    return chromadb.PersistentClient(
+        path=Config.CHROMA_PERSIST_DIRECTORY,
+        settings=Settings(anonymized_telemetry=False, allow_reset=True)
+    )
+
+
+@pytest.fixture
+def make_kb(chroma_client, embedding_service):
+    """创建知识库管理器；同一集合名多次调用得到互相独立的管理器"""
+    from services.bigmodel_knowledge_base import BigModelKnowledgeBase
+    
+    def make(collection_name: str = "test_collection", backend: str = None) -> BigModelKnowledgeBase:
+        if backend is not None:
+            Config.RETRIEVAL_CONFIG["backend"] = backend
+        return BigModelKnowledgeBase(
+            collection_name=collection_name,
+            client=chroma_client,
+            embedding_service=embedding_service
+        )
+    
+    return make
+
+
+@pytest.fixture
+def encoded(monkeypatch, embedding_service):
+    """记录送去向量化的文本（用于断言未变化的块不会重新向量化）"""
+    texts = []
+    original = embedding_service.encode
+    
+    def encode(batch, *args, **kwargs):
+        texts.extend(batch)
+        return original(batch, *args, **kwargs)
+    
+    monkeypatch.setattr(embedding_service, "encode", encode)
+    return texts
@@ -0,0 +1,82 @@
+"""
+稳定文档块ID测试：sha256块ID、重复导入去重、旧版本hash()块ID的迁移
+"""
+
+from services.bigmodel_knowledge_base import BigModelKnowledgeBase
+
+
+def _insert_legacy_chunks(kb, source_file, documents):
+    """按旧版本格式（doc_<hash()>_<序号>）直接写入集合"""
+    ids = [f"doc_{123456 + i}_{i}" for i in range(len(documents))]
+    kb.collection.add(
+        ids=ids,
+        documents=documents,
+        embeddings=kb.embedding_service.encode(documents),
+        metadatas=[{"source_file": source_file, "chunk_index": i} for i in range(len(documents))]
+    )
+    return ids
+
+
+def test_chunk_id_depends_on_source_and_content():
+    chunk_id = BigModelKnowledgeBase.make_chunk_id("混凝土强度等级", "a.md")
+    
+    assert chunk_id == BigModelKnowledgeBase.make_chunk_id("混凝土强度等级", "a.md")
+    assert chunk_id.startswith("doc_") and len(chunk_id) == 36
+    assert chunk_id != BigModelKnowledgeBase.make_chunk_id("混凝土强度等级", "b.md")
+    assert chunk_id != BigModelKnowledgeBase.make_chunk_id("钢筋保护层厚度", "a.md")
+
+
+def test_re_adding_a_file_is_idempotent(make_kb, encoded):
+    kb = make_kb()
+    chunks = ["第一章 总则", "第二章 材料", "第一章 总则"]
+    
+    first_ids = kb.add_documents_batch(chunks, [{"source_file": "a.md"} for _ in chunks])
+    assert kb.collection.count() == 2
+    assert first_ids[0] == first_ids[2]
+    
+    encoded.clear()
+    second_ids = kb.add_documents_batch(chunks, [{"source_file": "a.md"} for _ in chunks])
+    
+    assert second_ids == first_ids
+    assert encoded == []
+    assert kb.collection.count() == 2
+
+
+def test_migrate_legacy_ids_rewrites_ids_without_re_encoding(make_kb, encoded):
+    kb = make_kb()
+    documents = ["3.1.1 混凝土强度等级不应低于C30", "3.1.2 钢筋应采用HRB400"]
+    legacy_ids = _insert_legacy_chunks(kb, "spec.md", documents)
+    encoded.clear()
+    
+    migrated = make_kb().migrate_legacy_ids()
+    
+    stored = kb.collection.get(include=["documents", "metadatas"])
+    assert migrated == 2
+    assert encoded == []
+    assert not set(legacy_ids) & set(stored["ids"])
+    assert sorted(stored["ids"]) == sorted(
+        BigModelKnowledgeBase.make_chunk_id(document, "spec.md") for document in documents
+    )
+    assert all(metadata["source_file"] == "spec.md" for metadata in stored["metadatas"])
+
+
+def test_adding_a_legacy_source_migrates_instead_of_duplicating(make_kb, encoded):
+    kb = make_kb()
+    documents = ["3.1.1 混凝土强度等级不应低于C30", "3.1.2 钢筋应采用HRB400"]
+    _insert_legacy_chunks(kb, "spec.md", documents)
+    encoded.clear()
+    
+    fresh = make_kb()
+    fresh.add_documents_batch(documents + ["3.1.3 新增条文"], [{"source_file": "spec.md"} for _ in range(3)])
+    
+    assert kb.collection.count() == 3
+    assert encoded == ["3.1.3 新增条文"]
+
+
+def test_migrate_legacy_ids_leaves_current_ids_alone(make_kb):
+    kb = make_kb()
+    kb.add_documents_batch(["条文一", "条文二"], [{"source_file": "a.md"}, {"source_file": "a.md"}])
+    before = sorted(kb.collection.get(include=[])["ids"])
+    
+    assert make_kb().migrate_legacy_ids() == 0
+    assert sorted(kb.collection.get(include=[])["ids"]) == before
@@ -0,0 +1,90 @@
+"""
+蓝绿重建测试：别名持久化与跨进程重新加载、重建成功后原子切换、失败时保留当前集合、旧版本清理
+"""
+
+import pytest
+
+from core.config import Config
+from services import knowledge_base_registry
+from services.collection_alias import CollectionAliasStore
+from services.knowledge_base_registry import KnowledgeBaseRegistry
+
+
+def _build(documents):
+    def build(kb):
+        kb.add_documents_batch(documents, [{"source_file": "spec.md"} for _ in documents])
+    return build
+
+
+@pytest.fixture
+def registry(monkeypatch, embedding_service):
+    monkeypatch.setattr(knowledge_base_registry, "create_embedding_service", lambda api_key=None: embedding_service)
+    return KnowledgeBaseRegistry()
+
+
+def test_alias_store_reloads_changes_from_other_processes(tmp_path):
+    path = str(tmp_path / "aliases.json")
+    store = CollectionAliasStore(path)
+    other = CollectionAliasStore(path)
+    assert store.resolve("standards") == "standards"
+    
+    other.set("standards", "standards__v1")
+    assert store.resolve("standards") == "standards__v1"
+    
+    other.set("standards", "standards__v2")
+    assert store.resolve("standards") == "standards__v2"
+    assert CollectionAliasStore(path).get_all() == {"standards": "standards__v2"}
+
+
+def test_rebuild_swaps_alias_after_smoke_query(registry):
+    current = registry.get("standards")
+    current.add_documents_batch(["旧版本条文"], [{"source_file": "spec.md"}])
+    
+    new_name = registry.rebuild_collection("standards", _build(["混凝土强度等级不应低于C30"]), "混凝土")
+    
+    assert new_name == "standards__v1"
+    assert registry.resolve("standards") == "standards__v1"
+    served = registry.get("standards")
+    assert served is not current
+    assert served.collection.get(include=["documents"])["documents"] == ["混凝土强度等级不应低于C30"]
+    # 旧集合保留用于回滚，但不再缓存其管理器
+    assert "standards" in registry.list_collection_names()
+    assert "standards" not in registry.loaded_collections()
+
+
+def test_other_process_sees_the_swap(registry):
+    registry.get("standards").add_documents_batch(["旧版本条文"], [{"source_file": "spec.md"}])
+    worker = KnowledgeBaseRegistry()
+    assert worker.get("standards").collection.name == "standards"
+    
+    registry.rebuild_collection("standards", _build(["新版本条文"]), "条文")
+    
+    assert worker.get("standards").collection.name == "standards__v1"
+    assert "standards" not in worker.loaded_collections()
+
+
+@pytest.mark.parametrize("build_fn, smoke_query", [
+    (_build([]), "条文"),
+    (lambda kb: 1 / 0, "条文"),
+])
+def test_failed_rebuild_keeps_current_collection(registry, build_fn, smoke_query):
+    registry.get("standards").add_documents_batch(["旧版本条文"], [{"source_file": "spec.md"}])
+    
+    with pytest.raises(Exception):
+        registry.rebuild_collection("standards", build_fn, smoke_query)
+    
+    assert registry.resolve("standards") == "standards"
+    assert "standards__v1" not in registry.list_collection_names()
+    assert registry.get("standards").collection.count() == 1
+
+
+def test_rebuild_prunes_old_generations(registry, monkeypatch):
+    monkeypatch.setattr(Config, "COLLECTION_KEEP_GENERATIONS", 1)
+    registry.get("standards").add_documents_batch(["第0版"], [{"source_file": "spec.md"}])
+    
+    for version in range(1, 4):
+        registry.rebuild_collection("standards", _build([f"第{version}版条文"]), "条文")
+    
+    # 当前集合之外只保留最近的1个旧版本
+    assert registry.resolve("standards") == "standards__v3"
+    assert sorted(registry._generations("standards").values()) == ["standards__v2", "standards__v3"]
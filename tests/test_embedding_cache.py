@@ -0,0 +1,110 @@
+"""
+持久化向量缓存测试：读路径不写数据库、访问时间批量写回、近似计数触发的LRU淘汰
+"""
+
+import sqlite3
+import time
+
+import numpy as np
+
+from services import embedding_cache
+from services.embedding_cache import EmbeddingCache, QueryEmbeddingCache
+
+
+def _vectors(count: int, dimension: int = 4) -> np.ndarray:
+    return np.arange(count * dimension, dtype=np.float32).reshape(count, dimension)
+
+
+def test_round_trip_preserves_vectors_and_order(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    vectors = _vectors(3)
+    cache.put_many("m", ["a", "b", "c"], vectors)
+    
+    found = cache.get_many("m", ["c", "missing", "a", "a"])
+    
+    np.testing.assert_array_equal(found[0], vectors[2])
+    assert found[1] is None
+    np.testing.assert_array_equal(found[2], vectors[0])
+    np.testing.assert_array_equal(found[3], vectors[0])
+    assert cache.get_many("other-model", ["a"]) == [None]
+
+
+def test_hits_do_not_write_until_flushed(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    cache.put_many("m", ["a", "b"], _vectors(2))
+    statements = []
+    cache._get_connection().set_trace_callback(statements.append)
+    
+    for _ in range(10):
+        cache.get_many("m", ["a", "b"])
+    
+    assert not [statement for statement in statements if statement.startswith("UPDATE")]
+    assert cache.get_stats()["pending_access_updates"] == 2
+    
+    cache.flush_access()
+    assert [statement for statement in statements if statement.startswith("UPDATE")]
+    assert cache.get_stats()["pending_access_updates"] == 0
+
+
+def test_pending_access_flushes_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "ACCESS_FLUSH_SIZE", 3)
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    cache.put_many("m", ["a", "b", "c"], _vectors(3))
+    
+    cache.get_many("m", ["a", "b"])
+    assert cache.get_stats()["pending_access_updates"] == 2
+    cache.get_many("m", ["c"])
+    assert cache.get_stats()["pending_access_updates"] == 0
+
+
+def test_insert_does_not_count_rows_below_the_limit(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=1000)
+    statements = []
+    cache._get_connection().set_trace_callback(statements.append)
+    
+    for i in range(10):
+        cache.put_many("m", [f"text-{i}"], _vectors(1))
+    
+    assert not [statement for statement in statements if "COUNT(*)" in statement]
+
+
+def test_eviction_keeps_recently_read_entries(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(path, max_entries=10)
+    cache.put_many("m", [f"old-{i}" for i in range(8)], _vectors(8))
+    # 命中的条目只记在内存中，淘汰前写回，因此不会被当作最久未访问
+    cache.get_many("m", ["old-0"])
+    
+    cache.put_many("m", [f"new-{i}" for i in range(5)], _vectors(5))
+    
+    entries = sqlite3.connect(path).execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    assert entries <= 10
+    assert cache.get_stats()["evictions"] > 0
+    survivors = cache.get_many("m", [f"old-{i}" for i in range(8)] + [f"new-{i}" for i in range(5)])
+    assert survivors[0] is not None
+    assert all(vector is not None for vector in survivors[8:])
+    assert sum(vector is None for vector in survivors[1:8]) == cache.get_stats()["evictions"]
+
+
+def test_count_includes_rows_written_by_other_processes(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    writer = EmbeddingCache(path, max_entries=20)
+    other = EmbeddingCache(path, max_entries=20)
+    
+    other.put_many("m", [f"other-{i}" for i in range(19)], _vectors(19))
+    writer.put_many("m", [f"mine-{i}" for i in range(5)], _vectors(5))
+    
+    entries = sqlite3.connect(path).execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    assert entries <= 20
+
+
+def test_query_cache_normalizes_and_expires():
+    cache = QueryEmbeddingCache(max_entries=2, ttl_seconds=0.05)
+    
+    cache.put("m", "混凝土  强度", "v1")
+    assert cache.get("m", "混凝土 强度") == "v1"
+    assert cache.get("m", "混凝土　强度") == "v1"
+    
+    time.sleep(0.06)
+    assert cache.get("m", "混凝土 强度") is None
+    assert cache.get_stats()["expirations"] == 1
@@ -0,0 +1,101 @@
+"""
+N-gram短语索引测试：精确定位、不区分大小写、替换与删除、空槽位回收，以及其他进程写入后/grep的重建
+"""
+
+import pytest
+
+from services import phrase_index
+from services.phrase_index import NgramPhraseIndex
+
+
+def test_search_returns_all_offsets_with_snippets():
+    index = NgramPhraseIndex()
+    index.add(["a", "b"], ["风速不应大于0.3m/s，回风口风速0.3m/s", "风速不应大于0.5m/s"])
+    
+    found = index.search("0.3m/s", context=2)
+    
+    assert found["total"] == 1
+    match = found["matches"][0]
+    assert match["id"] == "a"
+    assert match["offsets"] == [[6, 12], [18, 24]]
+    snippet = match["snippets"][0]
+    assert snippet["text"][slice(*snippet["highlight"])] == "0.3m/s"
+
+
+def test_search_is_case_insensitive_and_keeps_original_text():
+    index = NgramPhraseIndex()
+    index.add(["a"], ["采用HRB400钢筋"])
+    
+    match = index.search("hrb400")["matches"][0]
+    
+    assert match["snippets"][0]["text"] == "采用HRB400钢筋"
+
+
+def test_limit_caps_matches_but_not_total():
+    index = NgramPhraseIndex()
+    index.add([f"d{i}" for i in range(5)], ["混凝土保护层"] * 5)
+    
+    found = index.search("保护层", limit=2)
+    
+    assert found["total"] == 5
+    assert len(found["matches"]) == 2
+
+
+def test_replace_and_remove_update_postings():
+    index = NgramPhraseIndex()
+    index.add(["a"], ["钢筋锚固长度"])
+    index.add(["a"], ["混凝土保护层"])
+    
+    assert index.search("锚固")["total"] == 0
+    assert index.search("保护层")["total"] == 1
+    
+    index.remove(["a", "missing"])
+    assert index.search("保护层")["total"] == 0
+    assert len(index) == 0
+
+
+def test_freed_slots_are_reclaimed(monkeypatch):
+    monkeypatch.setattr(phrase_index, "COMPACT_MIN_FREE_SLOTS", 4)
+    index = NgramPhraseIndex()
+    index.add([f"d{i}" for i in range(10)], [f"第{i}条 混凝土保护层" for i in range(10)])
+    
+    index.remove([f"d{i}" for i in range(0, 10, 2)])
+    stats = index.get_stats()
+    assert stats["compactions"] == 1
+    assert stats["free_slots"] == 0
+    
+    # 重新编号后的检索、替换和删除仍然正确
+    assert sorted(match["id"] for match in index.search("保护层")["matches"]) == ["d1", "d3", "d5", "d7", "d9"]
+    index.add(["d3"], ["钢筋锚固长度"])
+    index.remove(["d5"])
+    assert index.search("第7条")["matches"][0]["id"] == "d7"
+    assert index.search("锚固")["matches"][0]["id"] == "d3"
+    assert index.search("保护层")["total"] == 3
+
+
+def test_repeated_replacement_does_not_grow_without_bound(monkeypatch):
+    monkeypatch.setattr(phrase_index, "COMPACT_MIN_FREE_SLOTS", 8)
+    index = NgramPhraseIndex()
+    index.add(["a", "b"], ["条文一", "条文二"])
+    
+    for round_number in range(100):
+        index.add(["a"], [f"条文一 第{round_number}次修改"])
+    
+    assert len(index._documents) <= 2 * 8 + 2
+    assert index.search("第99次修改")["matches"][0]["id"] == "a"
+
+
+@pytest.mark.parametrize("backend", ["chroma", "memmap"])
+def test_grep_sees_other_process_writes(make_kb, backend):
+    kb = make_kb(backend=backend)
+    other = make_kb(backend=backend)
+    kb.add_documents_batch(["第8.2.1条 混凝土保护层厚度"], [{"source_file": "a.md"}])
+    assert kb.grep("保护层")["total"] == 1
+    
+    other.add_documents_batch(["第8.2.2条 钢筋保护层"], [{"source_file": "b.md"}])
+    assert kb.grep("保护层")["total"] == 2
+    
+    other.remove_documents_by_source("a.md")
+    found = kb.grep("保护层")
+    assert found["total"] == 1
+    assert found["matches"][0]["source_file"] == "b.md"
@@ -0,0 +1,47 @@
+"""
+令牌桶限流器测试
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from services.rate_limiter import TokenBucketRateLimiter
+
+
+def test_burst_up_to_capacity_does_not_wait():
+    limiter = TokenBucketRateLimiter(rate_per_second=10, capacity=5)
+    
+    started = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    
+    assert time.monotonic() - started < 0.05
+
+
+def test_requests_beyond_capacity_are_paced():
+    limiter = TokenBucketRateLimiter(rate_per_second=50, capacity=1)
+    
+    started = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    
+    # 首个令牌立即可用，其余5个按每秒50个补充
+    assert time.monotonic() - started >= 0.09
+
+
+def test_async_acquire_is_paced():
+    limiter = TokenBucketRateLimiter(rate_per_second=50, capacity=1)
+    
+    async def main():
+        started = time.monotonic()
+        await asyncio.gather(*(limiter.acquire_async() for _ in range(6)))
+        return time.monotonic() - started
+    
+    assert asyncio.run(main()) >= 0.09
+
+
+def test_invalid_rate_is_rejected():
+    with pytest.raises(ValueError):
+        TokenBucketRateLimiter(rate_per_second=0)
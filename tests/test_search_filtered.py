@@ -0,0 +1,87 @@
+"""
+元数据过滤检索测试：索引字段走元数据索引、其余字段走ChromaDB where，结果与集合一致，
+其他进程写入后过滤结果随之更新（chroma、numpy、memmap三种检索后端）
+"""
+
+import pytest
+
+from services.metadata_index import MetadataIndex
+
+BACKENDS = ["chroma", "numpy", "memmap"]
+
+DOCUMENTS = [
+    ("混凝土保护层厚度不应小于25mm", {"source_file": "concrete.md", "project_name": "A", "chapter": "第八章"}),
+    ("混凝土强度等级不应低于C30", {"source_file": "concrete.md", "project_name": "B", "chapter": "第四章"}),
+    ("钢筋锚固长度按计算确定", {"source_file": "steel.md", "project_name": "A", "chapter": "第八章"}),
+]
+
+
+@pytest.fixture(params=BACKENDS)
+def kb(request, make_kb):
+    kb = make_kb(backend=request.param)
+    kb.add_documents_batch([document for document, _ in DOCUMENTS],
+                           [dict(metadata) for _, metadata in DOCUMENTS])
+    return kb
+
+
+def _contents(result):
+    return sorted(item["content"] for item in result["results"])
+
+
+def test_metadata_index_lookup():
+    index = MetadataIndex(["source_file", "project_name"])
+    index.add(["a", "b", "c"], None, [metadata for _, metadata in DOCUMENTS])
+    
+    assert index.lookup({"source_file": "concrete.md"}) == {"a", "b"}
+    assert index.lookup({"source_file": "concrete.md", "project_name": "A"}) == {"a"}
+    assert index.lookup({"project_name": ["B", "C"]}) == {"b"}
+    index.remove(["a"])
+    assert index.lookup({"project_name": "A"}) == {"c"}
+    with pytest.raises(ValueError):
+        index.lookup({"chapter": "第八章"})
+
+
+def test_indexed_fields(kb):
+    result = kb.search_filtered("混凝土", {"source_file": "concrete.md", "project_name": "A"}, n_results=5)
+    assert _contents(result) == ["混凝土保护层厚度不应小于25mm"]
+    
+    result = kb.search_filtered("混凝土", {"project_name": ["A", "B"]}, n_results=5)
+    assert len(result["results"]) == 3
+
+
+def test_unindexed_field_falls_back_to_where(kb):
+    result = kb.search_filtered("长度", {"chapter": "第八章"}, n_results=5)
+    assert _contents(result) == ["混凝土保护层厚度不应小于25mm", "钢筋锚固长度按计算确定"]
+    
+    result = kb.search_filtered("长度", {"chapter": ["第四章", "第八章"], "source_file": "steel.md"}, n_results=5)
+    assert _contents(result) == ["钢筋锚固长度按计算确定"]
+    
+    assert kb.search_filtered("长度", {"chapter": "第一章"})["results"] == []
+
+
+def test_none_values_are_ignored(kb):
+    result = kb.search_filtered("混凝土", {"source_file": None}, n_results=5)
+    assert len(result["results"]) == 3
+
+
+def test_other_process_writes_reach_filters(kb, make_kb):
+    other = make_kb()
+    assert len(kb.search_filtered("混凝土", {"project_name": "A"}, n_results=5)["results"]) == 2
+    
+    other.add_documents_batch(["桩基承载力特征值"], [{"source_file": "pile.md", "project_name": "A"}])
+    other.remove_documents_by_source("steel.md")
+    
+    result = kb.search_filtered("混凝土", {"project_name": "A"}, n_results=5)
+    assert _contents(result) == ["桩基承载力特征值", "混凝土保护层厚度不应小于25mm"]
+    assert kb.search_filtered("长度", {"source_file": "steel.md"})["results"] == []
+
+
+def test_sync_source_metadata_change_reaches_filters(kb, make_kb):
+    kb.get_metadata_index()
+    kb.sync_source("concrete.md", [document for document, _ in DOCUMENTS[:2]],
+                   [{"project_name": "C"}, {"project_name": "C"}])
+    
+    assert len(kb.search_filtered("混凝土", {"project_name": "C"}, n_results=5)["results"]) == 2
+    assert _contents(make_kb().search_filtered("混凝土", {"project_name": "A"}, n_results=5)) == [
+        "钢筋锚固长度按计算确定"
+    ]
@@ -0,0 +1,131 @@
+"""
+二级索引测试：BM25分词与RRF融合；集合写入版本驱动的进程内索引失效
+（本进程写入增量更新、不重建，其他进程写入后下次使用时重建）
+"""
+
+import numpy as np
+import pytest
+
+from services.collection_version import CollectionWriteVersion
+from services.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_cjk_bigrams_numbers_and_standard_codes():
+    tokens = tokenize("混凝土 8.2.1条 GB/T 50010")
+    
+    assert {"混凝", "凝土", "8.2.1", "gbt50010"} <= set(tokens)
+    assert "gb50010" in tokenize("GB 50010-2010")
+    assert "jgj130" in tokenize("JGJ130")
+
+
+def test_bm25_ranks_exact_clause_number_first():
+    index = BM25Index()
+    index.add(["a", "b", "c"], ["第8.2.1条 混凝土保护层", "第8.2.2条 钢筋锚固", "混凝土强度等级"])
+    
+    assert index.search("8.2.1", 3)[0][0] == "a"
+    index.remove(["a"])
+    assert [doc_id for doc_id, _ in index.search("8.2.1", 3)] == []
+    assert len(index) == 2
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    
+    assert max(fused, key=fused.get) == "b"
+    assert fused["b"] == pytest.approx(1 / 62 + 1 / 61)
+    assert set(fused) == {"a", "b", "c", "d"}
+
+
+def test_write_version_bump_returns_previous(tmp_path):
+    version = CollectionWriteVersion("c", root=str(tmp_path))
+    other = CollectionWriteVersion("c", root=str(tmp_path))
+    assert version.current() is None
+    
+    previous, first = version.bump()
+    assert previous is None
+    assert other.current() == first
+    
+    previous, second = other.bump()
+    assert previous == first
+    assert version.current() == second
+    
+    version.remove()
+    assert other.current() is None
+
+
+INDEX_GETTERS = ["get_lexical_index", "get_phrase_index", "get_metadata_index"]
+
+
+def _add(kb, source_file, *documents):
+    kb.add_documents_batch(list(documents), [{"source_file": source_file} for _ in documents])
+
+
+@pytest.mark.parametrize("getter", INDEX_GETTERS)
+def test_own_writes_update_index_in_place(make_kb, getter):
+    kb = make_kb()
+    _add(kb, "a.md", "混凝土保护层厚度")
+    index = getattr(kb, getter)()
+    
+    _add(kb, "b.md", "钢筋锚固长度")
+    kb.remove_documents_by_source("a.md")
+    
+    assert getattr(kb, getter)() is index
+    assert len(index) == 1
+
+
+@pytest.mark.parametrize("getter", INDEX_GETTERS)
+def test_foreign_write_rebuilds_index(make_kb, getter):
+    kb = make_kb()
+    other = make_kb()
+    _add(kb, "a.md", "混凝土保护层厚度")
+    index = getattr(kb, getter)()
+    
+    _add(other, "b.md", "钢筋锚固长度")
+    
+    rebuilt = getattr(kb, getter)()
+    assert rebuilt is not index
+    assert len(rebuilt) == 2
+
+
+def test_own_write_after_foreign_write_still_rebuilds(make_kb):
+    kb = make_kb()
+    other = make_kb()
+    _add(kb, "a.md", "混凝土保护层厚度")
+    index = kb.get_lexical_index()
+    
+    # 其他进程写入后本进程再写入：增量应用不能覆盖漏掉的写入
+    _add(other, "b.md", "钢筋锚固长度")
+    _add(kb, "c.md", "桩基承载力")
+    
+    rebuilt = kb.get_lexical_index()
+    assert rebuilt is not index
+    assert len(rebuilt) == 3
+
+
+def test_foreign_delete_reaches_bm25(make_kb):
+    kb = make_kb()
+    other = make_kb()
+    _add(kb, "a.md", "第8.2.1条 混凝土保护层厚度")
+    _add(kb, "b.md", "第8.2.2条 钢筋锚固长度")
+    assert kb.get_lexical_index().search("8.2.1", 5)
+    
+    other.remove_documents_by_source("a.md")
+    
+    assert kb.get_lexical_index().search("8.2.1", 5) == []
+    assert [result["id"] for result in kb.hybrid_search("8.2.1", n_results=5)["results"]] == \
+        [kb.make_chunk_id("第8.2.2条 钢筋锚固长度", "b.md")]
+
+
+def test_numpy_backend_reloads_after_foreign_write(make_kb, embedding_service):
+    kb = make_kb(backend="numpy")
+    other = make_kb(backend="numpy")
+    _add(kb, "a.md", "混凝土保护层厚度")
+    query = "钢筋锚固长度"
+    embedding = np.asarray(embedding_service.encode([query])[0])
+    assert len(kb.vector_index) == 1
+    
+    _add(other, "b.md", query)
+    
+    results = kb.search_by_embedding(query, embedding, n_results=2)["results"]
+    assert len(kb.vector_index) == 2
+    assert results[0]["content"] == query
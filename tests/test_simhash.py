@@ -0,0 +1,44 @@
+"""
+SimHash近重复折叠测试
+"""
+
+from services.simhash import collapse_near_duplicates, hamming_distance, simhash, simhash_hex
+
+CLAUSE = "8.2.1 混凝土保护层厚度不应小于钢筋的公称直径，且应符合表8.2.1的规定。"
+
+
+def test_fingerprint_ignores_whitespace_and_case():
+    assert simhash(CLAUSE) == simhash(CLAUSE.replace(" ", "\n  "))
+    assert simhash("HRB400钢筋") == simhash("hrb400钢筋")
+    assert simhash("") == 0
+    assert len(simhash_hex(CLAUSE)) == 16
+
+
+def test_near_duplicates_are_close_and_different_texts_are_far():
+    edited = CLAUSE.replace("公称直径", "直径")
+    other = "桩基承载力特征值应通过单桩竖向静载荷试验确定，试验数量不应少于同条件下桩基总数的1%。"
+    
+    assert hamming_distance(simhash(CLAUSE), simhash(edited)) <= 10
+    assert hamming_distance(simhash(CLAUSE), simhash(other)) > 10
+
+
+def test_collapse_keeps_best_ranked_and_records_other_sources():
+    results = [
+        {"content": CLAUSE, "metadata": {"source_file": "standard.md", "simhash": simhash_hex(CLAUSE)},
+         "similarity": 0.9},
+        {"content": "桩基承载力特征值应通过试验确定", "metadata": {"source_file": "pile.md"}, "similarity": 0.8},
+        {"content": CLAUSE + " ", "metadata": {"source_file": "regulations/standard.md"}, "similarity": 0.7},
+    ]
+    
+    collapsed = collapse_near_duplicates(results, max_distance=3)
+    
+    assert [result["metadata"]["source_file"] for result in collapsed] == ["standard.md", "pile.md"]
+    assert collapsed[0]["near_duplicates"] == [
+        {"source_file": "regulations/standard.md", "similarity": 0.7, "source_type": None}
+    ]
+
+
+def test_collapse_stops_at_limit():
+    results = [{"content": f"第{i}条 {'不同内容' * i}", "metadata": {}} for i in range(1, 6)]
+    
+    assert len(collapse_near_duplicates(results, max_distance=0, limit=2)) == 2
@@ -0,0 +1,117 @@
+"""
+Single-flight请求合并测试：线程间合并、同一事件循环内合并、不同事件循环互不等待
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services.single_flight import SingleFlight
+
+
+def test_concurrent_threads_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+    barrier = threading.Barrier(5)
+    results = []
+    
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return "result"
+    
+    def worker():
+        barrier.wait()
+        results.append(flight.do("key", slow))
+    
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.get_stats() == {"executed": 1, "shared": 4, "in_flight": 0}
+
+
+def test_failed_call_is_not_remembered():
+    flight = SingleFlight()
+    
+    def failing():
+        raise ValueError("upstream")
+    
+    with pytest.raises(ValueError):
+        flight.do("key", failing)
+    # 失败后记录被移除，下一次调用重新执行
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.get_stats()["executed"] == 2
+
+
+def test_async_callers_in_one_loop_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+    
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+    
+    async def main():
+        return await asyncio.gather(*(flight.do_async("key", fetch) for _ in range(5)))
+    
+    assert asyncio.run(main()) == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.get_stats() == {"executed": 1, "shared": 4, "in_flight": 0}
+
+
+def test_async_calls_are_not_shared_across_event_loops():
+    flight = SingleFlight()
+    started = threading.Barrier(3)
+    results = []
+    errors = []
+    
+    async def fetch():
+        await asyncio.sleep(0.1)
+        return threading.get_ident()
+    
+    async def callers():
+        started.wait()
+        return await asyncio.gather(*(flight.do_async("key", fetch) for _ in range(5)))
+    
+    def worker():
+        try:
+            results.append(asyncio.run(callers()))
+        except BaseException as e:
+            errors.append(e)
+    
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert errors == []
+    # 每个事件循环各执行一次，循环内的调用者共享本循环的结果
+    assert len(results) == 3
+    assert all(len(set(loop_results)) == 1 for loop_results in results)
+    assert flight.get_stats() == {"executed": 3, "shared": 12, "in_flight": 0}
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    flight = SingleFlight()
+    
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "result"
+    
+    async def main():
+        first = asyncio.ensure_future(flight.do_async("key", fetch))
+        second = asyncio.ensure_future(flight.do_async("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+    
+    assert asyncio.run(main()) == "result"
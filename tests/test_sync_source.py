@@ -0,0 +1,128 @@
+"""
+增量同步测试：只向量化新增块、只删除消失的块、同名文件以相对路径区分、旧版本文件名来源的迁移
+"""
+
+import pytest
+
+from services import knowledge_base_registry
+from tools.incremental_add import IncrementalDataManager
+
+
+def _source_chunks(kb, source_file):
+    stored = kb.collection.get(where={"source_file": source_file}, include=["documents", "metadatas"])
+    return sorted(stored["documents"]), stored["metadatas"]
+
+
+def test_sync_source_only_encodes_new_chunks(make_kb, encoded):
+    kb = make_kb()
+    assert kb.sync_source("spec.md", ["条文一", "条文二", "条文三"]) == {"added": 3, "removed": 0, "unchanged": 0}
+    
+    encoded.clear()
+    stats = kb.sync_source("spec.md", ["条文一", "条文三", "条文四"])
+    
+    assert stats == {"added": 1, "removed": 1, "unchanged": 2}
+    assert encoded == ["条文四"]
+    assert _source_chunks(kb, "spec.md")[0] == ["条文一", "条文三", "条文四"]
+
+
+def test_sync_source_refreshes_metadata_of_unchanged_chunks(make_kb):
+    kb = make_kb()
+    kb.sync_source("spec.md", ["条文一", "条文二"], [{"chunk_index": 0}, {"chunk_index": 1}])
+    
+    kb.sync_source("spec.md", ["条文二", "条文一"], [{"chunk_index": 0}, {"chunk_index": 1}])
+    
+    stored = kb.collection.get(where={"source_file": "spec.md"}, include=["documents", "metadatas"])
+    index_by_document = {document: metadata["chunk_index"]
+                         for document, metadata in zip(stored["documents"], stored["metadatas"])}
+    assert index_by_document == {"条文二": 0, "条文一": 1}
+
+
+def test_sync_source_does_not_touch_other_sources(make_kb):
+    kb = make_kb()
+    kb.sync_source("a.md", ["共同条文", "a的条文"])
+    kb.sync_source("b.md", ["共同条文", "b的条文"])
+    
+    kb.sync_source("a.md", ["a的新条文"])
+    
+    assert _source_chunks(kb, "a.md")[0] == ["a的新条文"]
+    assert _source_chunks(kb, "b.md")[0] == ["b的条文", "共同条文"]
+
+
+def test_sync_source_with_no_chunks_removes_the_source(make_kb):
+    kb = make_kb()
+    kb.sync_source("spec.md", ["条文一", "条文二"])
+    
+    assert kb.sync_source("spec.md", []) == {"added": 0, "removed": 2, "unchanged": 0}
+    assert kb.collection.count() == 0
+
+
+def test_rekey_source_moves_chunks_without_re_encoding(make_kb, encoded):
+    kb = make_kb()
+    kb.sync_source("spec.md", ["条文一", "条文二"])
+    encoded.clear()
+    
+    assert kb.rekey_source("spec.md", "docs/spec.md") == 2
+    
+    assert encoded == []
+    assert _source_chunks(kb, "spec.md")[0] == []
+    assert _source_chunks(kb, "docs/spec.md")[0] == ["条文一", "条文二"]
+    assert kb.sync_source("docs/spec.md", ["条文一", "条文二"])["unchanged"] == 2
+
+
+@pytest.fixture
+def manager(monkeypatch, embedding_service):
+    """使用临时目录的增量数据管理器（注册表为本测试新建，与encoded共用向量化服务）"""
+    monkeypatch.setattr(knowledge_base_registry, "knowledge_base_registry", None)
+    monkeypatch.setattr(knowledge_base_registry, "create_embedding_service", lambda api_key=None: embedding_service)
+    return IncrementalDataManager(collection_name="sync_collection")
+
+
+@pytest.fixture
+def docs(tmp_path):
+    """两个子目录下各有一个同名文件"""
+    root = tmp_path / "docs"
+    for directory, text in (("structure", "混凝土结构设计要求。"), ("bridge", "桥梁结构设计要求。")):
+        (root / directory).mkdir(parents=True)
+        (root / directory / "spec.md").write_text(f"# 总则\n\n{text}\n", encoding="utf-8")
+    return root
+
+
+def test_same_file_name_in_different_directories_stays_separate(manager, docs):
+    summary = manager.sync_directory(str(docs))
+    
+    assert summary["success"]
+    assert sorted(manager.kb.list_sources()) == ["bridge/spec.md", "structure/spec.md"]
+    
+    # 修改一个文件只影响它自己的块
+    (docs / "bridge" / "spec.md").write_text("# 总则\n\n桥梁抗震设计要求。\n", encoding="utf-8")
+    summary = manager.sync_directory(str(docs))
+    
+    by_source = {result["source_file"]: result for result in summary["results"]}
+    assert by_source["structure/spec.md"]["added"] == 0
+    assert by_source["bridge/spec.md"]["added"] == 1
+    assert by_source["bridge/spec.md"]["removed"] == 1
+
+
+def test_sync_directory_prunes_deleted_files(manager, docs):
+    manager.sync_directory(str(docs))
+    (docs / "bridge" / "spec.md").unlink()
+    
+    summary = manager.sync_directory(str(docs), prune=True)
+    
+    assert summary["pruned_sources"] == ["bridge/spec.md"]
+    assert manager.kb.list_sources() == ["structure/spec.md"]
+
+
+def test_basename_sources_are_migrated_to_relative_paths(manager, docs, encoded):
+    # 旧版本以文件名记录来源
+    for directory in ("structure", "bridge"):
+        manager.add_file(str(docs / directory / "spec.md"))
+    assert manager.kb.list_sources() == ["spec.md"]
+    count = manager.kb.collection.count()
+    encoded.clear()
+    
+    manager.add_directory(str(docs))
+    
+    assert sorted(manager.kb.list_sources()) == ["bridge/spec.md", "structure/spec.md"]
+    assert manager.kb.collection.count() == count
+    assert encoded == []
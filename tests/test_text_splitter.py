@@ -0,0 +1,81 @@
+"""
+结构感知分割测试：章/条/节号标题识别（表格数值行不是标题）、在条文标题前切分、块所属条文号
+"""
+
+import pytest
+
+from services.text_splitter import chunk_metadata, find_headings, split_chunks
+
+
+def _labels(content, kind="clause"):
+    return find_headings(content)[kind][1]
+
+
+def test_chapter_clause_and_section_headings():
+    content = "第一章 总则\n第1条 为规范设计制定本标准。\n8.2.1 混凝土保护层\n  8.2.2. 钢筋锚固\n"
+    
+    headings = find_headings(content)
+    
+    assert headings["chapter"] == ([0], ["第一章"])
+    assert _labels(content) == ["第1条", "8.2.1", "8.2.2"]
+    # 位置为标题所在行的行首
+    assert headings["clause"][0] == [content.index(line) for line in ("第1条", "8.2.1", "  8.2.2")]
+
+
+@pytest.mark.parametrize("line", [
+    "1.5 m",
+    "3.2 kN/m2",
+    "1.5 米",
+    "2.5 倍",
+    "0.35 0.40 0.45",
+    "150.5 200.5",
+    "12.5\t20.0\t31.5",
+    "1.2.3.4.5 超过四级",
+    "100.1 三位首段",
+    "8.123 三位小节",
+])
+def test_numeric_rows_are_not_headings(line):
+    assert _labels(f"{line}\n") == []
+
+
+@pytest.mark.parametrize("line, label", [
+    ("8.2.1 混凝土保护层", "8.2.1"),
+    ("5.10. 材料", "5.10"),
+    ("10.2.3.4 四级节号", "10.2.3.4"),
+    ("3.1", "3.1"),
+    ("3.1　楼面荷载", "3.1"),
+])
+def test_section_headings(line, label):
+    assert _labels(f"{line}\n") == [label]
+
+
+def test_split_cuts_before_clause_headings():
+    clauses = [f"8.2.{i} " + "混凝土结构构件的设计要求。" * 6 for i in range(1, 6)]
+    content = "第八章 混凝土结构\n" + "\n".join(clauses) + "\n"
+    
+    chunks = split_chunks(content, chunk_size=200, chunk_overlap=50)
+    
+    assert len(chunks) > 1
+    for chunk in chunks[1:]:
+        assert chunk["content"].startswith("8.2.")
+        assert chunk["clause"] == chunk["content"].split(" ", 1)[0]
+    assert all(chunk["chapter"] == "第八章" for chunk in chunks)
+    for chunk in chunks:
+        assert content[chunk["start"]:chunk["end"]] == chunk["content"]
+    # 在条文标题处切分，不重叠，条文都完整保留
+    assert sum(chunk["content"].count("8.2.") for chunk in chunks) == 5
+
+
+def test_table_rows_do_not_become_cut_points():
+    rows = "\n".join(f"{i}.5 {i}.0 {i}.5" for i in range(1, 40))
+    content = "4.1.1 荷载取值见下表：\n" + rows + "\n"
+    
+    chunks = split_chunks(content, chunk_size=120, chunk_overlap=0)
+    
+    assert all(chunk["clause"] == "4.1.1" for chunk in chunks)
+
+
+def test_chunk_metadata_drops_missing_fields():
+    chunk = {"content": "x", "chapter": None, "clause": "8.2.1", "clause_end": "8.2.1"}
+    
+    assert chunk_metadata(chunk) == {"clause": "8.2.1", "clause_end": "8.2.1"}
@@ -0,0 +1,135 @@
+"""
+内存映射向量快照测试：batch()事务只发布一个版本、事务失败时回滚、其他进程发现新版本、旧版本列式元数据的兼容
+"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from services.vector_snapshot import MemmapVectorIndex
+
+
+def _rows(*names):
+    ids = list(names)
+    embeddings = np.eye(4, dtype=np.float32)[:len(ids)]
+    documents = [f"{name}的内容" for name in ids]
+    metadatas = [{"source_file": f"{name}.md"} for name in ids]
+    return ids, embeddings, documents, metadatas
+
+
+def _generations(path):
+    return sorted(name for name in os.listdir(path) if name.startswith("g"))
+
+
+def _query_ids(index, vector=(1, 0, 0, 0), n_results=4):
+    return index.query(np.asarray(vector, dtype=np.float32), n_results)["ids"][0]
+
+
+def test_each_write_publishes_a_generation(tmp_path):
+    index = MemmapVectorIndex(str(tmp_path / "snap"), space="cosine")
+    
+    index.upsert(*_rows("a", "b"))
+    first = index.generation
+    index.delete(["b"])
+    
+    assert index.generation != first
+    assert _query_ids(index) == ["a"]
+    # 只保留当前版本和上一版本
+    assert _generations(index.path) == sorted([first, index.generation])
+
+
+def test_batch_publishes_once(tmp_path):
+    index = MemmapVectorIndex(str(tmp_path / "snap"), space="cosine")
+    index.upsert(*_rows("a"))
+    before = index.generation
+    
+    with index.batch():
+        index.upsert(*_rows("a", "b", "c"))
+        index.update_metadatas(["b"], [{"source_file": "changed.md"}])
+        index.delete(["c"])
+        # 事务内尚未发布
+        assert index.generation == before
+    
+    assert index.generation != before
+    assert len(_generations(index.path)) == 2
+    result = index.query(np.array([0, 1, 0, 0], dtype=np.float32), 1)
+    assert result["ids"][0] == ["b"]
+    assert result["metadatas"][0] == [{"source_file": "changed.md"}]
+
+
+def test_failed_batch_keeps_committed_data(tmp_path):
+    index = MemmapVectorIndex(str(tmp_path / "snap"), space="cosine")
+    index.upsert(*_rows("a", "b"))
+    before = index.generation
+    
+    with pytest.raises(RuntimeError):
+        with index.batch():
+            index.delete(["a"])
+            index.upsert(*_rows("a", "b", "c"))
+            raise RuntimeError("build failed")
+    
+    assert index.generation == before
+    assert sorted(_query_ids(index)) == ["a", "b"]
+    assert _generations(index.path) == [before]
+    # 回滚后仍可正常写入
+    index.upsert(*_rows("a", "b", "c"))
+    assert sorted(_query_ids(index)) == ["a", "b", "c"]
+
+
+def test_failed_first_write_resets_dimension(tmp_path):
+    index = MemmapVectorIndex(str(tmp_path / "snap"), space="cosine")
+    
+    with pytest.raises(RuntimeError):
+        with index.batch():
+            index.upsert(*_rows("a"))
+            raise RuntimeError("build failed")
+    
+    assert index.dimension is None
+    assert len(index) == 0
+    index.upsert(["x"], np.ones((1, 8), dtype=np.float32), ["x"], [{}])
+    assert index.dimension == 8
+
+
+def test_other_process_sees_new_generation(tmp_path):
+    path = str(tmp_path / "snap")
+    writer = MemmapVectorIndex(path, space="cosine")
+    writer.upsert(*_rows("a"))
+    reader = MemmapVectorIndex(path, space="cosine")
+    assert _query_ids(reader) == ["a"]
+    
+    writer.upsert(*_rows("a", "b"))
+    assert sorted(_query_ids(reader)) == ["a", "b"]
+    
+    # 另一方基于最新版本写入，不会覆盖对方的修改
+    reader.delete(["a"])
+    assert _query_ids(writer) == ["b"]
+
+
+def test_legacy_columnar_metadata_is_readable_and_converted(tmp_path):
+    path = tmp_path / "snap"
+    generation = path / "g1"
+    generation.mkdir(parents=True)
+    ids, embeddings, documents, _ = _rows("a", "b")
+    np.save(generation / "vectors.npy", embeddings)
+    np.save(generation / "ids.npy", np.array(ids, dtype=str))
+    MemmapVectorIndex._write_blob(str(generation), "documents.bin", "document_offsets.npy", documents)
+    with open(generation / "metadata.json", "w", encoding="utf-8") as f:
+        json.dump({"source_file": ["a.md", "b.md"], "chapter": ["第一章", None]}, f, ensure_ascii=False)
+    with open(path / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump({"generation": "g1", "count": 2, "dimension": 4}, f)
+    
+    index = MemmapVectorIndex(str(path), space="cosine")
+    result = index.query(np.array([0, 1, 0, 0], dtype=np.float32), 2)
+    
+    assert result["ids"][0] == ["b", "a"]
+    assert result["metadatas"][0] == [{"source_file": "b.md"}, {"source_file": "a.md", "chapter": "第一章"}]
+    
+    index.update_metadatas(["b"], [{"source_file": "b.md", "chapter": "第二章"}])
+    converted = path / index.generation
+    assert (converted / "metadata.bin").exists()
+    assert not (converted / "metadata.json").exists()
+    assert MemmapVectorIndex(str(path), space="cosine").query(
+        np.array([0, 1, 0, 0], dtype=np.float32), 1
+    )["metadatas"][0] == [{"source_file": "b.md", "chapter": "第二章"}]
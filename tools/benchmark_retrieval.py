@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+检索后端基准测试
+对比ChromaDB HNSW检索、NumPy内存精确检索和内存映射快照检索的查询延迟和召回率（以精确检索结果为基准）
+
+用法:
+    # 合成数据（无需网络和API密钥）
+    python tools/benchmark_retrieval.py --size 20000 --queries 200 --top-k 10
+    
+    # 使用现有集合（查询向量取自集合内向量并加入噪声）
+    python tools/benchmark_retrieval.py --collection standards
+    
+    # HNSW参数扫描：不同M / construction_ef / search_ef下的延迟与召回率
+    python tools/benchmark_retrieval.py --hnsw-grid --m 8,16,32 --construction-ef 100,200 --search-ef 10,50,100,200
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+from chromadb.api.client import SharedSystemClient
+from chromadb.config import Settings
+
+from core.config import Config
+from services.vector_index import NumpyVectorIndex
+from services.vector_snapshot import MemmapVectorIndex
+
+
+def make_synthetic_vectors(size: int, dimension: int, clusters: int, seed: int) -> np.ndarray:
+    """生成带簇结构的L2归一化向量，近似真实文档向量的分布"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, size)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((size, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(vectors: np.ndarray, count: int, noise: float, seed: int) -> np.ndarray:
+    """从已有向量中采样并加噪声生成查询向量"""
+    rng = np.random.default_rng(seed + 1)
+    picked = vectors[rng.integers(0, len(vectors), count)]
+    queries = picked + noise * rng.standard_normal(picked.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def summarize_latencies(latencies: List[float]) -> Dict[str, float]:
+    """延迟统计（毫秒）"""
+    values = np.array(latencies) * 1000
+    return {
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99))
+    }
+
+
+def run_benchmark(collection, queries: np.ndarray, top_k: int, snapshot_dir: str) -> Dict[str, Dict[str, float]]:
+    """
+    对同一批查询分别执行Chroma检索、NumPy精确检索和内存映射快照检索
+    
+    Args:
+        collection: ChromaDB集合
+        queries: 查询向量
+        top_k: 返回结果数量
+        snapshot_dir: 临时快照目录
+    
+    Returns:
+        各后端的延迟统计和召回率
+    """
+    index = NumpyVectorIndex()
+    load_start = time.perf_counter()
+    index.load_from_collection(collection)
+    load_seconds = time.perf_counter() - load_start
+    
+    # 导出快照后重新打开，模拟worker进程启动
+    MemmapVectorIndex(snapshot_dir).load_from_collection(collection)
+    open_start = time.perf_counter()
+    snapshot = MemmapVectorIndex(snapshot_dir)
+    open_seconds = time.perf_counter() - open_start
+    
+    chroma_latencies, numpy_latencies, memmap_latencies, recalls = [], [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        chroma_result = collection.query(query_embeddings=[query], n_results=top_k,
+                                         include=['documents', 'metadatas', 'distances'])
+        chroma_latencies.append(time.perf_counter() - start)
+        
+        start = time.perf_counter()
+        exact_result = index.query(query, top_k)
+        numpy_latencies.append(time.perf_counter() - start)
+        
+        start = time.perf_counter()
+        snapshot.query(query, top_k)
+        memmap_latencies.append(time.perf_counter() - start)
+        
+        exact_ids = set(exact_result["ids"][0])
+        if exact_ids:
+            recalls.append(len(exact_ids & set(chroma_result["ids"][0])) / len(exact_ids))
+    
+    return {
+        "chroma_hnsw": {**summarize_latencies(chroma_latencies), "recall": float(np.mean(recalls))},
+        "numpy_exact": {**summarize_latencies(numpy_latencies), "recall": 1.0,
+                        "load_seconds": load_seconds, **index.get_stats()},
+        "memmap_exact": {**summarize_latencies(memmap_latencies), "recall": 1.0,
+                         "load_seconds": open_seconds, **snapshot.get_stats()}
+    }
+
+
+def insert_vectors(collection, vectors: np.ndarray, batch_size: int = 5000):
+    """分批写入向量"""
+    for start in range(0, len(vectors), batch_size):
+        end = min(start + batch_size, len(vectors))
+        collection.add(
+            ids=[f"bench_{i}" for i in range(start, end)],
+            embeddings=vectors[start:end],
+            documents=[f"文档块 {i}" for i in range(start, end)],
+            metadatas=[{"source_file": f"bench_{i % 100}.txt"} for i in range(start, end)]
+        )
+
+
+def open_client(path: str):
+    """打开ChromaDB客户端"""
+    return chromadb.PersistentClient(
+        path=path,
+        settings=Settings(anonymized_telemetry=False, allow_reset=True)
+    )
+
+
+def run_hnsw_sweep(path: str, vectors: np.ndarray, queries: np.ndarray, top_k: int, space: str,
+                   m_values: List[int], construction_ef_values: List[int],
+                   search_ef_values: List[int]) -> List[Dict[str, float]]:
+    """
+    HNSW参数扫描：每组M/construction_ef建一个集合，再逐个调整search_ef测量延迟和召回率
+    
+    Args:
+        path: 临时数据库目录
+        vectors: 文档向量
+        queries: 查询向量
+        top_k: 返回结果数量
+        space: 距离空间
+        m_values: M取值
+        construction_ef_values: construction_ef取值
+        search_ef_values: search_ef取值
+    
+    Returns:
+        每组参数的统计
+    """
+    # 精确检索结果作为召回率基准
+    exact = NumpyVectorIndex()
+    exact.upsert([f"bench_{i}" for i in range(len(vectors))], vectors,
+                 [""] * len(vectors), [{}] * len(vectors))
+    exact_ids = [set(exact.query(query, top_k)["ids"][0]) for query in queries]
+    
+    client = open_client(path)
+    rows = []
+    for m in m_values:
+        for construction_ef in construction_ef_values:
+            name = f"sweep_m{m}_ef{construction_ef}"
+            collection = client.create_collection(name=name, metadata={
+                "hnsw:space": space,
+                "hnsw:M": m,
+                "hnsw:construction_ef": construction_ef,
+                "hnsw:search_ef": search_ef_values[0]
+            })
+            build_start = time.perf_counter()
+            insert_vectors(collection, vectors)
+            build_seconds = time.perf_counter() - build_start
+            
+            for search_ef in search_ef_values:
+                # ef_search在索引加载时读取：修改后清空客户端缓存并重新打开，使新值生效
+                collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+                SharedSystemClient.clear_system_cache()
+                client = open_client(path)
+                collection = client.get_collection(name=name)
+                # 预热：首次查询会加载索引
+                collection.query(query_embeddings=[queries[0]], n_results=top_k, include=[])
+                
+                latencies, recalls = [], []
+                for query, expected in zip(queries, exact_ids):
+                    start = time.perf_counter()
+                    result = collection.query(query_embeddings=[query], n_results=top_k, include=['distances'])
+                    latencies.append(time.perf_counter() - start)
+                    recalls.append(len(expected & set(result["ids"][0])) / len(expected))
+                
+                rows.append({
+                    "M": m,
+                    "construction_ef": construction_ef,
+                    "search_ef": search_ef,
+                    "build_seconds": build_seconds,
+                    "recall": float(np.mean(recalls)),
+                    **summarize_latencies(latencies)
+                })
+                print(f"   M={m:<4} construction_ef={construction_ef:<5} search_ef={search_ef:<5} "
+                      f"召回率={rows[-1]['recall']:.3f}  P50={rows[-1]['p50_ms']:.2f}ms")
+            client.delete_collection(name=name)
+    return rows
+
+
+def print_sweep_report(rows: List[Dict[str, float]], top_k: int, space: str):
+    """打印HNSW参数扫描结果"""
+    print(f"\n📊 HNSW参数扫描 (space={space}, top_k={top_k})")
+    print(f"{'M':>4}{'构建ef':>8}{'搜索ef':>8}{'构建(s)':>10}{'平均(ms)':>10}{'P95(ms)':>10}{'召回率':>10}")
+    for row in rows:
+        print(f"{row['M']:>4}{row['construction_ef']:>8}{row['search_ef']:>8}{row['build_seconds']:>10.1f}"
+              f"{row['mean_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['recall']:>10.3f}")
+
+
+def parse_int_list(value: str) -> List[int]:
+    """解析逗号分隔的整数列表"""
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def print_report(results: Dict[str, Dict[str, float]], top_k: int):
+    """打印对比结果"""
+    print(f"\n📊 检索基准结果 (top_k={top_k})")
+    print(f"{'后端':<14}{'平均(ms)':>10}{'P50(ms)':>10}{'P95(ms)':>10}{'P99(ms)':>10}{'召回率':>10}")
+    for name, stats in results.items():
+        print(f"{name:<14}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}"
+              f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['recall']:>10.3f}")
+    numpy_stats = results["numpy_exact"]
+    print(f"\n🧮 NumPy索引: {numpy_stats['count']} 个向量，{numpy_stats['memory_mb']} MB，"
+          f"加载耗时 {numpy_stats['load_seconds']:.2f} 秒")
+    memmap_stats = results["memmap_exact"]
+    print(f"💾 内存映射快照: {memmap_stats['memory_mb']} MB（多进程共享页缓存），"
+          f"打开耗时 {memmap_stats['load_seconds'] * 1000:.2f} 毫秒")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="检索后端基准测试")
+    parser.add_argument("--collection", help="使用现有集合（默认生成合成数据）")
+    parser.add_argument("--size", type=int, default=20000, help="合成数据向量数")
+    parser.add_argument("--dimension", type=int, default=1024, help="合成数据向量维度")
+    parser.add_argument("--clusters", type=int, default=200, help="合成数据簇数")
+    parser.add_argument("--queries", type=int, default=200, help="查询数")
+    parser.add_argument("--top-k", type=int, default=10, help="返回结果数量")
+    parser.add_argument("--noise", type=float, default=0.3, help="查询向量噪声强度")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--hnsw-grid", action="store_true", help="扫描HNSW参数（在临时集合中重建索引）")
+    parser.add_argument("--space", default=Config.RETRIEVAL_CONFIG["hnsw"]["space"], help="距离空间: cosine、l2 或 ip")
+    parser.add_argument("--m", default="8,16,32", help="HNSW M取值，逗号分隔")
+    parser.add_argument("--construction-ef", default="100", help="HNSW construction_ef取值，逗号分隔")
+    parser.add_argument("--search-ef", default="10,50,100,200", help="HNSW search_ef取值，逗号分隔")
+    args = parser.parse_args()
+    
+    temp_dir = None
+    snapshot_dir = tempfile.mkdtemp(prefix="retrieval_snapshot_")
+    try:
+        if args.collection:
+            client = open_client(Config.CHROMA_PERSIST_DIRECTORY)
+            collection = client.get_collection(name=args.collection)
+            print(f"📚 使用现有集合: {args.collection} ({collection.count()} 个向量)")
+            sample = collection.get(include=['embeddings'], limit=min(collection.count(), 5000))
+            base_vectors = np.asarray(sample['embeddings'], dtype=np.float32)
+            base_vectors /= np.linalg.norm(base_vectors, axis=1, keepdims=True)
+        else:
+            temp_dir = tempfile.mkdtemp(prefix="retrieval_bench_")
+            client = open_client(temp_dir)
+            print(f"🔧 生成合成数据: {args.size} 个 {args.dimension} 维向量")
+            base_vectors = make_synthetic_vectors(args.size, args.dimension, args.clusters, args.seed)
+        
+        queries = make_queries(base_vectors, args.queries, args.noise, args.seed)
+        
+        if args.hnsw_grid:
+            # 参数扫描在临时目录中重建索引，不修改现有集合
+            if temp_dir is None:
+                temp_dir = tempfile.mkdtemp(prefix="retrieval_bench_")
+            rows = run_hnsw_sweep(temp_dir, base_vectors, queries, args.top_k, args.space,
+                                  parse_int_list(args.m), parse_int_list(args.construction_ef),
+                                  parse_int_list(args.search_ef))
+            print_sweep_report(rows, args.top_k, args.space)
+            return
+        
+        if not args.collection:
+            collection = client.create_collection(name="benchmark", metadata={"hnsw:space": args.space})
+            insert_start = time.perf_counter()
+            insert_vectors(collection, base_vectors)
+            print(f"   写入Chroma耗时 {time.perf_counter() - insert_start:.1f} 秒")
+        results = run_benchmark(collection, queries, args.top_k, snapshot_dir)
+        print_report(results, args.top_k)
+    
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
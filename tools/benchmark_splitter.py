@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+文档分割基准测试
+在regulations目录的全部文档上对比旧版分割（逐字符回扫句号/换行 + 按条文/章节的多遍正则分割）
+与结构感知单遍分割的耗时、块数量、块长度分布和条文对齐情况
+
+用法:
+    python tools/benchmark_splitter.py
+    python tools/benchmark_splitter.py --dir ./regulations --chunk-size 600 --chunk-overlap 150 --repeat 5
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.text_splitter import split_chunks
+
+# 块开头是否为条文/章节标题
+_HEADING_START_PATTERN = re.compile(r"^(?:第[〇零一二三四五六七八九十百千万两\d]+[条章节]|\d{1,3}(?:\.\d{1,3}){1,3})")
+
+
+def legacy_split_document(content: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """旧版BigModelKnowledgeBase.split_document（对照用）"""
+    if len(content) <= chunk_size:
+        return [content]
+    
+    chunks = []
+    start = 0
+    while start < len(content):
+        end = start + chunk_size
+        if end < len(content):
+            for i in range(end, start + chunk_size - 100, -1):
+                if content[i] in '。\n':
+                    end = i + 1
+                    break
+        
+        chunk = content[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        
+        start = end - chunk_overlap
+        if start >= len(content):
+            break
+    return chunks
+
+
+def legacy_split_regulation(content: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """旧版法规构建工具的分割：先按条文、再按各级章节标记多遍正则分割，都不适用时退回定长分割（对照用）"""
+    article_pattern = r'第[一二三四五六七八九十百千万\d]+条[：\s]'
+    articles = re.split(article_pattern, content)
+    if len(articles) > 1:
+        matches = re.findall(article_pattern, content)
+        chunks = [
+            matches[i] + article.strip()
+            for i, article in enumerate(articles[1:])
+            if i < len(matches) and len(matches[i] + article.strip()) > 50
+        ]
+        return chunks
+    
+    for pattern in [r'\d+\.\d+\s+[^\r\n]+', r'第[一二三四五六七八九十]+章[：\s]', r'\d+\s+[^\r\n]+(?=\n)']:
+        sections = re.split(pattern, content)
+        if len(sections) > 2:
+            matches = re.findall(pattern, content)
+            chunks = [
+                matches[i] + section.strip()
+                for i, section in enumerate(sections[1:])
+                if i < len(matches) and len(matches[i] + section.strip()) > 100
+            ]
+            if chunks:
+                return chunks
+    
+    return legacy_split_document(content, chunk_size, chunk_overlap)
+
+
+def structured_split(content: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """结构感知单遍分割"""
+    return [chunk["content"] for chunk in split_chunks(content, chunk_size, chunk_overlap)]
+
+
+def load_corpus(dir_path: Path) -> Dict[str, str]:
+    """读取目录下全部.txt/.md文档"""
+    corpus = {}
+    for file_path in sorted(list(dir_path.rglob("*.txt")) + list(dir_path.rglob("*.md"))):
+        try:
+            corpus[file_path.name] = file_path.read_text(encoding='utf-8')
+        except UnicodeDecodeError:
+            corpus[file_path.name] = file_path.read_text(encoding='gbk')
+    return corpus
+
+
+def run_splitter(splitter: Callable[[str, int, int], List[str]], corpus: Dict[str, str],
+                 chunk_size: int, chunk_overlap: int, repeat: int) -> Dict[str, float]:
+    """
+    对整个语料重复执行分割，统计耗时和块质量
+    
+    Args:
+        splitter: 分割函数
+        corpus: 文件名 → 内容
+        chunk_size: 块大小
+        chunk_overlap: 重叠大小
+        repeat: 重复次数（取最快一次，减少抖动）
+    
+    Returns:
+        统计结果
+    """
+    timings = []
+    chunks = []
+    for _ in range(repeat):
+        chunks = []
+        begin = time.perf_counter()
+        for content in corpus.values():
+            chunks.extend(splitter(content, chunk_size, chunk_overlap))
+        timings.append(time.perf_counter() - begin)
+    
+    total_chars = sum(len(content) for content in corpus.values())
+    lengths = np.array([len(chunk) for chunk in chunks]) if chunks else np.zeros(1)
+    best = min(timings)
+    return {
+        "total_ms": best * 1000,
+        "chars_per_sec": total_chars / best if best else float("inf"),
+        "chunks": len(chunks),
+        "mean_length": float(lengths.mean()),
+        "p95_length": float(np.percentile(lengths, 95)),
+        "max_length": int(lengths.max()),
+        "over_size": int((lengths > chunk_size).sum()),
+        "heading_aligned": sum(1 for chunk in chunks if _HEADING_START_PATTERN.match(chunk)) / max(len(chunks), 1),
+        "stored_chars": int(lengths.sum()) / max(total_chars, 1)
+    }
+
+
+def print_report(results: Dict[str, Dict[str, float]], corpus: Dict[str, str], chunk_size: int):
+    """打印对比报告"""
+    total_chars = sum(len(content) for content in corpus.values())
+    print(f"\n📊 分割基准（{len(corpus)} 个文件，{total_chars:,} 字符，chunk_size={chunk_size}）")
+    print(f"{'分割方式':<22}{'耗时ms':>10}{'万字符/秒':>12}{'块数':>8}{'平均长度':>10}{'P95长度':>10}"
+          f"{'最大长度':>10}{'超长块':>8}{'条文对齐':>10}{'存储比':>8}")
+    for name, stats in results.items():
+        print(f"{name:<26}{stats['total_ms']:>10.1f}{stats['chars_per_sec'] / 10000:>12.1f}{stats['chunks']:>8}"
+              f"{stats['mean_length']:>12.0f}{stats['p95_length']:>10.0f}{stats['max_length']:>12}"
+              f"{stats['over_size']:>8}{stats['heading_aligned']:>12.1%}{stats['stored_chars']:>9.2f}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="文档分割基准测试")
+    parser.add_argument("--dir", default="./regulations", help="语料目录")
+    parser.add_argument("--chunk-size", type=int, default=600, help="块大小")
+    parser.add_argument("--chunk-overlap", type=int, default=150, help="重叠大小")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数")
+    args = parser.parse_args()
+    
+    dir_path = Path(args.dir)
+    if not dir_path.is_dir():
+        print(f"❌ 目录不存在: {dir_path}")
+        return
+    
+    corpus = load_corpus(dir_path)
+    if not corpus:
+        print(f"❌ 目录中没有.txt/.md文档: {dir_path}")
+        return
+    
+    splitters = {
+        "legacy_split_document": legacy_split_document,
+        "legacy_regulation_split": legacy_split_regulation,
+        "structured_split": structured_split
+    }
+    results = {
+        name: run_splitter(splitter, corpus, args.chunk_size, args.chunk_overlap, args.repeat)
+        for name, splitter in splitters.items()
+    }
+    print_report(results, corpus, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
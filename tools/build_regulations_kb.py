@@ -14,8 +14,9 @@ from typing import List, Dict, Any
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from services.bigmodel_knowledge_base import BigModelKnowledgeBase
+from services.knowledge_base_registry import get_knowledge_base_registry
 from core.config import Config
+from services.text_splitter import chunk_metadata
 
 class RegulationsKnowledgeBuilder:
     """法规知识库构建器"""
@@ -26,15 +27,17 @@ class RegulationsKnowledgeBuilder:
         self.api_key = api_key or self.config.bigmodel_api_key
         self.collection_name = "regulations"  # 法规库集合名
         
-        if not self.api_key:
+        if not self.api_key and self.config.EMBEDDING_BACKEND == "bigmodel":
             raise ValueError("请设置BigModel API密钥")
         
-        # 初始化知识库
-        self.kb = BigModelKnowledgeBase(self.api_key, self.collection_name)
+        # 初始化知识库（按别名解析到当前版本集合）
+        self.registry = get_knowledge_base_registry(self.api_key)
+        self.kb = self.registry.get(self.collection_name)
         
         print(f"🏛️ 法规知识库构建器初始化成功")
         print(f"   集合名称: {self.collection_name}")
-        print(f"   API密钥: {self.api_key[:10]}...")
+        if self.api_key:
+            print(f"   API密钥: {self.api_key[:10]}...")
         
         # 法规文档的特殊处理参数
         self.regulation_chunk_size = 600  # 法规条文通常较短，使用较小的块
@@ -77,16 +80,17 @@ class RegulationsKnowledgeBuilder:
         regulation_type = self._identify_regulation_type(content, file_path.name)
         print(f"   法规类型: {regulation_type}")
         
-        # 使用适合的分割策略
-        chunks = self._smart_split_regulation(content, regulation_type)
+        # 结构感知分割：优先在"第X条"/"8.2.1"等条文边界切分，并记录每块所属的章和条文
+        structured_chunks = self.kb.split_document_with_structure(
+            content, self.regulation_chunk_size, self.regulation_chunk_overlap
+        )
+        chunks = [chunk["content"] for chunk in structured_chunks]
         print(f"   智能分割为 {len(chunks)} 个条文块")
         
         # 准备元数据
+        regulation_name = regulation_info.get("name", self._extract_regulation_name(content))
         metadatas = []
-        for i, chunk in enumerate(chunks):
-            # 尝试提取条文编号
-            article_number = self._extract_article_number(chunk)
-            
+        for i, chunk in enumerate(structured_chunks):
             metadata = {
                 "source_file": file_path.name,
                 "file_path": str(file_path),
@@ -94,14 +98,15 @@ class RegulationsKnowledgeBuilder:
                 "chunk_count": len(chunks),
                 "regulation_type": regulation_type,
                 "add_time": datetime.now().isoformat(),
-                "content_length": len(chunk),
+                "content_length": len(chunk["content"]),
                 "document_type": "regulation",
-                "article_number": article_number,
-                "regulation_name": regulation_info.get("name", self._extract_regulation_name(content)),
+                "article_number": chunk["clause"] or "",
+                "regulation_name": regulation_name,
                 "issuing_authority": regulation_info.get("authority", ""),
                 "effective_date": regulation_info.get("effective_date", ""),
                 "regulation_number": regulation_info.get("number", ""),
-                "category": regulation_info.get("category", "法律法规")
+                "category": regulation_info.get("category", "法律法规"),
+                **chunk_metadata(chunk)
             }
             metadatas.append(metadata)
         
@@ -152,90 +157,6 @@ class RegulationsKnowledgeBuilder:
         
         return "其他法规"
     
-    def _smart_split_regulation(self, content: str, regulation_type: str) -> List[str]:
-        """智能分割法规内容"""
-        # 根据法规类型调整分割策略
-        if regulation_type in ["法律", "行政法规"]:
-            return self._split_by_articles(content)
-        elif regulation_type == "技术规范":
-            return self._split_by_sections(content)
-        else:
-            # 默认分割
-            return self.kb.split_document(content, self.regulation_chunk_size, self.regulation_chunk_overlap)
-    
-    def _split_by_articles(self, content: str) -> List[str]:
-        """按条文分割法规"""
-        import re
-        
-        # 查找条文标记
-        article_pattern = r'第[一二三四五六七八九十百千万\d]+条[：\s]'
-        articles = re.split(article_pattern, content)
-        
-        if len(articles) > 1:
-            # 重新组合，保留条文标号
-            matches = re.findall(article_pattern, content)
-            chunks = []
-            
-            for i, article_content in enumerate(articles[1:]):  # 跳过第一个空元素
-                if i < len(matches):
-                    chunk = matches[i] + article_content.strip()
-                    if len(chunk) > 50:  # 过滤太短的内容
-                        chunks.append(chunk)
-            
-            print(f"   按条文分割: {len(chunks)} 条")
-            return chunks
-        
-        # 如果没有找到条文标记，使用默认分割
-        return self.kb.split_document(content, self.regulation_chunk_size, self.regulation_chunk_overlap)
-    
-    def _split_by_sections(self, content: str) -> List[str]:
-        """按章节分割技术规范"""
-        import re
-        
-        # 查找章节标记
-        section_patterns = [
-            r'\d+\.\d+\s+[^\r\n]+',  # 如: 3.1 总则
-            r'第[一二三四五六七八九十]+章[：\s]',  # 如: 第三章
-            r'\d+\s+[^\r\n]+(?=\n)',  # 如: 3 基本规定
-        ]
-        
-        for pattern in section_patterns:
-            sections = re.split(pattern, content)
-            if len(sections) > 2:  # 至少要有3个部分才算有效分割
-                matches = re.findall(pattern, content)
-                chunks = []
-                
-                for i, section_content in enumerate(sections[1:]):
-                    if i < len(matches):
-                        chunk = matches[i] + section_content.strip()
-                        if len(chunk) > 100:  # 过滤太短的内容
-                            chunks.append(chunk)
-                
-                if chunks:
-                    print(f"   按章节分割: {len(chunks)} 节")
-                    return chunks
-        
-        # 如果没有找到章节标记，使用默认分割
-        return self.kb.split_document(content, self.regulation_chunk_size, self.regulation_chunk_overlap)
-    
-    def _extract_article_number(self, content: str) -> str:
-        """提取条文编号"""
-        import re
-        
-        # 查找条文编号
-        patterns = [
-            r'第([一二三四五六七八九十百千万\d]+)条',
-            r'(\d+\.\d+(?:\.\d+)?)',  # 如: 3.1.1
-            r'第([一二三四五六七八九十]+)章',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, content[:100])  # 只在前100字符中查找
-            if match:
-                return match.group(1)
-        
-        return ""
-    
     def _extract_regulation_name(self, content: str) -> str:
         """从内容中提取法规名称"""
         import re
@@ -308,25 +229,27 @@ class RegulationsKnowledgeBuilder:
         total_chunks = 0
         successful_files = 0
         
-        for file_path in files:
-            try:
-                print(f"\n处理法规文件: {file_path.name}")
-                
-                # 根据文件名推断法规信息
-                regulation_info = self._infer_regulation_info(file_path.name)
-                
-                result = self.add_regulation_file(file_path, regulation_info)
-                results.append(result)
-                total_chunks += result["chunks_added"]
-                successful_files += 1
-                
-            except Exception as e:
-                print(f"❌ 处理文件失败: {file_path.name} - {e}")
-                results.append({
-                    "file_path": str(file_path),
-                    "success": False,
-                    "error": str(e)
-                })
+        # 整个目录只更新一次向量快照（memmap后端）
+        with self.kb.batch_writes():
+            for file_path in files:
+                try:
+                    print(f"\n处理法规文件: {file_path.name}")
+                    
+                    # 根据文件名推断法规信息
+                    regulation_info = self._infer_regulation_info(file_path.name)
+                    
+                    result = self.add_regulation_file(file_path, regulation_info)
+                    results.append(result)
+                    total_chunks += result["chunks_added"]
+                    successful_files += 1
+                    
+                except Exception as e:
+                    print(f"❌ 处理文件失败: {file_path.name} - {e}")
+                    results.append({
+                        "file_path": str(file_path),
+                        "success": False,
+                        "error": str(e)
+                    })
         
         summary = {
             "directory": str(dir_path),
@@ -410,11 +333,13 @@ def main():
         # 从配置文件获取API密钥
         config = Config()
         api_key = config.bigmodel_api_key
-        if not api_key:
-            print("❌ 配置文件中未找到BigModel API密钥，请在config.py中设置bigmodel_api_key")
-            return
-        
-        print(f"🔑 使用配置文件中的API密钥: {api_key[:10]}...")
+        if config.EMBEDDING_BACKEND == "bigmodel":
+            if not api_key:
+                print("❌ 配置文件中未找到BigModel API密钥，请在config.py中设置bigmodel_api_key")
+                return
+            print(f"🔑 使用配置文件中的API密钥: {api_key[:10]}...")
+        else:
+            print(f"🔧 使用离线embedding后端: {config.EMBEDDING_BACKEND}")
         
         # 初始化构建器
         builder = RegulationsKnowledgeBuilder(api_key)
@@ -431,16 +356,27 @@ def main():
         current_stats = builder.get_regulations_stats()
         current_count = current_stats.get("total_chunks", 0)
         
+        rebuild = False
         if current_count > 0:
             print(f"📚 当前法规库已有 {current_count} 个文档块")
-            choice = input("是否清空现有数据重新构建？(y/N): ").strip().lower()
-            if choice == 'y':
-                builder.kb.clear_collection()
-                print("🗑️ 已清空现有法规数据")
+            choice = input("是否全量重建（写入新版本集合，完成后切换）？(y/N): ").strip().lower()
+            rebuild = choice == 'y'
         
         # 构建法规库
         print(f"\n🔄 开始构建法规知识库...")
-        result = builder.build_from_directory(regulations_dir, recursive=True)
+        if rebuild:
+            # 蓝绿重建：重建期间旧集合继续服务，冒烟查询通过后原子切换别名
+            build_results = []
+            
+            def build(staging_kb):
+                builder.kb = staging_kb
+                build_results.append(builder.build_from_directory(regulations_dir, recursive=True))
+            
+            builder.registry.rebuild_collection(builder.collection_name, build, smoke_query="工程监理职责")
+            builder.kb = builder.registry.get(builder.collection_name)
+            result = build_results[0]
+        else:
+            result = builder.build_from_directory(regulations_dir, recursive=True)
         
         if result["success"]:
             print(f"\n🎉 法规库构建成功！")
@@ -476,7 +412,7 @@ def main():
                         print(f"   结果{i+1}: 相似度={similarity:.3f}")
                         print(f"   法规: {regulation_name}")
                         if article_number:
-                            print(f"   条文: 第{article_number}条")
+                            print(f"   条文: {article_number}")
                         print(f"   内容: {result['content'][:100]}...")
                 else:
                     print("   未找到相关结果")
@@ -1,72 +1,40 @@
 """
 构建国家标准知识库
 专门处理国家标准库目录下的标准文档，存储到"standards"集合
+
+默认增量同步：只向量化新增/修改的块，删除已消失的块和文件，构建期间索引保持可用；
+使用 --rebuild 全量重建到新版本集合（standards__vN），冒烟查询通过后原子切换别名
 """
 
+import argparse
 import os
 import glob
 import sys
-import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from services.bigmodel_knowledge_base import BigModelKnowledgeBase
+from services.knowledge_base_registry import get_knowledge_base_registry
 from core.config import Config
+from services.text_splitter import chunk_metadata
 
-def main():
-    """主函数：构建国家标准知识库"""
-    print("🏗️ 开始构建国家标准知识库...")
-    print("=" * 60)
-    
-    # 配置
-    config = Config()
-    standards_dir = "./data/国家标准库"
-    collection_name = "standards"  # 专门用于国家标准的集合
-    
-    print(f"📁 标准文档目录: {standards_dir}")
-    print(f"📚 目标集合名称: {collection_name}")
+def ingest_files(kb, txt_files, config, full_build: bool, sync_totals: dict):
+    """
+    切分并写入标准文档
     
-    # 检查目录是否存在
-    if not os.path.exists(standards_dir):
-        print(f"❌ 错误: 目录 {standards_dir} 不存在")
-        return False
-    
-    try:
-        # 初始化知识库管理器（使用standards集合）
-        print(f"\n🔧 初始化知识库管理器...")
-        kb = BigModelKnowledgeBase(
-            api_key=config.bigmodel_api_key,
-            collection_name=collection_name
-        )
-        
-        # 文档处理配置
-        print(f"📄 准备文档处理...")
-        
-        # 获取所有txt文件
-        txt_files = glob.glob(os.path.join(standards_dir, "*.txt"))
-        print(f"\n📋 找到 {len(txt_files)} 个标准文档")
-        
-        if not txt_files:
-            print("❌ 没有找到任何txt文件")
-            return False
-        
-        # 显示文件列表
-        print("\n📄 标准文档列表:")
-        for i, file_path in enumerate(txt_files, 1):
-            file_name = os.path.basename(file_path)
-            file_size = os.path.getsize(file_path) / 1024  # KB
-            print(f"   {i:2d}. {file_name} ({file_size:.1f}KB)")
-        
-        # 清空现有集合（如果存在）
-        print(f"\n🗑️ 清空现有的 '{collection_name}' 集合...")
-        try:
-            kb.clear_collection()
-        except Exception as e:
-            print(f"   注意: {e}")
-        
-        # 处理每个文档
-        total_chunks = 0
-        successful_files = 0
+    Args:
+        kb: 目标知识库
+        txt_files: 标准文档路径列表
+        config: 配置
+        full_build: True时全量写入（用于新的暂存集合），False时按块增量同步
+        sync_totals: 增量同步统计（原地累加）
         
+    Returns:
+        (总文档块数, 成功处理的文件数)
+    """
+    total_chunks = 0
+    successful_files = 0
+    
+    # 整个构建只更新一次向量快照（memmap后端）
+    with kb.batch_writes():
         for i, file_path in enumerate(txt_files, 1):
             file_name = os.path.basename(file_path)
             print(f"\n📖 处理文件 {i}/{len(txt_files)}: {file_name}")
@@ -83,17 +51,18 @@ def main():
                 print(f"   📝 文档长度: {len(content)} 字符")
                 
                 # 分割文档
-                chunks = kb.split_document(
+                structured_chunks = kb.split_document_with_structure(
                     content, 
                     chunk_size=config.DOCUMENT_CONFIG["chunk_size"],
                     chunk_overlap=config.DOCUMENT_CONFIG["chunk_overlap"]
                 )
+                chunks = [chunk["content"] for chunk in structured_chunks]
                 
                 print(f"   ✂️ 分割为 {len(chunks)} 个块")
                 
                 # 准备元数据
                 metadatas = []
-                for j, chunk in enumerate(chunks):
+                for j, (chunk, structure) in enumerate(zip(chunks, structured_chunks)):
                     # 从文件名提取标准信息
                     standard_number = file_name.replace('.txt', '').replace('+', ' ')
                     
@@ -104,21 +73,107 @@ def main():
                         "chunk_index": j,
                         "chunk_count": len(chunks),
                         "file_size": len(content),
-                        "content_preview": chunk[:100] + "..." if len(chunk) > 100 else chunk
+                        "content_preview": chunk[:100] + "..." if len(chunk) > 100 else chunk,
+                        **chunk_metadata(structure)
                     }
                     metadatas.append(metadata)
                 
-                # 批量添加到知识库
-                print(f"   🔄 添加到知识库...")
-                doc_ids = kb.add_documents_batch(chunks, metadatas)
+                if full_build:
+                    # 批量添加到知识库
+                    print(f"   🔄 添加到知识库...")
+                    doc_ids = kb.add_documents_batch(chunks, metadatas)
+                    print(f"   ✅ 成功添加 {len(doc_ids)} 个文档块")
+                else:
+                    # 只写入新增块、删除消失的块
+                    stats = kb.sync_source(file_name, chunks, metadatas)
+                    for key in sync_totals:
+                        sync_totals[key] += stats[key]
                 
-                print(f"   ✅ 成功添加 {len(doc_ids)} 个文档块")
                 total_chunks += len(chunks)
                 successful_files += 1
                 
             except Exception as e:
                 print(f"   ❌ 处理文件失败: {e}")
                 continue
+    
+    return total_chunks, successful_files
+
+def main(rebuild: bool = False):
+    """
+    主函数：构建国家标准知识库
+    
+    Args:
+        rebuild: 是否蓝绿全量重建（默认增量同步）
+    """
+    print("🏗️ 开始构建国家标准知识库...")
+    print("=" * 60)
+    
+    # 配置
+    config = Config()
+    standards_dir = "./data/国家标准库"
+    collection_name = "standards"  # 专门用于国家标准的集合
+    
+    print(f"📁 标准文档目录: {standards_dir}")
+    print(f"📚 目标集合名称: {collection_name}")
+    
+    # 检查目录是否存在
+    if not os.path.exists(standards_dir):
+        print(f"❌ 错误: 目录 {standards_dir} 不存在")
+        return False
+    
+    try:
+        # 初始化知识库管理器（使用standards集合）
+        print(f"\n🔧 初始化知识库管理器...")
+        registry = get_knowledge_base_registry(config.bigmodel_api_key)
+        kb = registry.get(collection_name)
+        
+        # 文档处理配置
+        print(f"📄 准备文档处理...")
+        
+        # 获取所有txt文件
+        txt_files = glob.glob(os.path.join(standards_dir, "*.txt"))
+        print(f"\n📋 找到 {len(txt_files)} 个标准文档")
+        
+        if not txt_files:
+            print("❌ 没有找到任何txt文件")
+            return False
+        
+        # 显示文件列表
+        print("\n📄 标准文档列表:")
+        for i, file_path in enumerate(txt_files, 1):
+            file_name = os.path.basename(file_path)
+            file_size = os.path.getsize(file_path) / 1024  # KB
+            print(f"   {i:2d}. {file_name} ({file_size:.1f}KB)")
+        
+        if rebuild:
+            print(f"\n🟦 蓝绿重建 '{collection_name}'（写入新版本集合后切换，重建期间旧集合继续服务）")
+        else:
+            print(f"\n🔁 增量同步 '{collection_name}' 集合（只处理变化的文档块）")
+        
+        # 处理每个文档
+        sync_totals = {"added": 0, "removed": 0, "unchanged": 0}
+        ingest_result = {}
+        
+        if rebuild:
+            # 蓝绿重建：写入新版本集合，冒烟查询通过后原子切换别名，线上查询不受影响
+            def build(staging_kb):
+                ingest_result["counts"] = ingest_files(staging_kb, txt_files, config, True, sync_totals)
+            
+            registry.rebuild_collection(collection_name, build, smoke_query="混凝土外加剂")
+            kb = registry.get(collection_name)
+        else:
+            ingest_result["counts"] = ingest_files(kb, txt_files, config, False, sync_totals)
+        
+        total_chunks, successful_files = ingest_result["counts"]
+        
+        # 删除目录中已不存在的标准文档
+        if not rebuild:
+            current_files = {os.path.basename(file_path) for file_path in txt_files}
+            with kb.batch_writes():
+                for source_file in kb.list_sources():
+                    if source_file not in current_files:
+                        print(f"\n🗑️ 文件已删除，移除其文档块: {source_file}")
+                        sync_totals["removed"] += kb.remove_documents_by_source(source_file)
         
         # 显示最终统计
         print(f"\n" + "=" * 60)
@@ -126,6 +181,8 @@ def main():
         print(f"📊 处理统计:")
         print(f"   - 成功处理文件: {successful_files}/{len(txt_files)}")
         print(f"   - 总文档块数: {total_chunks}")
+        if not rebuild:
+            print(f"   - 新增块: {sync_totals['added']}，删除块: {sync_totals['removed']}，未变化块: {sync_totals['unchanged']}")
         
         # 获取集合信息
         info = kb.get_collection_info()
@@ -135,6 +192,10 @@ def main():
         print(f"   - 向量模型: {info['embedding_model']}")
         print(f"   - 向量维度: {info['embedding_dimension']}")
         
+        cache_stats = kb.embedding_service.get_cache_stats()
+        if cache_stats:
+            print(f"   - 向量缓存: 命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']} (命中率 {cache_stats['hit_rate']:.1%})")
+        
         # 测试搜索功能
         print(f"\n🧪 测试搜索功能...")
         test_queries = [
@@ -177,20 +238,21 @@ def get_standards_collection_info():
     """获取标准知识库信息"""
     try:
         config = Config()
-        kb = BigModelKnowledgeBase(
-            api_key=config.bigmodel_api_key,
-            collection_name="standards"
-        )
+        kb = get_knowledge_base_registry(config.bigmodel_api_key).get("standards")
         return kb.get_collection_info()
     except Exception as e:
         print(f"获取信息失败: {e}")
         return None
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="构建国家标准知识库")
+    parser.add_argument("--rebuild", action="store_true", help="蓝绿重建：写入新版本集合后原子切换（默认增量同步）")
+    args = parser.parse_args()
+    
     print("🏗️ 国家标准知识库构建工具")
     print("=" * 60)
     
-    success = main()
+    success = main(rebuild=args.rebuild)
     
     if success:
         print(f"\n🎯 下一步建议:")
@@ -8,6 +8,7 @@ import os
 import sys
 import argparse
 import json
+from collections import Counter
 from pathlib import Path
 from datetime import datetime
 from typing import List, Dict, Any
@@ -15,8 +16,9 @@ from typing import List, Dict, Any
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from services.bigmodel_knowledge_base import BigModelKnowledgeBase
+from services.knowledge_base_registry import get_knowledge_base_registry
 from core.config import Config
+from services.text_splitter import chunk_metadata
 
 class IncrementalDataManager:
     """增量数据管理器"""
@@ -27,17 +29,19 @@ class IncrementalDataManager:
         self.api_key = api_key or self.config.bigmodel_api_key
         self.collection_name = collection_name or "engineering_knowledge_bigmodel"
         
-        if not self.api_key:
+        if not self.api_key and self.config.EMBEDDING_BACKEND == "bigmodel":
             raise ValueError("请设置BigModel API密钥")
         
         # 初始化知识库
-        self.kb = BigModelKnowledgeBase(self.api_key, self.collection_name)
+        self.kb = get_knowledge_base_registry(self.api_key).get(self.collection_name)
         
         print(f"✅ 增量数据管理器初始化成功")
         print(f"   集合名称: {self.collection_name}")
-        print(f"   API密钥: {self.api_key[:10]}...")
+        if self.api_key:
+            print(f"   API密钥: {self.api_key[:10]}...")
     
-    def add_file(self, file_path: str, chunk_size: int = 800, chunk_overlap: int = 100) -> Dict[str, Any]:
+    def add_file(self, file_path: str, chunk_size: int = 800, chunk_overlap: int = 100,
+                 root: str = None, unique_name: bool = True) -> Dict[str, Any]:
         """
         添加单个文件到知识库
         
@@ -45,12 +49,86 @@ class IncrementalDataManager:
             file_path: 文件路径
             chunk_size: 块大小
             chunk_overlap: 重叠大小
+            root: 根目录，来源记为相对于该目录的路径（默认为文件名）
+            unique_name: 本次添加的文件中是否只有这一个同名文件（迁移旧数据时使用）
             
         Returns:
             添加结果
         """
         file_path = Path(file_path)
+        source_file = self._source_name(file_path, root)
+        chunks, metadatas = self._prepare_file_chunks(file_path, chunk_size, chunk_overlap, source_file)
         
+        # 以文件名记录来源的旧数据先迁移到相对路径下，已存在的块不会重复写入
+        self._migrate_basename_source(file_path, source_file, unique_name)
+        
+        # 批量添加
+        print(f"🔄 添加到知识库...")
+        doc_ids = self.kb.add_documents_batch(chunks, metadatas)
+        
+        result = {
+            "file_path": str(file_path),
+            "chunks_added": len(doc_ids),
+            "document_ids": doc_ids,
+            "success": True
+        }
+        
+        print(f"✅ 成功添加文件: {file_path.name}")
+        print(f"   添加了 {len(doc_ids)} 个文档块")
+        
+        return result
+    
+    @staticmethod
+    def _source_name(file_path: Path, root=None) -> str:
+        """
+        文件在知识库中的来源名：相对于根目录的路径（统一为/分隔），未指定根目录时为文件名
+        
+        目录同步以相对路径区分不同子目录下的同名文件。
+        """
+        if root is None:
+            return file_path.name
+        return file_path.resolve().relative_to(Path(root).resolve()).as_posix()
+    
+    def _migrate_basename_source(self, file_path: Path, source_file: str, unique_name: bool = True) -> int:
+        """
+        旧版本以文件名作为来源，改用相对路径后将属于该文件的旧文档块迁移到新的来源名下（复用已有向量）
+        
+        旧块按元数据中的file_path判断归属；没有file_path的旧块只在文件名唯一时迁移。
+        
+        Args:
+            file_path: 文件路径
+            source_file: 新的来源名
+            unique_name: 本次处理的文件中是否只有这一个同名文件
+            
+        Returns:
+            迁移的文档块数
+        """
+        legacy_source = file_path.name
+        if legacy_source == source_file:
+            return 0
+        resolved = file_path.resolve()
+        
+        def belongs(metadata: Dict[str, Any]) -> bool:
+            stored_path = metadata.get("file_path")
+            if stored_path:
+                return Path(stored_path).resolve() == resolved
+            return unique_name
+        
+        return self.kb.rekey_source(legacy_source, source_file, match=belongs)
+    
+    def _prepare_file_chunks(self, file_path: Path, chunk_size: int, chunk_overlap: int, source_file: str = None):
+        """
+        读取并分割文件，生成文档块和元数据
+        
+        Args:
+            file_path: 文件路径
+            chunk_size: 块大小
+            chunk_overlap: 重叠大小
+            source_file: 来源名，默认为文件名
+            
+        Returns:
+            (文档块列表, 元数据列表)
+        """
         if not file_path.exists():
             raise FileNotFoundError(f"文件不存在: {file_path}")
         
@@ -73,38 +151,141 @@ class IncrementalDataManager:
         print(f"   文件大小: {len(content):,} 字符")
         
         # 分割文档
-        chunks = self.kb.split_document(content, chunk_size, chunk_overlap)
+        structured_chunks = self.kb.split_document_with_structure(content, chunk_size, chunk_overlap)
+        chunks = [chunk["content"] for chunk in structured_chunks]
         print(f"   分割为 {len(chunks)} 个块")
         
         # 准备元数据
         metadatas = []
-        for i, chunk in enumerate(chunks):
+        for i, chunk in enumerate(structured_chunks):
             metadata = {
-                "source_file": file_path.name,
+                "source_file": source_file or file_path.name,
                 "file_path": str(file_path),
                 "chunk_index": i,
                 "chunk_count": len(chunks),
                 "add_time": datetime.now().isoformat(),
-                "content_length": len(chunk),
-                "file_size": len(content)
+                "content_length": len(chunk["content"]),
+                "file_size": len(content),
+                **chunk_metadata(chunk)
             }
             metadatas.append(metadata)
         
-        # 批量添加
-        print(f"🔄 添加到知识库...")
-        doc_ids = self.kb.add_documents_batch(chunks, metadatas)
+        return chunks, metadatas
+    
+    def _find_files(self, dir_path: Path, recursive: bool) -> List[Path]:
+        """查找目录中支持的文件"""
+        supported_types = ['.txt', '.md']
+        files = []
         
-        result = {
+        if recursive:
+            for ext in supported_types:
+                files.extend(dir_path.rglob(f"*{ext}"))
+        else:
+            for ext in supported_types:
+                files.extend(dir_path.glob(f"*{ext}"))
+        
+        return files
+    
+    def sync_file(self, file_path: str, chunk_size: int = 800, chunk_overlap: int = 100,
+                  root: str = None, unique_name: bool = True) -> Dict[str, Any]:
+        """
+        增量同步文件：只向量化新增的块，只删除已消失的块
+        
+        Args:
+            file_path: 文件路径
+            chunk_size: 块大小
+            chunk_overlap: 重叠大小
+            root: 同步根目录，来源记为相对于该目录的路径（默认为文件名）
+            unique_name: 本次同步的文件中是否只有这一个同名文件（迁移旧数据时使用）
+            
+        Returns:
+            同步结果
+        """
+        file_path = Path(file_path)
+        source_file = self._source_name(file_path, root)
+        chunks, metadatas = self._prepare_file_chunks(file_path, chunk_size, chunk_overlap, source_file)
+        
+        self._migrate_basename_source(file_path, source_file, unique_name)
+        stats = self.kb.sync_source(source_file, chunks, metadatas)
+        
+        return {
             "file_path": str(file_path),
-            "chunks_added": len(doc_ids),
-            "document_ids": doc_ids,
-            "success": True
+            "source_file": source_file,
+            "operation": "sync",
+            "success": True,
+            **stats
         }
+    
+    def sync_directory(self, dir_path: str, recursive: bool = True,
+                       chunk_size: int = 800, chunk_overlap: int = 100,
+                       prune: bool = False) -> Dict[str, Any]:
+        """
+        增量同步目录中的所有文件
         
-        print(f"✅ 成功添加文件: {file_path.name}")
-        print(f"   添加了 {len(doc_ids)} 个文档块")
+        Args:
+            dir_path: 目录路径
+            recursive: 是否递归处理子目录
+            chunk_size: 块大小
+            chunk_overlap: 重叠大小
+            prune: 是否删除集合中存在、但目录中已没有对应文件的来源
+            
+        Returns:
+            同步结果
+        """
+        dir_path = Path(dir_path)
         
-        return result
+        if not dir_path.exists() or not dir_path.is_dir():
+            raise ValueError(f"目录不存在或不是目录: {dir_path}")
+        
+        print(f"📁 同步目录: {dir_path}")
+        files = self._find_files(dir_path, recursive)
+        print(f"   找到 {len(files)} 个支持的文件")
+        
+        results = []
+        totals = {"added": 0, "removed": 0, "unchanged": 0}
+        name_counts = Counter(file_path.name for file_path in files)
+        
+        # 整个目录只更新一次向量快照（memmap后端）
+        with self.kb.batch_writes():
+            for file_path in files:
+                try:
+                    result = self.sync_file(file_path, chunk_size, chunk_overlap, root=dir_path,
+                                            unique_name=name_counts[file_path.name] == 1)
+                    for key in totals:
+                        totals[key] += result[key]
+                    results.append(result)
+                except Exception as e:
+                    print(f"❌ 同步文件失败: {file_path.name} - {e}")
+                    results.append({
+                        "file_path": str(file_path),
+                        "success": False,
+                        "error": str(e)
+                    })
+        
+        pruned_sources = []
+        if prune:
+            current_names = {self._source_name(file_path, dir_path) for file_path in files}
+            with self.kb.batch_writes():
+                for source_file in self.kb.list_sources():
+                    if source_file not in current_names:
+                        totals["removed"] += self.kb.remove_documents_by_source(source_file)
+                        pruned_sources.append(source_file)
+        
+        summary = {
+            "directory": str(dir_path),
+            "total_files": len(files),
+            "pruned_sources": pruned_sources,
+            "results": results,
+            "success": all(result["success"] for result in results),
+            **totals
+        }
+        
+        print(f"\n📊 目录同步完成:")
+        print(f"   新增块: {totals['added']}，删除块: {totals['removed']}，未变化块: {totals['unchanged']}")
+        if pruned_sources:
+            print(f"   移除已删除文件: {len(pruned_sources)} 个")
+        
+        return summary
     
     def add_directory(self, dir_path: str, recursive: bool = True, 
                      chunk_size: int = 800, chunk_overlap: int = 100) -> Dict[str, Any]:
@@ -128,15 +309,7 @@ class IncrementalDataManager:
         print(f"📁 处理目录: {dir_path}")
         
         # 查找支持的文件
-        supported_types = ['.txt', '.md']
-        files = []
-        
-        if recursive:
-            for ext in supported_types:
-                files.extend(dir_path.rglob(f"*{ext}"))
-        else:
-            for ext in supported_types:
-                files.extend(dir_path.glob(f"*{ext}"))
+        files = self._find_files(dir_path, recursive)
         
         print(f"   找到 {len(files)} 个支持的文件")
         
@@ -146,22 +319,26 @@ class IncrementalDataManager:
         results = []
         total_chunks = 0
         successful_files = 0
-        
-        for file_path in files:
-            try:
-                print(f"\n处理文件: {file_path.name}")
-                result = self.add_file(file_path, chunk_size, chunk_overlap)
-                results.append(result)
-                total_chunks += result["chunks_added"]
-                successful_files += 1
-                
-            except Exception as e:
-                print(f"❌ 处理文件失败: {file_path.name} - {e}")
-                results.append({
-                    "file_path": str(file_path),
-                    "success": False,
-                    "error": str(e)
-                })
+        name_counts = Counter(file_path.name for file_path in files)
+        
+        # 整个目录只更新一次向量快照（memmap后端）
+        with self.kb.batch_writes():
+            for file_path in files:
+                try:
+                    print(f"\n处理文件: {file_path.name}")
+                    result = self.add_file(file_path, chunk_size, chunk_overlap, root=dir_path,
+                                           unique_name=name_counts[file_path.name] == 1)
+                    results.append(result)
+                    total_chunks += result["chunks_added"]
+                    successful_files += 1
+                    
+                except Exception as e:
+                    print(f"❌ 处理文件失败: {file_path.name} - {e}")
+                    results.append({
+                        "file_path": str(file_path),
+                        "success": False,
+                        "error": str(e)
+                    })
         
         summary = {
             "directory": str(dir_path),
@@ -231,7 +408,8 @@ class IncrementalDataManager:
         
         return result
     
-    def update_file(self, file_path: str, chunk_size: int = 800, chunk_overlap: int = 100) -> Dict[str, Any]:
+    def update_file(self, file_path: str, chunk_size: int = 800, chunk_overlap: int = 100,
+                    root: str = None) -> Dict[str, Any]:
         """
         更新文件（先删除旧版本，再添加新版本）
         
@@ -239,24 +417,26 @@ class IncrementalDataManager:
             file_path: 文件路径
             chunk_size: 块大小
             chunk_overlap: 重叠大小
+            root: 根目录，来源记为相对于该目录的路径（默认为文件名）
             
         Returns:
             更新结果
         """
         file_path = Path(file_path)
-        filename = file_path.name
+        filename = self._source_name(file_path, root)
         
         print(f"🔄 更新文件: {filename}")
         
-        # 先删除现有文档
+        # 先删除现有文档（包括以文件名记录来源的旧数据）
         try:
+            self._migrate_basename_source(file_path, filename)
             removed_count = self.kb.remove_documents_by_source(filename)
             print(f"   删除了 {removed_count} 个旧文档块")
         except Exception as e:
             print(f"   删除旧文档时出现警告: {e}")
         
         # 添加新文档
-        result = self.add_file(file_path, chunk_size, chunk_overlap)
+        result = self.add_file(file_path, chunk_size, chunk_overlap, root)
         result["removed_count"] = removed_count if 'removed_count' in locals() else 0
         result["operation"] = "update"
         
@@ -300,6 +480,14 @@ class IncrementalDataManager:
                 "error": str(e)
             }
     
+    def migrate_ids(self) -> Dict[str, Any]:
+        """将集合中旧版本hash()生成的块ID一次性迁移为sha256块ID（复用已有向量）"""
+        print(f"🔀 检查旧块ID: {self.collection_name}")
+        with self.kb.batch_writes():
+            migrated = self.kb.migrate_legacy_ids()
+        print(f"✅ 迁移了 {migrated} 个文档块")
+        return {"collection_name": self.collection_name, "migrated": migrated, "success": True}
+    
     def get_stats(self) -> Dict[str, Any]:
         """获取知识库统计信息"""
         return self.kb.get_knowledge_base_stats()
@@ -325,19 +513,22 @@ def main():
     parser = argparse.ArgumentParser(description="增量添加向量数据工具")
     parser.add_argument("action", choices=[
         "add-file", "add-dir", "add-text", "update-file", 
-        "remove-file", "stats", "search"
+        "sync-file", "sync-dir", "remove-file", "migrate-ids", "stats", "search"
     ], help="操作类型")
     
     parser.add_argument("--path", help="文件或目录路径")
     parser.add_argument("--text", help="要添加的文本内容")
     parser.add_argument("--title", default="手动添加", help="文本标题")
-    parser.add_argument("--filename", help="文件名（用于删除）")
+    parser.add_argument("--filename", help="来源名（用于删除，使用--root添加的文件为相对路径）")
+    parser.add_argument("--root", help="根目录：add-file/update-file/sync-file的来源记为相对于该目录的路径，"
+                                       "与add-dir/sync-dir保持一致")
     parser.add_argument("--query", help="搜索查询")
     
     parser.add_argument("--collection", default="engineering_knowledge_bigmodel", help="集合名称")
     parser.add_argument("--chunk-size", type=int, default=800, help="块大小")
     parser.add_argument("--chunk-overlap", type=int, default=100, help="重叠大小")
     parser.add_argument("--recursive", action="store_true", help="递归处理子目录")
+    parser.add_argument("--prune", action="store_true", help="sync-dir时删除目录中已不存在的文件对应的文档")
     parser.add_argument("--top-k", type=int, default=5, help="搜索返回结果数量")
     
     args = parser.parse_args()
@@ -351,7 +542,7 @@ def main():
             if not args.path:
                 print("❌ 请使用 --path 指定文件路径")
                 sys.exit(1)
-            result = manager.add_file(args.path, args.chunk_size, args.chunk_overlap)
+            result = manager.add_file(args.path, args.chunk_size, args.chunk_overlap, args.root)
             
         elif args.action == "add-dir":
             if not args.path:
@@ -369,7 +560,20 @@ def main():
             if not args.path:
                 print("❌ 请使用 --path 指定文件路径")
                 sys.exit(1)
-            result = manager.update_file(args.path, args.chunk_size, args.chunk_overlap)
+            result = manager.update_file(args.path, args.chunk_size, args.chunk_overlap, args.root)
+            
+        elif args.action == "sync-file":
+            if not args.path:
+                print("❌ 请使用 --path 指定文件路径")
+                sys.exit(1)
+            result = manager.sync_file(args.path, args.chunk_size, args.chunk_overlap, args.root)
+            
+        elif args.action == "sync-dir":
+            if not args.path:
+                print("❌ 请使用 --path 指定目录路径")
+                sys.exit(1)
+            result = manager.sync_directory(args.path, args.recursive, args.chunk_size,
+                                            args.chunk_overlap, prune=args.prune)
             
         elif args.action == "remove-file":
             if not args.filename:
@@ -377,6 +581,9 @@ def main():
                 sys.exit(1)
             result = manager.remove_file(args.filename)
             
+        elif args.action == "migrate-ids":
+            result = manager.migrate_ids()
+            
         elif args.action == "stats":
             result = manager.get_stats()
             print(f"\n📊 知识库统计:")